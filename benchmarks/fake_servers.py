@@ -0,0 +1,351 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+REPO_PATH = re.compile(r"^/repos/([^/]+)/([^/]+)$")
+PULL_PATH = re.compile(r"^/repos/([^/]+)/([^/]+)/pulls/(\d+)(/files|/commits|/reviews)?$")
+PER_PAGE = 30
+# Files per page of a GraphQL connection; the analyzer asks for the maximum
+GRAPHQL_PAGE_SIZE = 100
+# GitHub refuses a PR's .diff with 406 past this many files
+DIFF_FILE_LIMIT = 300
+# Primary rate limit per token and resource, and how long each window lasts (seconds), as on github.com
+RATE_LIMIT = 5000
+RATE_LIMIT_WINDOW = 3600
+CHANGE_TYPES = {"added": "ADDED", "removed": "DELETED", "modified": "MODIFIED", "renamed": "RENAMED",
+                "copied": "COPIED", "changed": "CHANGED"}
+
+
+def full_diff(files: List[Dict[str, Any]]) -> str:
+    """The PR's ``.diff`` as GitHub serves it, from REST-style files."""
+    sections = []
+    for file in files:
+        name = file["filename"]
+        sections.append(f"diff --git a/{name} b/{name}")
+        if file.get("patch") is None:
+            sections.append(f"Binary files a/{name} and b/{name} differ")
+        else:
+            sections.extend([f"--- a/{name}", f"+++ b/{name}", file["patch"]])
+    return "\n".join(sections) + "\n"
+
+
+def _connection(items: List[Any], after: Optional[str]) -> Dict[str, Any]:
+    """One page of a GraphQL connection; cursors are offsets."""
+    start = int(after or 0)
+    end = start + GRAPHQL_PAGE_SIZE
+    return {"pageInfo": {"hasNextPage": end < len(items), "endCursor": str(min(end, len(items)))},
+            "nodes": items[start:end]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real APIs, so client connection pools are exercised
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, status: int, text: str, content_type: str = "text/plain",
+                   headers: Optional[Dict[str, str]] = None) -> None:
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+
+class FakeServer:
+    """Runs a handler on a local port in a daemon thread."""
+
+    handler_class = _Handler
+
+    def __init__(self, port: int = 0):
+        handler = type("BoundHandler", (self.handler_class,), {"server_state": self})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.daemon_threads = True
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def count(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _GitHubHandler(_Handler):
+    def _rate_limit(self, resource: str) -> Optional[Dict[str, str]]:
+        """Charge the request to its token; returns the rate-limit headers, or None once refused."""
+        token = self.headers.get("Authorization", "").split(" ")[-1]
+        status, headers, message = self.server_state.charge(token, resource)
+        if status is None:
+            return headers
+        self._send_json(status, {"message": message}, headers)
+        return None
+
+    def do_GET(self):
+        state: FakeGitHub = self.server_state
+        state.count()
+        headers = self._rate_limit("core")
+        if headers is None:
+            return
+        url = urlparse(self.path)
+        repo = REPO_PATH.match(url.path)
+        if repo and any(name == f"{repo.group(1)}/{repo.group(2)}" for name, _ in state.prs):
+            # PyGithub looks the repository up before the PR
+            self._send_json(200, {"full_name": f"{repo.group(1)}/{repo.group(2)}", "url": f"{state.url}{url.path}"},
+                            headers)
+            return
+        match = PULL_PATH.match(url.path)
+        pr = state.prs.get((f"{match.group(1)}/{match.group(2)}", int(match.group(3)))) if match else None
+        if pr is None:
+            self._send_json(404, {"message": "Not Found"}, headers)
+            return
+
+        listing = match.group(4)
+        if listing is None and "diff" in self.headers.get("Accept", ""):
+            if len(pr["files"]) > state.diff_file_limit:
+                self._send_json(406, {"message": "Sorry, the diff exceeded the maximum number of files"}, headers)
+                return
+            self._send_text(200, full_diff(pr["files"]), "text/x-diff", headers)
+            return
+        if listing is None:
+            etag = f'"{pr["pull"]["head"]["sha"]}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._send_json(200, {**pr["pull"], "url": f"{state.url}{url.path}"}, {**headers, "ETag": etag})
+            return
+
+        items = pr[listing.lstrip("/")] if listing != "/reviews" else state.reviews
+        query = parse_qs(url.query)
+        per_page = int(query.get("per_page", [PER_PAGE])[0])
+        page = int(query.get("page", [1])[0])
+        last = max(1, -(-len(items) // per_page))
+        if last > 1:
+            headers["Link"] = f'<{state.url}{url.path}?per_page={per_page}&page={last}>; rel="last"'
+        self._send_json(200, items[(page - 1) * per_page:page * per_page], headers)
+
+    def do_POST(self):
+        state: FakeGitHub = self.server_state
+        state.count()
+        graphql = urlparse(self.path).path == "/graphql"
+        body = self._read_json()
+        headers = self._rate_limit("graphql" if graphql else "core")
+        if headers is None:
+            return
+        if graphql:
+            self._graphql(body.get("variables", {}), headers)
+            return
+        match = PULL_PATH.match(urlparse(self.path).path)
+        if not match or match.group(4) != "/reviews":
+            self._send_json(404, {"message": "Not Found"}, headers)
+            return
+        review = {"id": len(state.reviews) + 1, **body}
+        state.reviews.append(review)
+        self._send_json(200, review, headers)
+
+    def _graphql(self, variables: Dict[str, Any], headers: Dict[str, str]) -> None:
+        """Answer the analyzer's pull request query (see ``utils.pr_fetcher.PR_GRAPHQL_QUERY``)."""
+        pr = self.server_state.prs.get((f"{variables.get('owner')}/{variables.get('repo')}", variables.get("number")))
+        if pr is None:
+            self._send_json(200, {"data": {"repository": {"pullRequest": None}}}, headers)
+            return
+        pull = {
+            "title": pr["pull"]["title"],
+            "body": pr["pull"]["body"],
+            "headRefOid": pr["pull"]["head"]["sha"],
+            "baseRefOid": pr["pull"]["base"]["sha"],
+        }
+        if variables.get("withFiles"):
+            pull["files"] = _connection([
+                {"path": file["filename"], "additions": file.get("additions", 0), "deletions": file.get("deletions", 0),
+                 "changeType": CHANGE_TYPES.get(file.get("status"), "MODIFIED")}
+                for file in pr["files"]
+            ], variables.get("filesCursor"))
+        if variables.get("withCommits"):
+            pull["commits"] = _connection(pr["commits"], variables.get("commitsCursor"))
+        self._send_json(200, {"data": {"repository": {"pullRequest": pull}}}, headers)
+
+
+class FakeGitHub(FakeServer):
+    """A local stand-in for the GitHub REST endpoints the analyzer uses.
+
+    Serves PR metadata (with ETags), the PR's ``.diff`` (406 past
+    ``diff_file_limit`` files, as GitHub does), paginated ``/files`` and
+    ``/commits`` listings with ``Link`` headers, the pull request query on
+    ``/graphql``, and records reviews POSTed to ``/reviews``. Point
+    ``GITHUB_API_URL`` at ``url``.
+
+    Every request is charged to its token's ``rate_limit`` for the
+    ``core`` or ``graphql`` resource, which refills every
+    ``rate_limit_window`` seconds; responses carry the ``X-RateLimit-*``
+    headers and an exhausted token gets 403s until its window resets.
+    ``set_remaining`` and ``add_rate_limit_errors`` script primary and
+    secondary rate limits for tests.
+    """
+
+    handler_class = _GitHubHandler
+
+    def __init__(self, port: int = 0, diff_file_limit: int = DIFF_FILE_LIMIT,
+                 rate_limit: int = RATE_LIMIT, rate_limit_window: float = RATE_LIMIT_WINDOW):
+        super().__init__(port)
+        self.diff_file_limit = diff_file_limit
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.prs: Dict[tuple, Dict[str, Any]] = {}
+        self.reviews: List[Dict[str, Any]] = []
+        # Token of every request, in arrival order
+        self.tokens: List[str] = []
+        # (token, resource) -> [remaining, reset epoch]
+        self._budgets: Dict[tuple, List[float]] = {}
+        # Scripted secondary rate limits, answered before any budget is charged
+        self._errors: List[Dict[str, Any]] = []
+
+    def set_remaining(self, token: str, remaining: int, resource: str = "core", reset: Optional[float] = None) -> None:
+        """Set a token's budget left in the current window, which ends at ``reset`` (epoch seconds)."""
+        with self._lock:
+            reset = reset if reset is not None else int(time.time()) + self.rate_limit_window
+            self._budgets[(token, resource)] = [remaining, reset]
+
+    def add_rate_limit_errors(self, count: int = 1, status: int = 403, retry_after: Optional[float] = None,
+                              token: Optional[str] = None) -> None:
+        """Answer the next ``count`` requests (of ``token``, or any) with a secondary rate limit.
+
+        GitHub sends these as 403 or 429, with budget still remaining and
+        sometimes a ``Retry-After`` header.
+        """
+        with self._lock:
+            self._errors.extend({"status": status, "retry_after": retry_after, "token": token} for _ in range(count))
+
+    def charge(self, token: str, resource: str) -> tuple:
+        """Count one request; returns ``(error status or None, headers, error message)``."""
+        now = time.time()
+        with self._lock:
+            self.tokens.append(token)
+            budget = self._budgets.get((token, resource))
+            if budget is None or now >= budget[1]:
+                # Windows end on whole seconds, like the epoch in X-RateLimit-Reset
+                budget = self._budgets[(token, resource)] = [self.rate_limit, int(now) + self.rate_limit_window]
+            error = next((error for error in self._errors if error["token"] in (None, token)), None)
+            status = message = None
+            if error is not None:
+                self._errors.remove(error)
+                status, message = error["status"], "You have exceeded a secondary rate limit."
+            elif budget[0] <= 0:
+                status, message = 403, "API rate limit exceeded."
+            else:
+                budget[0] -= 1
+            headers = {
+                "X-RateLimit-Limit": str(self.rate_limit),
+                "X-RateLimit-Remaining": str(int(budget[0])),
+                "X-RateLimit-Reset": str(int(budget[1])),
+                "X-RateLimit-Resource": resource,
+            }
+            if error is not None and error["retry_after"] is not None:
+                headers["Retry-After"] = str(error["retry_after"])
+            return status, headers, message
+
+    def add_pr(self, repo: str, number: int, pr: Dict[str, Any]) -> str:
+        """Serve a PR built by ``synthetic.synthetic_pr`` and return its web URL."""
+        self.prs[(repo, number)] = pr
+        return f"https://github.com/{repo}/pull/{number}"
+
+
+class _OpenAIHandler(_Handler):
+    def do_POST(self):
+        state: FakeOpenAI = self.server_state
+        state.count()
+        request = self._read_json()
+        prompt_chars = sum(len(message.get("content") or "") for message in request.get("messages", []))
+        prompt_tokens = prompt_chars // 4 + 1
+        time.sleep(state.latency + state.latency_per_1k_tokens * prompt_tokens / 1000)
+
+        content = state.response
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4 + 1,
+            "total_tokens": prompt_tokens + len(content) // 4 + 1,
+        }
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": request.get("model", "gpt-4o")}
+        if not request.get("stream"):
+            self._send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = content.split(" ")
+        events = [
+            {**base, "object": "chat.completion.chunk",
+             "choices": [{"index": 0, "delta": {"content": word + (" " if index < len(words) - 1 else "")}, "finish_reason": None}]}
+            for index, word in enumerate(words)
+        ]
+        events.append({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        for event in events:
+            self._write_chunk(f"data: {json.dumps(event)}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+
+class FakeOpenAI(FakeServer):
+    """A local stand-in for the chat completions API with configurable latency.
+
+    Each request sleeps ``latency`` seconds plus ``latency_per_1k_tokens`` per
+    thousand prompt tokens, then returns ``response`` (streamed if asked).
+    Point ``OPENAI_BASE_URL`` at ``url + "/v1"``.
+    """
+
+    handler_class = _OpenAIHandler
+
+    def __init__(self, port: int = 0, latency: float = 0.0, latency_per_1k_tokens: float = 0.0,
+                 response: str = "### Overall assessment\nLooks good.\n\n### Specific issues found\nNone."):
+        super().__init__(port)
+        self.latency = latency
+        self.latency_per_1k_tokens = latency_per_1k_tokens
+        self.response = response
@@ -0,0 +1,94 @@
+"""Cold-start benchmark for the pr_analyzer CLI.
+
+Usage:
+    python benchmarks/import_time.py                   # fails past the default budget
+    python benchmarks/import_time.py --budget-ms 300 --iterations 10
+    python benchmarks/import_time.py --module app      # time another entry point (no module checks)
+
+Each iteration imports the CLI in a fresh interpreter, the way every
+``python pr_analyzer.py ...`` run does, and reports the median time spent
+importing it. The run fails if that median exceeds --budget-ms, or if
+importing the CLI loads a module it should only load on first use
+(Streamlit never, OpenAI, PyGithub, python-docx and tiktoken lazily). On
+failure the slowest imports are listed from ``python -X importtime``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+DEFAULT_BUDGET_MS = 400.0
+# Modules the CLI must not import at startup
+LAZY_MODULES = ("streamlit", "openai", "httpx", "github", "docx", "tiktoken")
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"import_ms": elapsed * 1000, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure(module: str) -> Dict[str, Any]:
+    """Import ``module`` in a fresh interpreter; returns the import time and the modules it loaded."""
+    output = subprocess.run([sys.executable, "-c", CHILD.format(module=module)], cwd=SRC,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(module: str, top: int) -> List[Tuple[int, str]]:
+    """The ``top`` imports with the largest cumulative time (microseconds), from ``-X importtime``."""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=SRC,
+                            capture_output=True, text=True).stderr
+    entries = []
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            entries.append((int(cumulative), name.strip()))
+    return sorted(entries, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CLI's cold-start import time")
+    parser.add_argument("--module", default="pr_analyzer", help="Entry point module in src/ to import")
+    parser.add_argument("--iterations", type=int, default=5, help="Fresh interpreters to time (after one warm-up)")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Fail if the median import time exceeds this many milliseconds")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports listed on failure")
+    args = parser.parse_args()
+
+    # The warm-up writes bytecode caches, as the first run in a fresh checkout would
+    measure(args.module)
+    runs = [measure(args.module) for _ in range(args.iterations)]
+    times = [run["import_ms"] for run in runs]
+    median = statistics.median(times)
+    print(f"import {args.module}: median {median:.0f} ms, min {min(times):.0f} ms, max {max(times):.0f} ms "
+          f"over {args.iterations} runs (budget {args.budget_ms:.0f} ms)")
+
+    failures = []
+    if median > args.budget_ms:
+        failures.append(f"median import time {median:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+    if args.module == "pr_analyzer":
+        loaded = sorted({name.split(".")[0] for name in runs[-1]["modules"]} & set(LAZY_MODULES))
+        if loaded:
+            failures.append(f"imported at startup: {', '.join(loaded)}")
+    if not failures:
+        return
+
+    print("\nCold start regressed:")
+    for failure in failures:
+        print(f"  {failure}")
+    print("\nSlowest imports (cumulative):")
+    for cumulative, name in slowest_imports(args.module, args.top):
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""Offline end-to-end benchmark of the analyzer against fake GitHub and OpenAI servers.
+
+Usage:
+    python benchmarks/run.py                         # default sizes, compare with baseline.json
+    python benchmarks/run.py --sizes 1 100 5000 --openai-latency 0.5 --no-compare
+    python benchmarks/run.py --save-baseline         # record the current numbers as the baseline
+
+Every run is compared with the committed baseline and exits non-zero on a
+regression, or when there is no baseline recorded with the same fake
+OpenAI latency and analysis mode; pass --no-compare to only report.
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from fake_servers import FakeGitHub, FakeOpenAI
+from synthetic import synthetic_pr
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+DEFAULT_SIZES = (1, 10, 100, 1000, 5000)
+DEFAULT_TOLERANCE = 0.5
+# Timing regressions smaller than this are scheduling noise, whatever the percentage
+NOISE_FLOOR_SECONDS = 0.05
+# Run settings a baseline must share with the run it is compared with
+BASELINE_SETTINGS = ("openai_latency", "openai_latency_per_1k", "analysis_mode")
+STAGES = ("get_pr_data", "parse_diff", "format_side_by_side_diff", "build_prompt", "analyze_pr")
+# Stages whose peak memory is tracked
+MEMORY_STAGES = ("get_pr_data", "parse_diff", "format_side_by_side_diff")
+REPO = "bench/synthetic"
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(percent / 100 * len(ordered))) - 1]
+
+
+def _configure_environment(github_url: str, openai_url: str, cache_dir: str) -> None:
+    """Point the analyzer at the fake servers before any of its modules are imported."""
+    os.environ.update({
+        "GITHUB_TOKEN": "bench-token",
+        "GITHUB_API_URL": github_url,
+        "OPENAI_API_KEY": "bench-key",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "PR_CACHE_DIR": os.path.join(cache_dir, "snapshots"),
+        "LLM_CACHE_PATH": os.path.join(cache_dir, "llm.sqlite3"),
+        "PR_STATE_DIR": os.path.join(cache_dir, "state"),
+        "PR_HISTORY_PATH": os.path.join(cache_dir, "history.sqlite3"),
+    })
+    os.environ.pop("GITHUB_TOKENS", None)
+    sys.path.insert(0, os.path.join(ROOT, "src"))
+
+
+def _stages(pr_url: str, agent) -> Dict[str, Callable[[Dict[str, Any]], Any]]:
+    from pr_analyzer import get_pr_data
+    from utils.diff_parser import parse_diff, parse_files
+    from utils.diff_utils import format_side_by_side_diff
+
+    return {
+        "get_pr_data": lambda _: get_pr_data(pr_url, mode="rest", use_cache=False),
+        "parse_diff": lambda pr_data: sum(1 for _ in parse_diff(pr_data["changes"])),
+        "format_side_by_side_diff": lambda pr_data: len(format_side_by_side_diff(parse_files(pr_data["files"]))),
+        "build_prompt": lambda pr_data: agent._prepare_prompt(pr_data),
+        "analyze_pr": lambda pr_data: agent.analyze_pr(pr_data),
+    }
+
+
+def run_size(github: FakeGitHub, openai: FakeOpenAI, files: int, iterations: int, analysis_mode: str) -> Dict[str, Any]:
+    """Benchmark every stage on a synthetic PR with ``files`` files."""
+    from agent import PRAnalyzerAgent
+
+    pr_url = github.add_pr(REPO, files, synthetic_pr(files, seed=files))
+    agent = PRAnalyzerAgent(use_cache=False, mode=analysis_mode)
+    stages = _stages(pr_url, agent)
+    timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    totals = []
+
+    github_before, openai_before = github.requests, openai.requests
+    for _ in range(iterations):
+        pr_data = None
+        start = time.perf_counter()
+        for stage in STAGES:
+            stage_start = time.perf_counter()
+            result = stages[stage](pr_data)
+            timings[stage].append(time.perf_counter() - stage_start)
+            if stage == "get_pr_data":
+                pr_data = result
+        totals.append(time.perf_counter() - start)
+
+    # Peak memory is measured in a separate pass; tracing skews the timings above
+    peak_memory = {}
+    pr_data = None
+    for stage in MEMORY_STAGES:
+        tracemalloc.start()
+        result = stages[stage](pr_data)
+        peak_memory[stage] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if stage == "get_pr_data":
+            pr_data = result
+
+    return {
+        "files": files,
+        "iterations": iterations,
+        "prs_per_minute": round(iterations / sum(totals) * 60, 2),
+        "stages": {
+            stage: {"min": round(min(values), 4), "p50": round(statistics.median(values), 4),
+                    "p95": round(_percentile(values, 95), 4)}
+            for stage, values in timings.items()
+        },
+        "peak_memory_bytes": peak_memory,
+        "github_requests": (github.requests - github_before) // iterations,
+        "openai_requests": (openai.requests - openai_before) // iterations,
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """List the stage timings and peak memory that regressed past ``tolerance`` against the baseline.
+
+    Timings are compared on each stage's fastest run, which is far less
+    sensitive to scheduling noise than the median of a few iterations.
+    """
+    regressions = []
+    baseline_by_size = {entry["files"]: entry for entry in baseline.get("results", [])}
+    for result in results:
+        before = baseline_by_size.get(result["files"])
+        if before is None:
+            continue
+        checks = [(f"{stage} min", result["stages"][stage]["min"], before["stages"].get(stage, {}).get("min"))
+                  for stage in STAGES]
+        checks += [(f"{stage} peak memory", result["peak_memory_bytes"][stage], before["peak_memory_bytes"].get(stage))
+                   for stage in MEMORY_STAGES]
+        for name, now, then in checks:
+            if not then or now <= then * (1 + tolerance):
+                continue
+            if name.endswith("min") and now - then < NOISE_FLOOR_SECONDS:
+                continue
+            regressions.append(f"{result['files']} files: {name} {then:g} -> {now:g} (+{(now / then - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    header = f"{'files':>6}  {'PRs/min':>8}  " + "  ".join(f"{stage[:14]:>14}" for stage in STAGES) + f"  {'peak MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        stages = "  ".join(
+            f"{result['stages'][stage]['p50']:>6.3f}/{result['stages'][stage]['p95']:<7.3f}" for stage in STAGES
+        )
+        peak = max(result["peak_memory_bytes"].values()) / 1024 / 1024
+        print(f"{result['files']:>6}  {result['prs_per_minute']:>8.1f}  {stages}  {peak:>8.1f}")
+    print("(stage columns are p50/p95 seconds)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PR analyzer offline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="PR sizes in files")
+    parser.add_argument("--iterations", type=int, default=5, help="Runs per size")
+    parser.add_argument("--openai-latency", type=float, default=0.2, help="Seconds each fake completion takes")
+    parser.add_argument("--openai-latency-per-1k", type=float, default=0.0,
+                        help="Extra seconds per 1000 prompt tokens of a fake completion")
+    parser.add_argument("--analysis-mode", default="single", help="single or map_reduce")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown or memory growth before failing (0.5 = 50%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline")
+    parser.add_argument("--no-compare", action="store_true", help="Report the results without comparing them")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir, FakeGitHub() as github, \
+            FakeOpenAI(latency=args.openai_latency, latency_per_1k_tokens=args.openai_latency_per_1k) as openai:
+        _configure_environment(github.url, openai.url, cache_dir)
+        results = []
+        for files in args.sizes:
+            print(f"Benchmarking {files} files...", file=sys.stderr)
+            results.append(run_size(github, openai, files, args.iterations, args.analysis_mode))
+
+    report = {
+        "python": sys.version.split()[0],
+        "openai_latency": args.openai_latency,
+        "openai_latency_per_1k": args.openai_latency_per_1k,
+        "analysis_mode": args.analysis_mode,
+        "results": results,
+    }
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+    if args.no_compare:
+        return
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one, or pass --no-compare")
+        sys.exit(1)
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    mismatched = [name for name in BASELINE_SETTINGS if baseline.get(name, 0.0) != report[name]]
+    if mismatched:
+        print("\nThe baseline was recorded with different settings: "
+              + ", ".join(f"{name}={baseline.get(name, 0.0)} (this run {report[name]})" for name in mismatched)
+              + "; pass --no-compare or record a matching baseline")
+        sys.exit(1)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\nRegressions against the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import random
+from typing import Any, Dict, List
+
+EXTENSIONS = (".py", ".js", ".ts", ".java", ".go")
+STATUSES = ("modified", "modified", "modified", "added", "removed")
+
+
+def _code_line(rng: random.Random, file_index: int, line: int) -> str:
+    name = f"value_{file_index}_{line}"
+    return rng.choice((
+        f"    {name} = compute({line}, factor={rng.randint(1, 99)})",
+        f"    if {name} > {rng.randint(0, 1000)}:",
+        f"        logger.debug(\"{name} is %s\", {name})",
+        f"    return {name}",
+        f"def handler_{file_index}_{line}(request):",
+        "",
+    ))
+
+
+def synthetic_patch(rng: random.Random, file_index: int, hunks: int, hunk_lines: int) -> str:
+    """A unified-diff patch with ``hunks`` hunks of about ``hunk_lines`` lines each."""
+    lines: List[str] = []
+    old_start = new_start = 1
+    for _ in range(hunks):
+        body = []
+        old_count = new_count = 0
+        for line in range(hunk_lines):
+            kind = rng.choices(" +-", weights=(6, 3, 1))[0]
+            body.append(kind + _code_line(rng, file_index, old_start + line))
+            old_count += kind != "+"
+            new_count += kind != "-"
+        lines.append(f"@@ -{old_start},{old_count} +{new_start},{new_count} @@ def section_{file_index}():")
+        lines.extend(body)
+        old_start += old_count + 20
+        new_start += new_count + 20
+    return "\n".join(lines)
+
+
+def synthetic_pr(files: int, hunks_per_file: int = 3, hunk_lines: int = 12, commits: int = 5,
+                 seed: int = 0) -> Dict[str, Any]:
+    """Build a PR shaped like the GitHub REST responses: ``pull``, ``files`` and ``commits``."""
+    rng = random.Random(seed)
+    pr_files = []
+    for index in range(files):
+        patch = synthetic_patch(rng, index, hunks_per_file, hunk_lines)
+        pr_files.append({
+            "filename": f"src/module_{index // 50}/file_{index}{rng.choice(EXTENSIONS)}",
+            "status": rng.choice(STATUSES),
+            "additions": sum(line.startswith("+") for line in patch.split("\n")),
+            "deletions": sum(line.startswith("-") for line in patch.split("\n")),
+            "patch": patch,
+        })
+    return {
+        "pull": {
+            "title": f"Synthetic PR with {files} files",
+            "body": "Generated for benchmarking.",
+            "head": {"sha": f"{seed:08x}{files:032x}"},
+            "base": {"sha": f"{seed + 1:08x}{files:032x}"},
+        },
+        "files": pr_files,
+        "commits": [{"commit": {"message": f"Commit {index}"}} for index in range(commits)],
+    }
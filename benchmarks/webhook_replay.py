@@ -0,0 +1,157 @@
+"""Replay pull_request webhooks against the webhook server, offline.
+
+Usage:
+    python benchmarks/webhook_replay.py                          # simulated pushes to 10 PRs
+    python benchmarks/webhook_replay.py --prs 50 --pushes 5 --workers 4
+    python benchmarks/webhook_replay.py --payloads deliveries/*.json
+    python benchmarks/webhook_replay.py --payloads deliveries/*.json --url http://localhost:8080
+
+By default the webhook service runs in-process against fake GitHub and OpenAI
+servers, so reviews are "posted" to the fake GitHub and counted. With --url
+the signed payloads are sent to an already running server instead
+(GITHUB_WEBHOOK_SECRET must match its secret).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Tuple
+
+from fake_servers import FakeGitHub, FakeOpenAI
+from run import _configure_environment
+from synthetic import synthetic_pr
+
+DEFAULT_SECRET = "replay-secret"
+
+
+def pr_event(action: str, repo: str, number: int, head_sha: str) -> Dict[str, Any]:
+    """A minimal ``pull_request`` payload with the fields the webhook server reads."""
+    return {
+        "action": action,
+        "number": number,
+        "repository": {"full_name": repo},
+        "pull_request": {
+            "number": number,
+            "html_url": f"https://github.com/{repo}/pull/{number}",
+            "state": "open",
+            "head": {"sha": head_sha},
+        },
+    }
+
+
+def simulated_events(prs: int, pushes: int, redeliveries: int) -> List[Dict[str, Any]]:
+    """An "opened" event plus ``pushes`` quick synchronize events per PR, with some deliveries repeated."""
+    events = []
+    for number in range(1, prs + 1):
+        events.append(pr_event("opened", "replay/repo", number, f"{number:08x}{0:032x}"))
+        events.extend(pr_event("synchronize", "replay/repo", number, f"{number:08x}{push:032x}")
+                      for push in range(1, pushes + 1))
+    return events + events[-redeliveries:] if redeliveries else events
+
+
+def post(url: str, secret: str, payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    from webhook import sign
+
+    body = json.dumps(payload).encode("utf-8")
+    request = urllib.request.Request(url, data=body, method="POST", headers={
+        "Content-Type": "application/json",
+        "X-GitHub-Event": "pull_request",
+        "X-Hub-Signature-256": sign(secret, body),
+    })
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def replay_local(events: List[Dict[str, Any]], args) -> Dict[str, Any]:
+    """Run the webhook service in-process against fake servers and replay ``events`` to it."""
+    with tempfile.TemporaryDirectory() as cache_dir, FakeGitHub() as github, \
+            FakeOpenAI(latency=args.openai_latency) as openai:
+        _configure_environment(github.url, openai.url, cache_dir)
+        from agent import PRAnalyzerAgent
+        from pr_analyzer import get_pr_data
+        from utils.github import submit_analysis_review
+        from utils.rate_limit import BATCH
+        from webhook import JobQueue, WebhookService, serve_webhooks
+
+        service = WebhookService(
+            args.secret,
+            lambda url: get_pr_data(url, priority=BATCH),
+            PRAnalyzerAgent(),
+            lambda url, pr_data, results: submit_analysis_review(url, pr_data, results, priority=BATCH),
+            workers=args.workers,
+            queue=JobQueue(debounce=args.debounce),
+        ).start()
+        server = serve_webhooks(service, 0, "127.0.0.1")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+        start = time.perf_counter()
+        replies: Dict[str, int] = {}
+        for event in events:
+            repo, number = event["repository"]["full_name"], event["pull_request"]["number"]
+            pr = github.prs.get((repo, number))
+            if pr is None:
+                github.add_pr(repo, number, synthetic_pr(args.files, seed=number))
+                pr = github.prs[(repo, number)]
+            # The fake PR moves to the pushed head, as GitHub's would
+            pr["pull"]["head"]["sha"] = event["pull_request"]["head"]["sha"]
+            _, reply = post(url, args.secret, event)
+            replies[reply.get("status", "error")] = replies.get(reply.get("status", "error"), 0) + 1
+        drained = service.queue.join(timeout=args.timeout)
+        elapsed = time.perf_counter() - start
+        server.shutdown()
+        server.server_close()
+        service.stop()
+        return {
+            "events": len(events),
+            "replies": replies,
+            "queue": service.queue.snapshot(),
+            "reviews_posted": len(github.reviews),
+            "drained": drained,
+            "elapsed_seconds": round(elapsed, 2),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay pull_request webhooks against the webhook server")
+    parser.add_argument("--payloads", nargs="+", help="Recorded pull_request payload JSON files to replay")
+    parser.add_argument("--url", help="Send to a running webhook server instead of an in-process one")
+    parser.add_argument("--secret", default=os.getenv("GITHUB_WEBHOOK_SECRET", DEFAULT_SECRET))
+    parser.add_argument("--prs", type=int, default=10, help="Simulated PRs (without --payloads)")
+    parser.add_argument("--pushes", type=int, default=3, help="Quick pushes per simulated PR")
+    parser.add_argument("--redeliveries", type=int, default=2, help="Simulated events delivered twice")
+    parser.add_argument("--files", type=int, default=20, help="Files in each fake PR")
+    parser.add_argument("--workers", type=int, default=2, help="Webhook worker threads")
+    parser.add_argument("--debounce", type=float, default=0.5, help="Seconds to wait for more pushes to a PR")
+    parser.add_argument("--openai-latency", type=float, default=0.2, help="Seconds each fake completion takes")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for the queue to drain")
+    args = parser.parse_args()
+
+    if args.payloads:
+        events = []
+        for path in args.payloads:
+            with open(path, "r", encoding="utf-8") as f:
+                events.append(json.load(f))
+    else:
+        events = simulated_events(args.prs, args.pushes, args.redeliveries)
+
+    if args.url:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+        for event in events:
+            status, reply = post(args.url, args.secret, event)
+            print(f"{status} {reply}")
+        return
+
+    print(json.dumps(replay_local(events, args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,222 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
+import copy
 import os
-from openai import OpenAI
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from utils.clients import get_openai_client
+from utils.metrics import metrics
+from utils.llm_cache import get_response_cache, response_cache_key
+from utils.chunking import chunk_files
+from utils.diff_pruning import DiffPruner, format_pruned
+from utils.hunk_dedup import (SHARED_CHANGE_PREFIX, dedupe_hunks, fan_out, fan_out_findings, format_affected_files,
+                              shared_note)
+from utils.findings import (OUTPUT_INSTRUCTIONS, FindingsError, index_by_basename, merge_findings, pack_findings,
+                            parse_findings, render_markdown, repair_prompt, resolve_path, resolve_paths,
+                            summarize_counts, unpack_findings)
+from utils.prompt_budget import PromptBudgeter, count_tokens, prompt_budget, tokenizer_name
+from utils.analysis_state import AnalysisStateStore, pr_state_key
+from utils.history import get_history_store
+from practices_index import PracticesIndex, DEFAULT_TOP_K
 
 load_dotenv()
 
-class PRAnalyzerAgent:
+MODEL = "gpt-4o"
+TEMPERATURE = 0.7
+MAX_TOKENS = 2000
+SYSTEM_MESSAGE = "You are an expert code reviewer analyzing pull requests based on coding best practices. Code changes are provided in git diff format."
+REDUCE_SYSTEM_MESSAGE = "You are an expert code reviewer merging partial reviews of one pull request into a single review."
+STRUCTURED_SYSTEM_MESSAGE = SYSTEM_MESSAGE + " You reply with a JSON object only."
+
+ANALYSIS_MODES = ("single", "map_reduce")
+DEFAULT_CHUNK_TOKENS = 12000
+DEFAULT_MAP_WORKERS = 4
+
+ANALYSIS_PROMPT = """Please analyze this pull request based on the following best practices and provide detailed feedback, also include the best practice from the document that you are using to analyze the PR:
+
+PR Title: {title}
+Description: {description}
+
+Files Changed:
+{files_changed}
+
+Changes:
+{changes}
+{pruned}
+Best Practices to Consider:
+{practices}
+
+Please provide:
+1. Overall assessment
+2. Specific issues found, each citing where it is as `path/to/file:LINE` or `path/to/file:START-END` (line numbers in the new version of the file)
+3. Recommendations for improvement
+4. Code examples for suggested improvements
+"""
+
+CHUNK_PROMPT = """You are reviewing chunk {number} of {total} of a pull request. Other chunks are reviewed separately, so only comment on the files below. Analyze them based on the following best practices and provide detailed feedback, also include the best practice from the document that you are using:
+
+PR Title: {title}
+Description: {description}
+
+Files in this chunk:
+{files_changed}
+
+Changes:
+{changes}
+
+Best Practices to Consider:
+{practices}
+
+Please provide, under a "### File: <path>" heading for each file you comment on (use the shared-change-<n> name for a change shared by several files):
+1. Specific issues found, each citing where it is as `path/to/file:LINE` or `path/to/file:START-END` (line numbers in the new version of the file)
+2. Recommendations for improvement
+3. Code examples for suggested improvements
+"""
+
+REDUCE_PROMPT = """The pull request below was reviewed in {parts} parts. Merge the partial reviews into a single review. Remove duplicates, keep every distinct issue with its `path:line` location and best practice reference, and keep the code examples.
+
+PR Title: {title}
+Description: {description}
+
+Files Changed:
+{files_changed}
+
+Partial Reviews:
+{reviews}
+{pruned}
+Please provide:
+1. Overall assessment
+2. Specific issues found, each with its `path:line` location
+3. Recommendations for improvement
+4. Code examples for suggested improvements
+"""
+
+# Chunk reviews put each file's findings under a "### File: <path>" heading
+FILE_SECTION_PATTERN = re.compile(r"^#{1,6}\s*File:\s*`?([^`\n]+?)`?\s*$", re.MULTILINE)
+
+class TokenUsage:
+    """Prompt and completion tokens the API reported for one run's completions.
+
+    Both are None once a completion came back without usage.
+    """
+
+    __slots__ = ("prompt_tokens", "completion_tokens", "_lock")
+
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, usage) -> None:
+        with self._lock:
+            if usage is None or self.prompt_tokens is None:
+                self.prompt_tokens = self.completion_tokens = None
+            else:
+                self.prompt_tokens += usage.prompt_tokens or 0
+                self.completion_tokens += usage.completion_tokens or 0
+
+
+class PRAnalyzerAgent:
+    def __init__(self, response_cache=None, use_cache: bool = True, mode: str = None,
+                 max_workers: int = None, chunk_tokens: int = None,
+                 practices_index: PracticesIndex = None, practices_k: int = DEFAULT_TOP_K,
+                 pruner: DiffPruner = None, prune: bool = True, prompt_tokens: int = None,
+                 dedupe: bool = True, history=None, record_history: bool = True, structured: bool = None):
+        """
+        Args:
+            response_cache: Object with ``get(key)``/``put(key, response)`` used to
+                reuse completions; defaults to the process-wide tiered cache
+            use_cache: Set to False to always call the model
+            mode: "single" sends the whole PR in one prompt; "map_reduce" reviews
+                chunks of files in parallel and merges the results
+                (default: PR_ANALYSIS_MODE, then "single")
+            max_workers: Concurrent chunk reviews in map_reduce mode
+                (default: PR_ANALYSIS_WORKERS, then 4)
+            chunk_tokens: Approximate token budget for each chunk's diff
+                (default: PR_CHUNK_TOKENS, then 12000)
+            practices_index: Index of best practices; when set, each prompt only
+                includes the ``practices_k`` practices most relevant to its files
+            pruner: Drops lockfiles, generated, vendored and binary diffs before
+                prompting (default: a DiffPruner configured from the environment)
+            prune: Set to False to send every file's diff to the model
+            prompt_tokens: Token budget for the single-prompt analysis; the diff
+                is compacted to fit (default: PR_PROMPT_TOKENS, then what the
+                model's context window leaves after the response)
+            dedupe: Send hunks repeated across files (renames, codemods) once
+                with the list of files they apply to
+            history: Object with ``record_run(...)`` that keeps every run's
+                prompt, response and timings; defaults to the process-wide
+                SQLite history store
+            record_history: Set to False to keep no history
+            structured: Ask the model for JSON findings (file, lines, severity,
+                rule, suggestion) instead of markdown; the result then has
+                "findings" and "summary", and "analysis" is rendered from them
+                (default: PR_STRUCTURED_FINDINGS)
+        """
+        self._client = None
+        # Set on the per-run copies made by _for_run
+        self._usage: Optional[TokenUsage] = None
+        self.response_cache = (response_cache or get_response_cache()) if use_cache else None
+        self.history = (history or get_history_store()) if record_history else None
+        self.mode = mode or os.getenv("PR_ANALYSIS_MODE", "single")
+        if self.mode not in ANALYSIS_MODES:
+            raise ValueError(f"Unknown analysis mode '{self.mode}', expected one of {', '.join(ANALYSIS_MODES)}")
+        self.max_workers = max_workers or int(os.getenv("PR_ANALYSIS_WORKERS", DEFAULT_MAP_WORKERS))
+        self.chunk_tokens = chunk_tokens or int(os.getenv("PR_CHUNK_TOKENS", DEFAULT_CHUNK_TOKENS))
+        self.practices_index = practices_index
+        self.practices_k = practices_k
+        self.pruner = (pruner or DiffPruner()) if prune else None
+        self.dedupe = dedupe
+        if structured is None:
+            structured = os.getenv("PR_STRUCTURED_FINDINGS", "").lower() in ("1", "true", "yes")
+        self.structured = structured
+        self.budgeter = PromptBudgeter(prompt_tokens or prompt_budget(MODEL, MAX_TOKENS, SYSTEM_MESSAGE), MODEL)
         self.best_practices = self._load_best_practices()
         
+    @property
+    def client(self):
+        """The shared OpenAI client, created on first use so cached runs never import openai."""
+        if self._client is None:
+            self._client = get_openai_client()
+        return self._client
+
     def _load_best_practices(self) -> str:
         """Load and process the best practices document."""
-        # This will be implemented in best_practices.py
+        # Practices are retrieved per prompt from practices_index when one is given
         return ""
 
-    def analyze_pr(self, pr_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _prune(self, pr_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the view of ``pr_data`` that goes into prompts."""
+        return self.pruner.prune(pr_data) if self.pruner is not None else pr_data
+
+    def _dedupe(self, pr_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Group hunks repeated across files so each goes into the prompt once."""
+        if not self.dedupe or not pr_data.get("files"):
+            return pr_data
+        files, report = dedupe_hunks(pr_data["files"])
+        return {**pr_data, "files": files, "dedup": report}
+
+    def _practices_for(self, files: List[Dict[str, Any]]) -> str:
+        """Return the best practices relevant to the given files."""
+        if self.practices_index is None:
+            return self.best_practices
+        return self.practices_index.format_practices(self.practices_index.retrieve_for_files(files, self.practices_k))
+
+    def _for_run(self, practices_index: Optional[PracticesIndex] = None) -> "PRAnalyzerAgent":
+        """A shallow copy for one analysis run, counting the tokens its completions use.
+
+        It retrieves from ``practices_index`` if given. The copy shares the
+        client, caches and history, so an agent shared across sessions and
+        threads is never modified per call.
+        """
+        agent = copy.copy(self)
+        agent.practices_index = practices_index or self.practices_index
+        agent._usage = TokenUsage()
+        return agent
+
+    def analyze_pr(self, pr_data: Dict[str, Any], practices_index: Optional[PracticesIndex] = None) -> Dict[str, Any]:
         """
         Analyze a pull request using the AI agent.
         
@@ -26,52 +227,509 @@ class PRAnalyzerAgent:
                 - changes
                 - files_changed
                 - commits
+            practices_index: Index to retrieve best practices from for this
+                call only, in place of the agent's own
         
         Returns:
-            Dictionary containing analysis results and recommendations
-        """
-        prompt = self._create_analysis_prompt(pr_data)
-        
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an expert code reviewer analyzing pull requests based on coding best practices. Code changes are provided in git diff format."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000
-        )
+            Dictionary containing analysis results and recommendations; the
+            "cached" flag is True when the response came from the cache,
+            "pruning" reports the diff content left out of the prompt and
+            "prompt_stats" the final prompt's token count and any truncation
+            and "dedup" how many repeated hunks were sent only once
+        """
+        if self._usage is None or practices_index is not None:
+            return self._for_run(practices_index).analyze_pr(pr_data)
+        if self.structured:
+            return self._analyze_structured(pr_data)
+        start = time.perf_counter()
+        prompt, system_message, meta = self._prepare_prompt(pr_data)
+        content, cached = self._complete(prompt, system_message=system_message)
+        
+        result = self._process_agent_response(content)
+        result.update(meta)
+        result["cached"] = cached and meta.get("cached", True)
+        self._record_history(pr_data, prompt, result, time.perf_counter() - start)
+        return result
+
+    def stream_analysis(self, pr_data: Dict[str, Any],
+                        practices_index: Optional[PracticesIndex] = None) -> "AnalysisStream":
+        """
+        Analyze a pull request, yielding the response text as it arrives.
+        
+        Args:
+            pr_data: PR data as for ``analyze_pr``
+            practices_index: Index to retrieve best practices from for this
+                call only, in place of the agent's own
+        
+        Returns:
+            An AnalysisStream; iterate it for text deltas, then read its
+            ``result`` (same shape as ``analyze_pr``) and ``time_to_first_token``
+        """
+        return AnalysisStream(self._for_run(practices_index), pr_data)
+
+    def analyze_pr_incremental(self, pr_data: Dict[str, Any], state_store: AnalysisStateStore,
+                               changed_files_since: Optional[Callable[[str], Optional[List[str]]]] = None) -> Dict[str, Any]:
+        """
+        Re-analyze only the files touched since this PR was last analyzed.
+        
+        Findings are kept per file in ``state_store``. Files untouched since the
+        last analyzed head reuse their stored findings; the rest are reviewed
+        again, and all findings are merged into one review. If the head hasn't
+        moved, nothing is reviewed and GitHub isn't asked what changed.
+        Findings that cite paths outside the PR are kept, as ``analyze_pr``
+        keeps them, and carried over for as long as any file's findings are.
+        
+        Args:
+            pr_data: PR data as returned by ``get_pr_data`` (needs files, repo,
+                number and head_sha)
+            state_store: Where the per-PR head SHA and file findings are kept
+            changed_files_since: Called with the previously analyzed head SHA;
+                returns the files changed since then, or None if unknown
+        
+        Returns:
+            The ``analyze_pr`` result plus an "incremental" summary
+        """
+        if self._usage is None:
+            return self._for_run().analyze_pr_incremental(pr_data, state_store, changed_files_since)
+        start = time.perf_counter()
+        fetched = pr_data
+        pr_data = self._prune(pr_data)
+        key = pr_state_key(pr_data["repo"], pr_data["number"])
+        previous = state_store.get(key)
+        if previous and previous.get("format", "markdown") != self._findings_format:
+            # Findings stored in the other format can't be reused
+            previous = None
+        current = {file["filename"]: file for file in pr_data.get("files", [])}
         
-        return self._process_agent_response(response.choices[0].message.content)
+        unchanged = bool(previous) and previous["head_sha"] == pr_data["head_sha"]
+        changed = None
+        if unchanged:
+            changed = []
+        elif previous and changed_files_since is not None:
+            changed = changed_files_since(previous["head_sha"])
+        if changed is not None:
+            touched = {name for name in changed if name in current}
+            # Files new to the PR (e.g. after a base merge) have no stored findings
+            touched |= {name for name in current if name not in previous["file_findings"]}
+        else:
+            touched = set(current)
+        
+        findings = {
+            name: previous["file_findings"][name]
+            for name in current if previous and name not in touched
+        }
+        reused = len(current) - len(touched)
+        other = dict(previous.get("other_findings") or {}) if previous and reused else {}
+        review_files = self._review_files_structured if self.structured else self._review_files
+        reviewed, reviewed_other = review_files(pr_data, [file for name, file in current.items() if name in touched])
+        findings.update(reviewed)
+        other.update(reviewed_other)
+        # Keep the PR's file order so the merge prompt (and its cache key) is stable
+        findings = {name: findings.get(name, [] if self.structured else "") for name in current}
+        state = {"head_sha": pr_data["head_sha"], "file_findings": findings, "other_findings": other}
+        
+        if self.structured:
+            # Stored findings merge without another model call
+            merged = merge_findings([unpack_findings(findings), unpack_findings(other)])
+            summary = (f"Reviewed {len(touched)} changed files and reused the findings for {reused}: "
+                       f"{summarize_counts(merged)}.")
+            result = self._structured_result(summary, merged)
+            prompt, cached = "", True
+            state["format"] = "structured"
+        elif unchanged and not touched and previous.get("analysis"):
+            prompt, cached, result = "", True, self._process_agent_response(previous["analysis"])
+        else:
+            prompt, cached, result = self._merge_file_reviews(pr_data, {**findings, **other})
+        state_store.put(key, {**state, "analysis": result["analysis"]})
+        
+        result["cached"] = cached and not touched
+        result["pruning"] = pr_data.get("pruning")
+        result["incremental"] = {
+            "previous_head_sha": previous["head_sha"] if previous else None,
+            "reviewed_files": sorted(touched),
+            "reused_files": reused,
+        }
+        self._record_history(fetched, prompt, result, time.perf_counter() - start, mode="incremental")
+        return result
+
+    @property
+    def _findings_format(self) -> str:
+        return "structured" if self.structured else "markdown"
+
+    def _merge_file_reviews(self, pr_data: Dict[str, Any], findings: Dict[str, str]) -> Tuple[str, bool, Dict[str, Any]]:
+        """Merge per-file markdown findings into one review with a reduce call."""
+        # Files with identical findings (e.g. from one shared change) are merged under one heading
+        by_text: Dict[str, List[str]] = {}
+        for name, text in findings.items():
+            if text.strip():
+                by_text.setdefault(text, []).append(name)
+        reviews = [f"### File: {format_affected_files(names)}\n{text}" for text, names in by_text.items()]
+        prompt = self._create_reduce_prompt(pr_data, reviews)
+        content, cached = self._complete(prompt, system_message=REDUCE_SYSTEM_MESSAGE)
+        return prompt, cached, self._process_agent_response(content)
+
+    def _review_files(self, pr_data: Dict[str, Any], files: List[Dict[str, Any]]) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """Review files in parallel chunks and split the reviews back out per file.
+
+        Returns the findings for each of ``files`` and, keyed by path, those
+        under headings for other paths.
+        """
+        if not files:
+            return {}, {}
+        names = [file["filename"] for file in files]
+        if self.dedupe:
+            files, _ = dedupe_hunks(files)
+        chunks = chunk_files(files, self.chunk_tokens)
+        prompts = [self._create_chunk_prompt(pr_data, chunk, index, len(chunks)) for index, chunk in enumerate(chunks)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            chunk_results = list(executor.map(self._complete, prompts))
+        
+        findings = {file["filename"]: "" for file in files}
+        by_basename = index_by_basename(findings)
+        for content, _ in chunk_results:
+            for name, text in self._split_by_file(content).items():
+                name = resolve_path(name, by_basename) or name
+                findings[name] = f"{findings.get(name, '')}\n{text}".strip()
+        # Findings on a shared change apply to every file it was taken from
+        findings = fan_out(findings, files)
+        return ({name: findings.get(name, "") for name in names},
+                {name: text for name, text in findings.items() if name not in names and text})
+
+    def _review_files_structured(self, pr_data: Dict[str, Any],
+                                 files: List[Dict[str, Any]]) -> Tuple[Dict[str, List[list]], Dict[str, List[list]]]:
+        """Review files in parallel chunks for JSON findings, packed per file like ``_review_files`` splits them."""
+        if not files:
+            return {}, {}
+        names = [file["filename"] for file in files]
+        if self.dedupe:
+            files, _ = dedupe_hunks(files)
+        chunks = chunk_files(files, self.chunk_tokens)
+        prompts = [self._create_chunk_prompt(pr_data, chunk, index, len(chunks)) for index, chunk in enumerate(chunks)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            reports = list(executor.map(self._structured_complete, prompts))
+        
+        findings = merge_findings(report["findings"] for report, _ in reports)
+        packed = pack_findings(fan_out_findings(resolve_paths(findings, [file["filename"] for file in files]), files))
+        return ({name: packed.get(name, []) for name in names},
+                {name: items for name, items in packed.items() if name not in names})
+
+    def _analyze_structured(self, pr_data: Dict[str, Any]) -> Dict[str, Any]:
+        """``analyze_pr`` in structured mode.
+
+        In map_reduce mode each chunk's findings are merged locally instead
+        of with a reduce call, and the chunk summaries make up the overall
+        assessment.
+        """
+        start = time.perf_counter()
+        view = self._dedupe(self._prune(pr_data))
+        meta = {key: view[key] for key in ("pruning", "dedup") if key in view}
+        files = view.get("files") or []
+        chunks = chunk_files(files, self.chunk_tokens) if self.mode == "map_reduce" and files else []
+        if len(chunks) > 1:
+            prompts = [self._create_chunk_prompt(view, chunk, index, len(chunks)) for index, chunk in enumerate(chunks)]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                reports = list(executor.map(self._structured_complete, prompts))
+            prompt = "\n\n".join(prompts)
+            summary = "\n".join(f"- {report['summary']}" for report, _ in reports if report["summary"])
+            findings = [finding for report, _ in reports for finding in report["findings"]]
+            cached = all(chunk_cached for _, chunk_cached in reports)
+            errors = [report["error"] for report, _ in reports if "error" in report]
+            meta["chunks"] = len(chunks)
+        else:
+            prompt, meta["prompt_stats"] = self._fit_analysis_prompt(view)
+            report, cached = self._structured_complete(prompt)
+            summary, findings = report["summary"], report["findings"]
+            errors = [report["error"]] if "error" in report else []
+        
+        findings = resolve_paths(findings, [file["filename"] for file in files])
+        result = self._structured_result(summary, merge_findings([fan_out_findings(findings, files)]))
+        if errors and not findings:
+            # Nothing parsed; show the model's raw response rather than an empty review
+            result["analysis"] = summary
+        result.update(meta)
+        result["cached"] = cached
+        if errors:
+            result["structured_errors"] = errors
+        self._record_history(pr_data, prompt, result, time.perf_counter() - start)
+        return result
+
+    def _structured_complete(self, prompt: str) -> Tuple[Dict[str, Any], bool]:
+        """Complete a structured prompt and validate the JSON, asking once for a repair if it's malformed.
+
+        A response that is still malformed after the repair is kept as the
+        summary (with an "error"), so the review is never lost.
+        """
+        # Only JSON that parses is cached, so a malformed response is never replayed
+        content, cached = self._complete(prompt, system_message=STRUCTURED_SYSTEM_MESSAGE, json_output=True,
+                                         store=False)
+        try:
+            report = parse_findings(content)
+            metrics.increment("structured_responses", result="valid")
+            if not cached:
+                self._store_response(prompt, STRUCTURED_SYSTEM_MESSAGE, content)
+            return report, cached
+        except FindingsError as e:
+            error = e
+        
+        # The repair prompt quotes only the bad response, not the PR
+        repaired, repaired_cached = self._complete(repair_prompt(content, error), system_message=STRUCTURED_SYSTEM_MESSAGE,
+                                                   json_output=True, store=False)
+        try:
+            report = parse_findings(repaired)
+            metrics.increment("structured_responses", result="repaired")
+            # Later runs of the same prompt get the repaired JSON straight away
+            self._store_response(prompt, STRUCTURED_SYSTEM_MESSAGE, repaired)
+            return report, cached and repaired_cached
+        except FindingsError as e:
+            metrics.increment("structured_responses", result="invalid")
+            return {"summary": content, "findings": [], "error": str(e)}, cached and repaired_cached
+
+    def _structured_result(self, summary: str, findings: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Result dict for structured findings, with the markdown review rendered from them."""
+        result = self._process_agent_response(render_markdown(summary, findings))
+        result.update({"summary": summary, "findings": findings})
+        return result
+
+    def _split_by_file(self, review: str) -> Dict[str, str]:
+        """Split a chunk review into per-file sections using its file headings."""
+        sections = {}
+        matches = list(FILE_SECTION_PATTERN.finditer(review))
+        for index, match in enumerate(matches):
+            end = matches[index + 1].start() if index + 1 < len(matches) else len(review)
+            name = match.group(1).strip()
+            sections[name] = f"{sections.get(name, '')}\n{review[match.end():end].strip()}".strip()
+        return sections
+
+    def _fan_out_review(self, review: str, files: List[Dict[str, Any]]) -> str:
+        """Rewrite a chunk review's shared change sections under each file the change applies to."""
+        sections = self._split_by_file(review)
+        if not any(name.startswith(SHARED_CHANGE_PREFIX) for name in sections):
+            return review
+        preamble = review[:FILE_SECTION_PATTERN.search(review).start()].strip()
+        sections = fan_out(sections, files)
+        return "\n".join([preamble] + [f"### File: {name}\n{text}" for name, text in sections.items() if text]).strip()
+
+    def _prepare_prompt(self, pr_data: Dict[str, Any]) -> Tuple[str, str, Dict[str, Any]]:
+        """Build the prompt for the final completion and any metadata for the result.
+
+        In map_reduce mode this runs the map phase, reviewing chunks in parallel,
+        and returns the reduce prompt that merges them. Repeated hunks are only
+        grouped for the map phase, whose per-file reviews can be fanned back
+        out; a single free-form review has no per-file sections to copy.
+        """
+        pr_data = self._prune(pr_data)
+        meta = {key: pr_data[key] for key in ("pruning",) if key in pr_data}
+        if self.mode == "map_reduce" and pr_data.get("files"):
+            view = self._dedupe(pr_data)
+            chunks = chunk_files(view["files"], self.chunk_tokens)
+            if len(chunks) > 1:
+                prompts = [self._create_chunk_prompt(view, chunk, index, len(chunks)) for index, chunk in enumerate(chunks)]
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    chunk_results = list(executor.map(self._complete, prompts))
+                
+                reviews = [self._fan_out_review(content, view["files"]) for content, _ in chunk_results]
+                reduce_prompt = self._create_reduce_prompt(view, reviews)
+                if "dedup" in view:
+                    meta["dedup"] = view["dedup"]
+                meta.update({
+                    "chunks": len(chunks),
+                    "cached": all(chunk_cached for _, chunk_cached in chunk_results),
+                    "prompt_stats": {"tokens": count_tokens(reduce_prompt, MODEL), "tokenizer": tokenizer_name(MODEL)},
+                })
+                return reduce_prompt, REDUCE_SYSTEM_MESSAGE, meta
+        
+        prompt, meta["prompt_stats"] = self._fit_analysis_prompt(pr_data)
+        return prompt, SYSTEM_MESSAGE, meta
+
+    def _fit_analysis_prompt(self, pr_data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Build the single-prompt analysis with its diff compacted to the token budget."""
+        with metrics.span("build_prompt"):
+            files = pr_data.get('files') or [{"filename": name} for name in pr_data.get('files_changed', [])]
+            practices = self._practices_for(files)
+            report = {}
+            changes = pr_data.get('changes', '')
+            if pr_data.get('files'):
+                available = self.budgeter.budget - count_tokens(self._create_analysis_prompt(pr_data, "", practices), MODEL)
+                changes, report = self.budgeter.fit(pr_data['files'], available)
+            
+            prompt = self._create_analysis_prompt(pr_data, changes, practices)
+            report.update({"tokens": count_tokens(prompt, MODEL), "budget": self.budgeter.budget, "tokenizer": tokenizer_name(MODEL)})
+        return prompt, report
 
-    def _create_analysis_prompt(self, pr_data: Dict[str, Any]) -> str:
-        """Create a detailed prompt for the AI agent."""
-        return f"""
-        Please analyze this pull request based on the following best practices and provide detailed feedback, also include the best practice from the document that you are using to analyze the PR:
+    def _complete(self, prompt: str, system_message: str = SYSTEM_MESSAGE,
+                  max_tokens: int = MAX_TOKENS, json_output: bool = False, store: bool = True) -> Tuple[str, bool]:
+        """Run a chat completion, serving repeated prompts from the response cache.
 
-        PR Title: {pr_data.get('title', '')}
-        Description: {pr_data.get('description', '')}
+        ``json_output`` puts the model in JSON mode. With ``store=False`` a
+        new response is not cached; the caller stores it once it is usable.
+        """
+        cache_key = response_cache_key(MODEL, TEMPERATURE, max_tokens, system_message, prompt)
+        if self.response_cache is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached, True
         
-        Files Changed:
-        {self._format_files_changed(pr_data.get('files_changed', []))}
+        with metrics.span("completion", model=MODEL, stream=False):
+            response = self.client.chat.completions.create(
+                model=MODEL,
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=TEMPERATURE,
+                max_tokens=max_tokens,
+                **({"response_format": {"type": "json_object"}} if json_output else {})
+            )
+        content = response.choices[0].message.content
+        self._record_usage(response.usage)
         
-        Changes:
-        {pr_data.get('changes', '')}
+        if store:
+            self._store_response(prompt, system_message, content, max_tokens)
+        return content, False
+
+    def _store_response(self, prompt: str, system_message: str, content: str, max_tokens: int = MAX_TOKENS) -> None:
+        """Cache a completion's response for later runs of the same prompt."""
+        if self.response_cache is not None and content:
+            self.response_cache.put(response_cache_key(MODEL, TEMPERATURE, max_tokens, system_message, prompt), content)
+
+    def _stream_complete(self, prompt: str, system_message: str = SYSTEM_MESSAGE,
+                         max_tokens: int = MAX_TOKENS) -> Iterator[str]:
+        """Stream a chat completion's text deltas; returns ``(content, cached)`` when done."""
+        cache_key = response_cache_key(MODEL, TEMPERATURE, max_tokens, system_message, prompt)
+        if self.response_cache is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return cached, True
         
-        Best Practices to Consider:
-        {self.best_practices}
+        parts = []
+        usage = None
+        with metrics.span("completion", model=MODEL, stream=True):
+            stream = self.client.chat.completions.create(
+                model=MODEL,
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=TEMPERATURE,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        content = "".join(parts)
+        self._record_usage(usage)
         
-        Please provide:
-        1. Overall assessment
-        2. Specific issues found
-        3. Recommendations for improvement
-        4. Code examples for suggested improvements
+        self._store_response(prompt, system_message, content, max_tokens)
+        return content, False
+
+    def _record_usage(self, usage) -> None:
+        """Count the prompt and completion tokens a completion used, overall and for this run."""
+        if self._usage is not None:
+            self._usage.add(usage)
+        if usage is None:
+            return
+        metrics.increment("prompt_tokens", usage.prompt_tokens, model=MODEL)
+        metrics.increment("completion_tokens", usage.completion_tokens, model=MODEL)
+
+    def _record_history(self, pr_data: Dict[str, Any], prompt: str, result: Dict[str, Any], seconds: float,
+                        mode: str = None) -> None:
+        """Queue a finished run for the history store (written in the background).
+
+        Token counts are those the API reported for the run's completions
+        (map, repair and reduce calls included), so a run served from the
+        cache records none.
         """
+        if self.history is None or not pr_data.get("head_sha"):
+            return
+        usage = self._usage or TokenUsage()
+        meta = {key: result[key] for key in ("pruning", "dedup", "prompt_stats", "chunks", "incremental", "time_to_first_token") if result.get(key)}
+        if result.get("findings"):
+            meta["findings"] = pack_findings(result["findings"])
+        self.history.record_run(
+            pr_data, prompt, result["analysis"], result["cached"], mode=mode or self.mode, model=MODEL,
+            prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens,
+            analysis_seconds=round(seconds, 3), meta=meta,
+        )
+
+    def _create_analysis_prompt(self, pr_data: Dict[str, Any], changes: str = None, practices: str = None) -> str:
+        """Create a detailed prompt for the AI agent.
+
+        ``changes`` and ``practices`` default to the PR's full diff and the
+        practices relevant to its files.
+        """
+        if practices is None:
+            files = pr_data.get('files') or [{"filename": name} for name in pr_data.get('files_changed', [])]
+            practices = self._practices_for(files)
+        prompt = ANALYSIS_PROMPT.format(
+            title=pr_data.get('title', ''),
+            description=pr_data.get('description', ''),
+            files_changed=self._format_files_changed(pr_data.get('files_changed', [])),
+            changes=pr_data.get('changes', '') if changes is None else changes,
+            pruned=self._format_pruned_section(pr_data),
+            practices=practices,
+        )
+        return self._with_output_format(prompt)
+
+    def _create_chunk_prompt(self, pr_data: Dict[str, Any], chunk: List[Dict[str, Any]],
+                             index: int, total: int) -> str:
+        """Create the prompt reviewing one chunk of a larger PR."""
+        changes = []
+        for file in chunk:
+            part = f" (part {file['part']} of {file['parts']})" if file.get("parts", 1) > 1 else ""
+            if file.get("truncated"):
+                part += f" (first {file['truncated']['hunks']} of {file['truncated']['of']} hunks)"
+            part += shared_note(file)
+            changes.append(f"File: {file['filename']}{part}")
+            changes.append(f"Changes: {file.get('patch')}")
+
+        prompt = CHUNK_PROMPT.format(
+            number=index + 1,
+            total=total,
+            title=pr_data.get('title', ''),
+            description=pr_data.get('description', ''),
+            files_changed=self._format_files_changed([file['filename'] for file in chunk]),
+            changes="\n".join(changes),
+            practices=self._practices_for(chunk),
+        )
+        return self._with_output_format(prompt)
+
+    def _with_output_format(self, prompt: str) -> str:
+        """In structured mode, ask for the JSON findings in place of the markdown sections."""
+        return f"{prompt}\n{OUTPUT_INSTRUCTIONS}\n" if self.structured else prompt
+
+    def _create_reduce_prompt(self, pr_data: Dict[str, Any], chunk_reviews: List[str]) -> str:
+        """Create the prompt that merges partial reviews into one review."""
+        reviews = "\n\n".join(
+            f"--- Review part {index + 1} ---\n{review}" for index, review in enumerate(chunk_reviews)
+        )
+        return REDUCE_PROMPT.format(
+            parts=len(chunk_reviews),
+            title=pr_data.get('title', ''),
+            description=pr_data.get('description', ''),
+            files_changed=self._format_files_changed(pr_data.get('files_changed', [])),
+            reviews=reviews,
+            pruned=self._format_pruned_section(pr_data),
+        )
 
     def _format_files_changed(self, files: List[str]) -> str:
         """Format the list of changed files for the prompt."""
         return "\n".join([f"- {file}" for file in files])
 
+    def _format_pruned_section(self, pr_data: Dict[str, Any]) -> str:
+        """List the files whose diffs were left out of the prompt, if any."""
+        if not pr_data.get("pruned"):
+            return ""
+        return f"\nFiles changed but not shown (mention them only if their presence matters):\n{format_pruned(pr_data['pruned'])}\n"
+
     def _process_agent_response(self, response: str) -> Dict[str, Any]:
         """Process the AI agent's response into a structured format."""
         # This is a basic implementation - you might want to enhance it
@@ -79,3 +737,44 @@ class PRAnalyzerAgent:
             "analysis": response,
             "status": "completed"
         }
+
+
+class AnalysisStream:
+    """Iterator over the text of an analysis as the model produces it.
+
+    Once iteration finishes, ``result`` holds the same dict ``analyze_pr``
+    returns and ``time_to_first_token`` the seconds from the start of
+    iteration until the first text arrived (map phase included).
+    """
+
+    def __init__(self, agent: PRAnalyzerAgent, pr_data: Dict[str, Any]):
+        self.agent = agent
+        self.pr_data = pr_data
+        self.result = None
+        self.time_to_first_token = None
+
+    def __iter__(self) -> Iterator[str]:
+        start = time.perf_counter()
+        if self.agent.structured:
+            # JSON findings can't be shown as they arrive; the review is rendered once they are in
+            self.result = self.agent.analyze_pr(self.pr_data)
+            self.time_to_first_token = self.result["time_to_first_token"] = round(time.perf_counter() - start, 3)
+            yield self.result["analysis"]
+            return
+        prompt, system_message, meta = self.agent._prepare_prompt(self.pr_data)
+        deltas = self.agent._stream_complete(prompt, system_message=system_message)
+        while True:
+            try:
+                delta = next(deltas)
+            except StopIteration as done:
+                content, cached = done.value
+                break
+            if self.time_to_first_token is None:
+                self.time_to_first_token = round(time.perf_counter() - start, 3)
+            yield delta
+        
+        self.result = self.agent._process_agent_response(content)
+        self.result.update(meta)
+        self.result["cached"] = cached and meta.get("cached", True)
+        self.result["time_to_first_token"] = self.time_to_first_token
+        self.agent._record_history(self.pr_data, prompt, self.result, time.perf_counter() - start)
@@ -1,18 +1,31 @@
 import streamlit as st
-import os
 from dotenv import load_dotenv
 
+# Load environment variables before the modules that read settings from them
+load_dotenv()
+
 # Import custom modules
 from pr_analyzer import get_pr_data
 from agent import PRAnalyzerAgent
-from best_practices import BestPracticesProcessor
+from best_practices import get_shared_processor
 from styles.styles import get_styles
 from styles.markdown import apply_enhanced_markdown_styles
-from components.ui import render_sidebar, render_metrics, render_welcome_screen
+from components.ui import render_sidebar, render_metrics, render_welcome_screen, render_debug_panel
 from components.analysis import render_analysis
+from utils.metrics import serve_metrics
 
-# Load environment variables
-load_dotenv()
+# Analyses kept per browser session, keyed by (PR URL, head SHA)
+MAX_SESSION_ANALYSES = 10
+
+@st.cache_resource
+def get_agent() -> PRAnalyzerAgent:
+    """Process-wide agent; its OpenAI client comes from the shared client pool."""
+    return PRAnalyzerAgent()
+
+@st.cache_resource
+def get_best_practices():
+    """Process-wide best-practices corpus shared by every session."""
+    return get_shared_processor()
 
 def setup_app():
     """Set up the application configuration and styles."""
@@ -29,6 +42,9 @@ def setup_app():
     
     # Apply enhanced markdown styles
     apply_enhanced_markdown_styles()
+    
+    # Expose Prometheus metrics when PR_METRICS_PORT is set
+    serve_metrics()
 
 def main():
     """Main application function."""
@@ -38,29 +54,56 @@ def main():
     # Initialize session state
     if 'pr_url' not in st.session_state:
         st.session_state.pr_url = ""
+    if 'analyses' not in st.session_state:
+        st.session_state.analyses = {}
+        st.session_state.current_analysis = None
+    analyses = st.session_state.analyses
     
     # Render sidebar and get user input
     pr_url, analyze_button = render_sidebar()
     
     if analyze_button and pr_url:
         st.session_state.pr_url = pr_url
-        with st.spinner("Analyzing PR..."):
-            try:
-                # Get PR data and perform analysis
+        try:
+            # Get PR data; an unchanged PR is served from the snapshot cache
+            with st.spinner("Fetching PR..."):
                 pr_data = get_pr_data(pr_url)
-                best_practices_processor = BestPracticesProcessor()
-                agent = PRAnalyzerAgent()
-                analysis_results = agent.analyze_pr(pr_data)
-                
-                # Render the UI components
-                render_metrics(pr_data)
-                render_analysis(pr_data, analysis_results, pr_url)
+            key = (pr_url, pr_data["head_sha"])
+            st.session_state.current_analysis = key
             
-            except Exception as e:
-                st.error(f"Error analyzing PR: {str(e)}")
+            # Metrics and the diff render right away; the analysis streams in
+            render_metrics(pr_data)
+            if key in analyses:
+                render_analysis(pr_data, analyses[key]["analysis_results"], pr_url)
+            else:
+                best_practices_processor = get_best_practices()
+                best_practices_processor.refresh()
+                # The agent is shared by every session, so the index goes with the call
+                stream = get_agent().stream_analysis(pr_data, practices_index=best_practices_processor.get_index())
+                analysis_results = render_analysis(pr_data, stream, pr_url)
+                _remember_analysis(key, pr_data, analysis_results)
+        
+        except Exception as e:
+            st.error(f"Error analyzing PR: {str(e)}")
+    
+    elif st.session_state.current_analysis in analyses:
+        # Reruns (e.g. submitting the review form) redraw from memory
+        entry = analyses[st.session_state.current_analysis]
+        render_metrics(entry["pr_data"])
+        render_analysis(entry["pr_data"], entry["analysis_results"], st.session_state.current_analysis[0])
     
     else:
         render_welcome_screen()
+    
+    # Drawn last so it includes this run's timings
+    render_debug_panel()
+
+def _remember_analysis(key: tuple, pr_data: dict, analysis_results: dict):
+    """Store an analysis in the session, dropping the oldest beyond the limit."""
+    analyses = st.session_state.analyses
+    analyses[key] = {"pr_data": pr_data, "analysis_results": analysis_results}
+    while len(analyses) > MAX_SESSION_ANALYSES:
+        analyses.pop(next(iter(analyses)))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,145 @@
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from utils.findings import apply_min_severity
+
+DEFAULT_BATCH_WORKERS = 4
+
+
+def read_pr_urls(path: str) -> List[str]:
+    """Read PR URLs from a file, one per line; blank lines and # comments are skipped."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def load_completed_urls(output_path: str) -> Set[str]:
+    """Return the URLs already analyzed successfully in an existing JSONL output."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A crash can leave a partially written last line
+                continue
+            if record.get("status") == "completed":
+                completed.add(record["url"])
+    return completed
+
+
+def _ends_mid_line(path: str) -> bool:
+    """True if a file's last line was left without its newline (e.g. by a crash)."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def analyze_one(url: str, fetch_pr: Callable[[str], Dict[str, Any]], agent,
+                min_severity: Optional[str] = None) -> Dict[str, Any]:
+    """Fetch and analyze one PR, returning a JSONL record (errors included).
+
+    Structured findings less severe than ``min_severity`` are left out.
+    """
+    record = {"url": url}
+    start = time.perf_counter()
+    try:
+        pr_data = fetch_pr(url)
+        fetched = time.perf_counter()
+        record.update({
+            "repo": pr_data.get("repo"),
+            "number": pr_data.get("number"),
+            "title": pr_data.get("title"),
+            "head_sha": pr_data.get("head_sha"),
+            "fetch_seconds": round(fetched - start, 3),
+        })
+        results = apply_min_severity(agent.analyze_pr(pr_data), min_severity)
+        record.update({
+            "status": "completed",
+            "analysis": results["analysis"],
+            "cached": results.get("cached", False),
+            "tokens_saved": (results.get("pruning") or {}).get("tokens_saved", 0),
+            "prompt_tokens": (results.get("prompt_stats") or {}).get("tokens"),
+            "analysis_seconds": round(time.perf_counter() - fetched, 3),
+        })
+        if results.get("findings") is not None:
+            record["findings"] = results["findings"]
+    except Exception as e:
+        record.update({"status": "error", "error": str(e)})
+    record["total_seconds"] = round(time.perf_counter() - start, 3)
+    record["finished_at"] = datetime.now(timezone.utc).isoformat()
+    return record
+
+
+def run_batch(urls: List[str], fetch_pr: Callable[[str], Dict[str, Any]], agent, output_path: str,
+              workers: int = DEFAULT_BATCH_WORKERS, resume: bool = False,
+              min_severity: Optional[str] = None) -> Dict[str, Any]:
+    """Analyze many PRs concurrently, appending one JSONL record per PR as it finishes.
+
+    With ``resume`` the PRs already completed in ``output_path`` are skipped,
+    so a crashed sweep can be restarted with the same arguments. Findings
+    less severe than ``min_severity`` are left out of the records.
+
+    Returns a summary with counts, throughput and per-stage latency percentiles.
+    """
+    skipped = load_completed_urls(output_path) if resume else set()
+    pending = list(dict.fromkeys(url for url in urls if url not in skipped))
+    records = []
+    start = time.perf_counter()
+
+    partial_line = resume and _ends_mid_line(output_path)
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as output:
+        if partial_line:
+            # Start the first new record on its own line rather than gluing it to the partial one
+            output.write("\n")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(analyze_one, url, fetch_pr, agent, min_severity) for url in pending]
+            for future in as_completed(futures):
+                record = future.result()
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                records.append(record)
+
+    elapsed = time.perf_counter() - start
+    completed = [record for record in records if record["status"] == "completed"]
+    summary = {
+        "total": len(pending),
+        "completed": len(completed),
+        "failed": len(records) - len(completed),
+        "skipped": len(urls) - len(pending),
+        "elapsed_seconds": round(elapsed, 2),
+        "prs_per_minute": round(len(records) / elapsed * 60, 2) if elapsed > 0 else 0.0,
+    }
+    for stage in ("fetch_seconds", "analysis_seconds", "total_seconds"):
+        values = [record[stage] for record in completed if stage in record]
+        summary[stage] = {"p50": _percentile(values, 50), "p95": _percentile(values, 95)}
+    return summary
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    """Print a batch summary."""
+    print("\nBatch Summary:")
+    print("=" * 50)
+    print(f"PRs analyzed: {summary['completed']} completed, {summary['failed']} failed, "
+          f"{summary['skipped']} skipped (already done)")
+    print(f"Elapsed: {summary['elapsed_seconds']:.1f}s ({summary['prs_per_minute']:.1f} PRs/min)")
+    for stage, label in (("fetch_seconds", "Fetch"), ("analysis_seconds", "Analysis"), ("total_seconds", "Total")):
+        print(f"{label + ' latency:':<18} p50 {summary[stage]['p50']:.2f}s  p95 {summary[stage]['p95']:.2f}s")
@@ -1,39 +1,222 @@
+import json
 import os
-from typing import List
-from docx import Document
+import re
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional
+from practices_index import PracticesIndex
+from utils.metrics import metrics
+
+# python-docx is only imported when a document has to be parsed; the stored corpus covers the rest
+if TYPE_CHECKING:
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+# Parsed documents are stored next to the sources and reused while each
+# document's mtime and size are unchanged
+CORPUS_FILENAME = ".practices_corpus.json"
+CORPUS_VERSION = 1
+
+HEADING_LEVEL_PATTERN = re.compile(r"Heading\s*(\d+)")
+
+
+def format_table_row(header: List[str], row: List[str]) -> str:
+    """Render one table row as a rule line, e.g. ``Name: foo; Type: bar``."""
+    if header and len(header) == len(row):
+        return "; ".join(f"{key}: {value}" for key, value in zip(header, row) if value)
+    return "; ".join(value for value in row if value)
+
+
+def section_rules(section: Dict) -> List[str]:
+    """Return a section's rules as text lines: its paragraphs, then its table rows."""
+    rules = list(section["paragraphs"])
+    for table in section.get("tables", []):
+        rules.extend(format_table_row(table["header"], row) for row in table["rows"])
+    return rules
+
 
 class BestPracticesProcessor:
     def __init__(self, docs_dir: str = "docs"):
         self.docs_dir = docs_dir
-        self.best_practices = self._load_best_practices()
+        self._lock = threading.Lock()
+        self._documents: Dict[str, Dict] = {}
+        self._index = None
+        self.sections = None
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Re-parse any documents added or changed since the last load.
+
+        Returns True when the corpus changed.
+        """
+        with self._lock, metrics.span("load_practices") as span:
+            cached = self._documents if self.sections is not None else self._read_corpus()
+            documents, changed = self._load_documents(cached)
+            changed = changed or documents.keys() != cached.keys()
+            if changed:
+                self._write_corpus(documents)
+            if changed or self.sections is None:
+                self._documents = documents
+                self.sections = [section for path in sorted(documents) for section in documents[path]["sections"]]
+                self.best_practices = self._load_best_practices()
+                self._index = None
+            span["changed"] = changed
+            return changed
+
+    def _corpus_path(self) -> str:
+        return os.path.join(self.docs_dir, CORPUS_FILENAME)
+
+    def _read_corpus(self) -> Dict[str, Dict]:
+        """Read previously parsed documents, ignoring a missing or stale corpus file."""
+        try:
+            with open(self._corpus_path(), "r", encoding="utf-8") as f:
+                corpus = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if corpus.get("version") != CORPUS_VERSION:
+            return {}
+        return corpus.get("documents", {})
+
+    def _write_corpus(self, documents: Dict[str, Dict]) -> None:
+        path = self._corpus_path()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": CORPUS_VERSION, "documents": documents}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            # A read-only docs directory just means parsing again next process
+            pass
+
+    def _load_documents(self, cached: Dict[str, Dict]) -> tuple:
+        """Load all .docx documents, only parsing those whose mtime or size changed."""
+        documents = {}
+        changed = False
 
-    def _load_best_practices(self) -> str:
-        """Load and process all best practices documents."""
-        practices = []
-        
         # Look for .docx files in the docs directory
-        for filename in os.listdir(self.docs_dir):
-            if filename.endswith('.docx'):
+        for filename in sorted(os.listdir(self.docs_dir)):
+            if filename.endswith('.docx') and not filename.startswith('~$'):
                 doc_path = os.path.join(self.docs_dir, filename)
-                practices.extend(self._process_docx(doc_path))
-        
+                stat = os.stat(doc_path)
+                entry = cached.get(filename)
+                if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                    documents[filename] = entry
+                else:
+                    documents[filename] = {
+                        "mtime": stat.st_mtime,
+                        "size": stat.st_size,
+                        "sections": self._process_docx(doc_path),
+                    }
+                    changed = True
+
+        return documents, changed
+
+    def _load_best_practices(self) -> str:
+        """Join every practice rule into one string."""
+        practices = []
+        for section in self.sections:
+            if section["heading"]:
+                practices.append(section["heading"])
+            practices.extend(section_rules(section))
         return "\n".join(practices)
 
-    def _process_docx(self, file_path: str) -> List[str]:
-        """Process a .docx file and extract best practices."""
+    def _process_docx(self, file_path: str) -> List[Dict]:
+        """Process a .docx file into sections of practice paragraphs and tables.
+
+        A new section starts at every paragraph with a Heading style; content
+        before the first heading goes into a section with an empty heading.
+        Tables are kept as a header row plus data rows.
+        """
+        from docx import Document
+        from docx.table import Table
+        from docx.text.paragraph import Paragraph
+
         doc = Document(file_path)
-        practices = []
-        
-        for para in doc.paragraphs:
-            if para.text.strip():
-                practices.append(para.text.strip())
-        
-        return practices
+        source = os.path.basename(file_path)
+        sections = [self._new_section(source, "", 0)]
+
+        # Walk the body in document order so tables land in the right section
+        for child in doc.element.body.iterchildren():
+            tag = child.tag.rsplit("}", 1)[-1]
+            if tag == "p":
+                para = Paragraph(child, doc)
+                text = para.text.strip()
+                if not text:
+                    continue
+                level = self._heading_level(para)
+                if level:
+                    sections.append(self._new_section(source, text, level))
+                else:
+                    sections[-1]["paragraphs"].append(text)
+            elif tag == "tbl":
+                table = self._process_table(Table(child, doc))
+                if table:
+                    sections[-1]["tables"].append(table)
+
+        return [
+            section for section in sections
+            if section["heading"] or section["paragraphs"] or section["tables"]
+        ]
+
+    def _new_section(self, source: str, heading: str, level: int) -> Dict:
+        return {"source": source, "heading": heading, "level": level, "paragraphs": [], "tables": []}
+
+    def _heading_level(self, para: "Paragraph") -> int:
+        """Return the heading level of a paragraph, or 0 for body text."""
+        style_name = para.style.name if para.style is not None else ""
+        if not style_name.startswith("Heading"):
+            return 0
+        match = HEADING_LEVEL_PATTERN.match(style_name)
+        return int(match.group(1)) if match else 1
+
+    def _process_table(self, table: "Table") -> Optional[Dict]:
+        """Extract a table as ``{"header": [...], "rows": [[...], ...]}``."""
+        rows = []
+        for row in table.rows:
+            cells = [cell.text.strip() for cell in row.cells]
+            if any(cells):
+                rows.append(cells)
+        if not rows:
+            return None
+        return {"header": rows[0], "rows": rows[1:]}
 
     def get_best_practices(self) -> str:
         """Get the processed best practices as a string."""
         return self.best_practices
 
+    def get_sections(self) -> List[Dict]:
+        """Get the best practices grouped by section heading."""
+        return self.sections
+
+    def get_index(self) -> PracticesIndex:
+        """Get a retrieval index over the sections, rebuilt only when they change."""
+        with self._lock:
+            if self._index is None:
+                self._index = PracticesIndex([
+                    {"heading": section["heading"], "paragraphs": section_rules(section)}
+                    for section in self.sections
+                ])
+            return self._index
+
     def update_best_practices(self, new_practices: str) -> None:
         """Update the best practices with new content."""
         self.best_practices = new_practices
+
+
+_shared_processors: Dict[str, BestPracticesProcessor] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_processor(docs_dir: str = "docs") -> BestPracticesProcessor:
+    """Return the process-wide processor for a docs directory.
+
+    The first call parses (or loads the stored corpus); later calls only stat
+    the documents and re-parse the ones that changed.
+    """
+    key = os.path.abspath(docs_dir)
+    with _shared_lock:
+        processor = _shared_processors.get(key)
+        if processor is None:
+            _shared_processors[key] = BestPracticesProcessor(docs_dir)
+            return _shared_processors[key]
+    processor.refresh()
+    return processor
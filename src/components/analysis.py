@@ -1,33 +1,68 @@
+import hashlib
 import streamlit as st
 import os
 from utils.github import validate_github_url, submit_review_to_github
-from utils.diff_utils import parse_git_diff, format_side_by_side_diff, apply_diff_styles
+from utils.diff_utils import format_side_by_side_diff, paginate_hunks, apply_diff_styles
+from utils.diff_parser import parse_diff, parse_patch
+from utils.metrics import metrics
+from utils.review_comments import build_review_comments
 
-def render_analysis(pr_data: dict, analysis_results: dict, pr_url: str):
-    """Render the analysis sections."""
+# Diff lines shown per page inside a single file
+DIFF_PAGE_LINES = 400
+
+def render_analysis(pr_data: dict, analysis_results, pr_url: str) -> dict:
+    """Render the analysis sections.
+
+    ``analysis_results`` is either a finished result dict or an
+    ``AnalysisStream``, which is rendered as the text arrives. Returns the
+    final result dict.
+    """
     st.markdown("## Analysis Results")
     
-    # Overall Analysis
-    render_overall_analysis(analysis_results, pr_url)
+    # Reserve the Overall Analysis slot so it stays on top of the page
+    overall_container = st.container()
     
-    # File Changes Analysis
+    # File Changes Analysis; drawn first since it does not wait for the model
     render_file_changes(pr_data)
+    
+    # Overall Analysis
+    with overall_container:
+        return render_overall_analysis(analysis_results, pr_url, pr_data)
 
-def render_overall_analysis(analysis_results: dict, pr_url: str):
-    """Render the overall analysis section."""
+def render_overall_analysis(analysis_results, pr_url: str, pr_data: dict = None) -> dict:
+    """Render the overall analysis section, streaming it in if needed."""
     with st.expander("Overall Analysis", expanded=True):
         # Wrap the markdown content in a div with enhanced styling
         st.markdown('<div class="analysis-card">', unsafe_allow_html=True)
         st.markdown('<div class="enhanced-markdown">', unsafe_allow_html=True)
-        # Use Streamlit's built-in markdown rendering
-        st.markdown(analysis_results["analysis"])
+        if isinstance(analysis_results, dict):
+            # Use Streamlit's built-in markdown rendering
+            st.markdown(analysis_results["analysis"])
+        else:
+            st.write_stream(analysis_results)
+            analysis_results = analysis_results.result
         st.markdown('</div></div>', unsafe_allow_html=True)
         
+        if analysis_results.get("cached"):
+            st.caption("Served from the response cache")
+        elif analysis_results.get("time_to_first_token") is not None:
+            st.caption(f"First token after {analysis_results['time_to_first_token']:.1f}s")
+        pruning = analysis_results.get("pruning")
+        if pruning and (pruning["files_dropped"] or pruning["files_truncated"]):
+            st.caption(f"{pruning['files_dropped']} files left out of the prompt and {pruning['files_truncated']} "
+                       f"truncated (lockfiles, generated, vendored or binary), saving ~{pruning['tokens_saved']:,} tokens")
+        
         # Add review submission section
-        render_review_form(analysis_results, pr_url)
+        render_review_form(analysis_results, pr_url, pr_data)
+    
+    return analysis_results
 
-def render_review_form(analysis_results: dict, pr_url: str):
-    """Render the review submission form."""
+def render_review_form(analysis_results: dict, pr_url: str, pr_data: dict = None):
+    """Render the review submission form.
+
+    Findings that cite lines of the diff can be attached as inline comments,
+    posted together with the review.
+    """
     st.markdown('<div class="review-area">', unsafe_allow_html=True)
     st.markdown("<h3>Submit Your Review</h3>", unsafe_allow_html=True)
     
@@ -51,6 +86,16 @@ def render_review_form(analysis_results: dict, pr_url: str):
         default_review = "Based on my analysis of this PR:\n\n" + analysis_results["analysis"].split("\n\n")[0] + "\n\n..."
         review_text = st.text_area("Review Comment", value=default_review, height=200)
         
+        # Inline comments for findings anchored to lines of the diff
+        comments, unanchored = build_review_comments(analysis_results["analysis"], (pr_data or {}).get("files") or [],
+                                                     findings=analysis_results.get("findings"))
+        attach_comments = False
+        if comments:
+            files = len({comment["path"] for comment in comments})
+            attach_comments = st.checkbox(f"Attach {len(comments)} inline comments on {files} files", value=True)
+        if unanchored:
+            st.caption(f"{len(unanchored)} findings cite lines outside the diff and can't be attached inline")
+        
         # Review type selection
         review_type = st.radio(
             "Review Type", 
@@ -74,7 +119,8 @@ def render_review_form(analysis_results: dict, pr_url: str):
             
             # Submit the review
             with st.spinner("Submitting review..."):
-                result = submit_review_to_github(pr_url, review_text, review_event)
+                result = submit_review_to_github(pr_url, review_text, review_event,
+                                                 comments=comments if attach_comments else None)
             
             # Show result
             if result["success"]:
@@ -86,12 +132,47 @@ def render_review_form(analysis_results: dict, pr_url: str):
     st.markdown('</div>', unsafe_allow_html=True)
 
 def render_file_changes(pr_data: dict):
-    """Render the file changes section with diff view."""
+    """Render the file changes section with one collapsible diff per file.
+
+    A file's diff is only rendered (and sent to the browser) while its toggle
+    is on, and long files are paginated.
+    """
     with st.expander("File Changes"):
-        left_lines, right_lines = parse_git_diff(pr_data['changes'])
-        formatted_diff = format_side_by_side_diff(left_lines, right_lines)
-        
         # Apply custom CSS for the diff table
         apply_diff_styles()
         
-        st.markdown(formatted_diff, unsafe_allow_html=True) 
\ No newline at end of file
+        files = pr_data.get('files')
+        if not files:
+            st.markdown(format_side_by_side_diff(parse_diff(pr_data['changes'])), unsafe_allow_html=True)
+            return
+        
+        for index, file in enumerate(files):
+            label = f"{file['filename']}  (+{file.get('additions', 0)} / -{file.get('deletions', 0)})"
+            if st.toggle(label, key=f"diff-toggle-{index}-{file['filename']}"):
+                render_file_diff(file, key=f"diff-{index}-{file['filename']}")
+
+def render_file_diff(file: dict, key: str):
+    """Render one page of a single file's side-by-side diff."""
+    patch = file.get('patch')
+    if not patch:
+        st.caption("No textual diff available (binary file or diff too large).")
+        return
+    
+    pages = _render_file_pages(hashlib.sha1(patch.encode('utf-8')).hexdigest(), patch, file['filename'])
+    page = 1
+    if len(pages) > 1:
+        page = st.number_input(
+            f"Page (of {len(pages)})", min_value=1, max_value=len(pages), value=1, key=f"{key}-page"
+        )
+    st.markdown(pages[page - 1], unsafe_allow_html=True)
+
+@st.cache_data(max_entries=500, show_spinner=False)
+def _render_file_pages(patch_hash: str, _patch: str, filename: str) -> list:
+    """Render a file's diff pages to HTML, cached by patch hash across reruns.
+
+    The patch itself is excluded from Streamlit's argument hashing (leading
+    underscore); ``patch_hash`` identifies it instead.
+    """
+    with metrics.span("render_diff"):
+        pages = paginate_hunks(parse_patch(_patch, filename), DIFF_PAGE_LINES)
+        return [format_side_by_side_diff(page_hunks) for page_hunks in pages] or [format_side_by_side_diff([])]
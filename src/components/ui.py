@@ -1,5 +1,6 @@
 import streamlit as st
 from components.cards import create_metrics_card
+from utils.metrics import metrics
 
 def render_sidebar():
     """Render the sidebar components."""
@@ -10,6 +11,27 @@ def render_sidebar():
         analyze_button = st.button("Analyze PR")
         return pr_url, analyze_button
 
+def render_debug_panel():
+    """Render per-stage timings and counters in the sidebar when enabled."""
+    with st.sidebar:
+        if not st.toggle("Show performance metrics", key="debug_panel"):
+            return
+        snapshot = metrics.snapshot()
+        st.markdown("**Stages** (since server start)")
+        st.dataframe(
+            [
+                {"stage": stage, "runs": int(total["count"]), "total s": round(total["seconds"], 3),
+                 "avg s": round(total["seconds"] / total["count"], 3) if total["count"] else 0.0}
+                for stage, total in sorted(snapshot["stages"].items())
+            ],
+            hide_index=True,
+        )
+        st.markdown("**Counters**")
+        st.dataframe([{"metric": name, "value": value} for name, value in sorted(snapshot["counters"].items())],
+                     hide_index=True)
+        st.markdown("**Recent spans**")
+        st.dataframe(list(reversed(snapshot["recent"]))[:50], hide_index=True)
+
 def render_metrics(pr_data: dict):
     """Render the metrics section."""
     col1, col2, col3 = st.columns(3)
@@ -1,66 +1,281 @@
 import argparse
+import logging
 import os
-from github import Github
-from agent import PRAnalyzerAgent
-from best_practices import BestPracticesProcessor
+from datetime import datetime
 from dotenv import load_dotenv
 
+# Before the project imports: several modules read settings from the environment at import
 load_dotenv()
 
-def get_pr_data(pr_url: str) -> dict:
-    """Extract PR data from GitHub."""
+from agent import PRAnalyzerAgent, ANALYSIS_MODES
+from best_practices import get_shared_processor
+from utils.pr_fetcher import PRFetcher, FETCH_MODES
+from utils.pr_cache import get_snapshot_cache
+from utils.analysis_state import AnalysisStateStore
+from utils.history import get_history_store
+from utils.findings import SEVERITIES, apply_min_severity, summarize_counts
+from utils.rate_limit import INTERACTIVE, BATCH
+from utils.metrics import metrics, serve_metrics
+from batch import DEFAULT_BATCH_WORKERS, read_pr_urls, run_batch, print_summary
+from webhook import DEFAULT_WEBHOOK_PORT, WebhookService, serve_webhooks
+
+def get_pr_data(pr_url: str, mode: str = None, use_cache: bool = True, priority: int = INTERACTIVE) -> dict:
+    """Extract PR data from GitHub.
+
+    ``mode`` selects the fetch strategy ("rest" or "graphql") and defaults to
+    the PR_FETCH_MODE environment variable, falling back to "rest". With
+    ``use_cache`` the on-disk snapshot is reused while the PR's head SHA is
+    unchanged. Requests are scheduled across the GitHub token pool at
+    ``priority`` (INTERACTIVE or BATCH).
+    """
     github_token = os.getenv("GITHUB_TOKEN")
     if not github_token:
         raise ValueError("GitHub token not found in environment variables")
     
-    g = Github(github_token)
-    
     # Extract repo and PR number from URL
     parts = pr_url.split('/')
-    repo_name = f"{parts[-4]}/{parts[-3]}"
+    owner, repo = parts[-4], parts[-3]
     pr_number = int(parts[-1])
     
-    repo = g.get_repo(repo_name)
-    pr = repo.get_pull(pr_number)
-    
-    # Get PR changes
-    files_changed = [file.filename for file in pr.get_files()]
-    changes = []
-    for file in pr.get_files():
-        changes.append(f"File: {file.filename}")
-        changes.append(f"Changes: {file.patch}")
-    
-    return {
-        "title": pr.title,
-        "description": pr.body,
-        "files_changed": files_changed,
-        "changes": "\n".join(changes),
-        "commits": [commit.commit.message for commit in pr.get_commits()]
-    }
+    # Metadata, files and commits are fetched concurrently in a single pass
+    fetcher = PRFetcher(github_token, priority=priority)
+    mode = mode or os.getenv("PR_FETCH_MODE", "rest")
+    with metrics.span("fetch_pr", mode=mode) as span:
+        if use_cache:
+            pr_data = fetcher.fetch_cached(owner, repo, pr_number, get_snapshot_cache(), mode=mode)
+        else:
+            pr_data = fetcher.fetch(owner, repo, pr_number, mode=mode)
+        span["source"] = "cache" if pr_data.get("from_cache") else "github"
+    return pr_data
+
+def changed_files_since(pr_data: dict):
+    """Return a callable listing the PR's files changed since an earlier head SHA."""
+    owner, repo = pr_data["repo"].split("/")
+    fetcher = PRFetcher(os.getenv("GITHUB_TOKEN"))
+    return lambda since_sha: fetcher.fetch_changed_files(owner, repo, since_sha, pr_data["head_sha"])
+
+def list_repo_pr_urls(repo_name: str, state: str = "open") -> list:
+    """List the URLs of a repository's pull requests in the given state."""
+    github_token = os.getenv("GITHUB_TOKEN")
+    if not github_token:
+        raise ValueError("GitHub token not found in environment variables")
+    owner, repo = repo_name.split("/")
+    return PRFetcher(github_token, priority=BATCH).list_pull_request_urls(owner, repo, state)
+
+def print_history(pr_url: str, limit: int = 20) -> None:
+    """Print the PR's most recent analyses from the history store."""
+    parts = pr_url.rstrip('/').split('/')
+    repo, pr_number = f"{parts[-4]}/{parts[-3]}", int(parts[-1])
+    runs = get_history_store().runs_for_pr(repo, pr_number, limit)
+    if not runs:
+        print(f"No analyses of {repo}#{pr_number} recorded yet")
+        return
+    print(f"Analyses of {repo}#{pr_number}, newest first:")
+    for run in runs:
+        when = datetime.fromtimestamp(run["created_at"]).strftime("%Y-%m-%d %H:%M")
+        source = "cache" if run["cached"] else f"{run['analysis_seconds'] or 0:.1f}s"
+        print(f"  #{run['id']:<6} {when}  {run['head_sha'][:7]}  {run['mode']:<12} "
+              f"{run['prompt_tokens'] or 0:>7} + {run['completion_tokens'] or 0:>5} tokens  {source}")
+
+def print_fetch_timings(pr_data: dict) -> None:
+    """Print the per-call GitHub timings recorded while fetching the PR."""
+    timings = pr_data.get("fetch_timings", {})
+    source = " (cached snapshot)" if pr_data.get("from_cache") else ""
+    print(f"\nGitHub fetch: {timings.get('total_seconds', 0):.2f}s total{source}")
+    for call in timings.get("calls", []):
+        print(f"  {call['call']:<16} {call['status']}  {call['seconds']:.3f}s")
 
 def main():
     parser = argparse.ArgumentParser(description="Analyze a pull request using AI")
-    parser.add_argument("--pr-url", required=True, help="URL of the pull request to analyze")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--pr-url", help="URL of the pull request to analyze")
+    target.add_argument("--batch-file", help="File with one PR URL per line to analyze in batch mode")
+    target.add_argument("--repo", help="owner/repo whose pull requests to analyze in batch mode")
+    target.add_argument("--webhook", action="store_true",
+                        help="Serve GitHub pull_request webhooks and post a review for each push")
+    parser.add_argument("--state", choices=["open", "closed", "all"], default="open",
+                        help="PR state to analyze with --repo (default: open)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_BATCH_WORKERS,
+                        help=f"PRs analyzed concurrently in batch and webhook mode (default: {DEFAULT_BATCH_WORKERS})")
+    parser.add_argument("--port", type=int, default=int(os.getenv("WEBHOOK_PORT", DEFAULT_WEBHOOK_PORT)),
+                        help=f"Port the webhook server listens on (default: {DEFAULT_WEBHOOK_PORT})")
+    parser.add_argument("--output", default="pr_analysis.jsonl", help="JSONL file batch results are written to")
+    parser.add_argument("--resume", action="store_true", help="Skip PRs already completed in --output")
+    parser.add_argument("--fetch-mode", choices=FETCH_MODES, help="How to fetch the PR from GitHub (default: rest)")
+    parser.add_argument("--analysis-mode", choices=ANALYSIS_MODES,
+                        help="single prompt, or map_reduce to review chunks of files in parallel (default: single)")
+    parser.add_argument("--max-workers", type=int, help="Concurrent chunk reviews in map_reduce mode")
+    parser.add_argument("--no-cache", action="store_true", help="Always refetch the PR and call the model instead of using the caches")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only re-review files changed since the last analyzed commit of this PR")
+    parser.add_argument("--no-prune", action="store_true",
+                        help="Send every file's diff to the model, including lockfiles, generated and vendored files")
+    parser.add_argument("--no-history", action="store_true", help="Don't record this run in the analysis history store")
+    parser.add_argument("--history", action="store_true",
+                        help="List earlier analyses of --pr-url from the history store instead of analyzing it")
+    parser.add_argument("--structured", action="store_true", default=None,
+                        help="Ask the model for JSON findings (file, lines, severity, rule, suggestion) instead of markdown")
+    parser.add_argument("--min-severity", choices=SEVERITIES,
+                        help="Only show findings at least this severe (needs --structured)")
+    parser.add_argument("--stream", action="store_true", help="Print the analysis as it is generated")
+    parser.add_argument("--show-timings", action="store_true", help="Print per-call GitHub fetch timings")
+    parser.add_argument("--log-metrics", action="store_true", help="Log each pipeline stage's timing as JSON to stderr")
+    parser.add_argument("--metrics-file", default=os.getenv("PR_METRICS_FILE"),
+                        help="Write Prometheus-format metrics to this file when done")
     args = parser.parse_args()
     
+    if args.log_metrics:
+        logging.basicConfig(format="%(message)s")
+        logging.getLogger("pr_analyzer.metrics").setLevel(logging.INFO)
+    
+    try:
+        if args.webhook:
+            run_webhook_mode(args)
+        elif args.batch_file or args.repo:
+            run_batch_mode(args)
+        elif args.history:
+            print_history(args.pr_url)
+        else:
+            analyze_single(args)
+    finally:
+        if args.metrics_file:
+            metrics.write_prometheus(args.metrics_file)
+
+def min_severity_unsupported(args, agent) -> bool:
+    """Report --min-severity without structured findings, which a markdown review has no severities for."""
+    if args.min_severity and not agent.structured:
+        print("Error: --min-severity needs structured findings (--structured or PR_STRUCTURED_FINDINGS=1)")
+        return True
+    return False
+
+def analyze_single(args) -> None:
+    """Analyze the PR given by --pr-url and print the results."""
     try:
-        # Get PR data
-        pr_data = get_pr_data(args.pr_url)
-        
         # Initialize the agent and best practices processor
-        best_practices_processor = BestPracticesProcessor()
-        agent = PRAnalyzerAgent()
+        best_practices_processor = get_shared_processor()
+        agent = PRAnalyzerAgent(use_cache=not args.no_cache, mode=args.analysis_mode, max_workers=args.max_workers,
+                                practices_index=best_practices_processor.get_index(), prune=not args.no_prune,
+                                record_history=not args.no_history, structured=args.structured)
+        if min_severity_unsupported(args, agent):
+            return
         
-        # Analyze the PR
-        results = agent.analyze_pr(pr_data)
+        # Get PR data
+        pr_data = get_pr_data(args.pr_url, mode=args.fetch_mode, use_cache=not args.no_cache)
+        if args.show_timings:
+            print_fetch_timings(pr_data)
+            if not args.no_cache:
+                print(f"Snapshot cache: {get_snapshot_cache().stats}")
         
-        # Print results
+        # Analyze the PR and print results
         print("\nPR Analysis Results:")
         print("=" * 50)
-        print(results["analysis"])
+        if args.incremental:
+            results = apply_min_severity(
+                agent.analyze_pr_incremental(pr_data, AnalysisStateStore(), changed_files_since(pr_data)),
+                args.min_severity)
+            print(results["analysis"])
+            summary = results["incremental"]
+            print(f"\n(reviewed {len(summary['reviewed_files'])} changed files, reused findings for {summary['reused_files']})")
+        elif args.stream and not agent.structured:
+            stream = agent.stream_analysis(pr_data)
+            for delta in stream:
+                print(delta, end="", flush=True)
+            print()
+            results = stream.result
+            if args.show_timings and stream.time_to_first_token is not None:
+                print(f"\nTime to first token: {stream.time_to_first_token:.2f}s")
+        else:
+            # Structured findings are printed once complete, with or without --stream
+            results = apply_min_severity(agent.analyze_pr(pr_data), args.min_severity)
+            print(results["analysis"])
+        if results.get("cached"):
+            print("\n(served from the response cache)")
+        if results.get("findings") is not None:
+            print(f"({summarize_counts(results['findings'])})")
+        if results.get("structured_errors"):
+            print(f"(the model's JSON was malformed even after a repair: {'; '.join(results['structured_errors'])})")
+        pruning = results.get("pruning")
+        if pruning and (pruning["files_dropped"] or pruning["files_truncated"]):
+            print(f"(left {pruning['files_dropped']} files out of the prompt and truncated {pruning['files_truncated']}, "
+                  f"saving ~{pruning['tokens_saved']} tokens)")
+        dedup = results.get("dedup")
+        if dedup and dedup["groups"]:
+            print(f"(sent {dedup['groups']} changes repeated across files once, dropping {dedup['hunks_removed']} "
+                  f"duplicate hunks and ~{dedup['tokens_saved']} tokens)")
+        prompt_stats = results.get("prompt_stats") or {}
+        if prompt_stats.get("files_truncated") or prompt_stats.get("files_omitted"):
+            print(f"(over the prompt budget: truncated {len(prompt_stats['files_truncated'])} files, "
+                  f"left out {len(prompt_stats['files_omitted'])})")
+        if args.show_timings and prompt_stats:
+            print(f"Prompt: {prompt_stats['tokens']} tokens ({prompt_stats['tokenizer']} tokenizer)")
         
     except Exception as e:
         print(f"Error analyzing PR: {str(e)}")
 
+def run_batch_mode(args) -> None:
+    """Analyze every PR from --batch-file or --repo, streaming results to JSONL."""
+    try:
+        urls = read_pr_urls(args.batch_file) if args.batch_file else list_repo_pr_urls(args.repo, args.state)
+        best_practices_processor = get_shared_processor()
+        agent = PRAnalyzerAgent(use_cache=not args.no_cache, mode=args.analysis_mode, max_workers=args.max_workers,
+                                practices_index=best_practices_processor.get_index(), prune=not args.no_prune,
+                                record_history=not args.no_history, structured=args.structured)
+        if min_severity_unsupported(args, agent):
+            return
+        
+        # Long sweeps can be scraped while they run (PR_METRICS_PORT)
+        serve_metrics()
+        print(f"Analyzing {len(urls)} PRs with {args.workers} workers, writing to {args.output}")
+        summary = run_batch(
+            urls,
+            lambda url: get_pr_data(url, mode=args.fetch_mode, use_cache=not args.no_cache, priority=BATCH),
+            agent,
+            args.output,
+            workers=args.workers,
+            resume=args.resume,
+            min_severity=args.min_severity,
+        )
+        print_summary(summary)
+    
+    except Exception as e:
+        print(f"Error running batch: {str(e)}")
+
+def run_webhook_mode(args) -> None:
+    """Review PRs as their pull_request webhooks arrive until interrupted."""
+    # Imported here: it pulls in PyGithub, which the other CLI modes don't need
+    from utils.github import submit_analysis_review
+    
+    secret = os.getenv("GITHUB_WEBHOOK_SECRET")
+    if not secret:
+        print("Error: set GITHUB_WEBHOOK_SECRET to the secret configured on the GitHub webhook")
+        return
+    best_practices_processor = get_shared_processor()
+    agent = PRAnalyzerAgent(use_cache=not args.no_cache, mode=args.analysis_mode, max_workers=args.max_workers,
+                            practices_index=best_practices_processor.get_index(), prune=not args.no_prune,
+                            record_history=not args.no_history, structured=args.structured)
+    if min_severity_unsupported(args, agent):
+        return
+    service = WebhookService(
+        secret,
+        lambda url: get_pr_data(url, mode=args.fetch_mode, use_cache=not args.no_cache, priority=BATCH),
+        agent,
+        lambda url, pr_data, results: submit_analysis_review(url, pr_data, results, priority=BATCH),
+        workers=args.workers,
+        min_severity=args.min_severity,
+    ).start()
+    
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("pr_analyzer.webhook").setLevel(logging.INFO)
+    serve_metrics()
+    server = serve_webhooks(service, args.port)
+    print(f"Listening for webhooks on port {args.port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,135 @@
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Tuple
+from utils.diff_parser import CONTEXT, file_hunks
+
+# Longer sections are split into passages of about this many characters so a
+# single huge section can't crowd everything else out of the prompt.
+PASSAGE_CHARS = 1200
+DEFAULT_TOP_K = 5
+MAX_QUERY_TERMS = 200
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9_]*")
+CAMEL_CASE_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have if in into is it its not of on or "
+    "that the their then there these this to was were will with should must can may use "
+    "used using all any each other than also".split()
+)
+
+# Terms added to the query for each file extension, so language-specific
+# rules rank well even when the diff itself never names the language.
+EXTENSION_TERMS = {
+    ".js": "javascript js node",
+    ".jsx": "javascript js react",
+    ".mjs": "javascript js node module",
+    ".cjs": "javascript js node require",
+    ".ts": "typescript ts javascript",
+    ".tsx": "typescript ts react",
+    ".py": "python",
+    ".java": "java",
+    ".go": "go golang",
+    ".rb": "ruby",
+    ".sql": "sql query database",
+    ".json": "json config configuration",
+    ".yml": "yaml config configuration",
+    ".yaml": "yaml config configuration",
+    ".md": "documentation docs",
+    ".sh": "shell script bash",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase terms, breaking identifiers on camelCase and underscores."""
+    terms = []
+    for word in WORD_PATTERN.findall(text):
+        parts = [part for chunk in word.split("_") for part in CAMEL_CASE_PATTERN.findall(chunk)]
+        for term in [word] + parts if len(parts) > 1 else [word]:
+            term = term.lower()
+            if len(term) > 1 and term not in STOPWORDS:
+                terms.append(term)
+    return terms
+
+
+def _passages(section: Dict[str, Any]) -> List[str]:
+    """Split a section's paragraphs into passages, each prefixed with the heading."""
+    heading = section.get("heading", "")
+    passages: List[List[str]] = [[]]
+    size = 0
+    for paragraph in section.get("paragraphs", []):
+        if passages[-1] and size + len(paragraph) > PASSAGE_CHARS:
+            passages.append([])
+            size = 0
+        passages[-1].append(paragraph)
+        size += len(paragraph)
+    return ["\n".join(([heading] if heading else []) + passage) for passage in passages if passage or heading]
+
+
+class PracticesIndex:
+    """Offline BM25 index over best-practice passages grouped by section heading."""
+
+    def __init__(self, sections: List[Dict[str, Any]]):
+        self.passages: List[Dict[str, Any]] = []
+        for section in sections:
+            for text in _passages(section):
+                self.passages.append({"heading": section.get("heading", ""), "text": text})
+
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lengths: List[int] = []
+        for doc_id, passage in enumerate(self.passages):
+            terms = Counter(tokenize(passage["text"]))
+            self._lengths.append(sum(terms.values()))
+            for term, count in terms.items():
+                self._postings[term].append((doc_id, count))
+        self._average_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+
+    def _idf(self, term: str) -> float:
+        doc_count = len(self._postings.get(term, ()))
+        return math.log(1 + (len(self.passages) - doc_count + 0.5) / (doc_count + 0.5))
+
+    def search(self, query_terms: Counter, k: int = DEFAULT_TOP_K) -> List[Dict[str, Any]]:
+        """Return the ``k`` passages scoring highest for the weighted query terms."""
+        scores: Dict[int, float] = defaultdict(float)
+        for term, weight in query_terms.items():
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for doc_id, count in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc_id] / self._average_length)
+                scores[doc_id] += weight * idf * count * (BM25_K1 + 1) / (count + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [dict(self.passages[doc_id], score=round(score, 3)) for doc_id, score in ranked]
+
+    def retrieve_for_files(self, files: List[Dict[str, Any]], k: int = DEFAULT_TOP_K) -> List[Dict[str, Any]]:
+        """Find the practices most relevant to a set of changed files.
+
+        The query mixes language terms for each file extension, the words in
+        the file paths, and identifiers from the changed lines of each patch.
+        """
+        query: Counter = Counter()
+        for file in files:
+            filename = file.get("filename", "")
+            query.update(tokenize(EXTENSION_TERMS.get(os.path.splitext(filename)[1].lower(), "")) * 3)
+            query.update(tokenize(filename.replace("/", " ")))
+            changed_lines = [
+                line.text
+                for hunk in file_hunks(file)
+                for line in hunk.lines if line.kind != CONTEXT
+            ]
+            query.update(tokenize("\n".join(changed_lines)))
+
+        # Dampen repeated terms so one noisy identifier can't dominate the ranking
+        weighted = Counter({term: 1 + math.log(count) for term, count in query.most_common(MAX_QUERY_TERMS)})
+        return self.search(weighted, k)
+
+    def format_practices(self, passages: List[Dict[str, Any]]) -> str:
+        """Format retrieved passages for inclusion in a prompt."""
+        return "\n\n".join(passage["text"] for passage in passages)
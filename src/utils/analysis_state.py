@@ -0,0 +1,46 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+DEFAULT_STATE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pr-analyzer", "analysis_state")
+
+
+def pr_state_key(repo: str, pr_number: int) -> str:
+    """Build the state key for a PR, e.g. ``owner/repo#12``."""
+    return f"{repo}#{pr_number}"
+
+
+class AnalysisStateStore:
+    """Remembers, per PR, the last analyzed head SHA and the findings for each file.
+
+    Each PR's state is one small JSON document::
+
+        {"head_sha": "...", "file_findings": {"path": "markdown", ...},
+         "other_findings": {"path outside the PR": "markdown", ...}, "analysis": "..."}
+    """
+
+    def __init__(self, state_dir: Optional[str] = None):
+        self.state_dir = state_dir or os.getenv("PR_STATE_DIR", DEFAULT_STATE_DIR)
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.state_dir, f"{digest}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the stored state for a PR, if any."""
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, state: Dict[str, Any]) -> None:
+        """Replace the stored state for a PR."""
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
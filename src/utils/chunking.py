@@ -0,0 +1,58 @@
+from typing import Any, Dict, List
+from utils.diff_parser import file_hunks
+
+# Rough size of a token for code and English text; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate how many tokens a piece of text will use."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _split_file(file: Dict[str, Any], token_budget: int) -> List[Dict[str, Any]]:
+    """Break one oversized file into groups of whole hunks that fit the budget."""
+    groups: List[List[str]] = [[]]
+    used = 0
+    for hunk in file_hunks(file):
+        text = hunk.text()
+        size = estimate_tokens(text)
+        if groups[-1] and used + size > token_budget:
+            groups.append([])
+            used = 0
+        groups[-1].append(text)
+        used += size
+
+    return [
+        {**file, "patch": "\n".join(group), "part": index + 1, "parts": len(groups)}
+        for index, group in enumerate(groups)
+    ]
+
+
+def chunk_files(files: List[Dict[str, Any]], token_budget: int) -> List[List[Dict[str, Any]]]:
+    """Pack per-file patches into chunks that each stay under ``token_budget``.
+
+    Files are kept whole where possible. A file larger than the budget is
+    split along hunk boundaries, and its pieces carry ``part``/``parts`` so
+    the prompt can say which part of the file it is looking at. A single
+    hunk larger than the budget is never split.
+    """
+    chunks: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    used = 0
+
+    for file in files:
+        patch = file.get("patch") or ""
+        pieces = _split_file(file, token_budget) if estimate_tokens(patch) > token_budget else [file]
+        for piece in pieces:
+            size = estimate_tokens(piece.get("patch") or "") + estimate_tokens(piece["filename"])
+            if current and used + size > token_budget:
+                chunks.append(current)
+                current = []
+                used = 0
+            current.append(piece)
+            used += size
+
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,128 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# PyGithub and OpenAI (with httpx) take most of a cold start to import, so
+# they are imported when their first client is created
+if TYPE_CHECKING:
+    from github import Github
+    from openai import OpenAI
+
+# Connection pool sizes, timeouts (seconds) and retry settings, overridable from the
+# environment. They are read when a client is created rather than at import, so
+# values from .env apply however early this module was imported.
+DEFAULT_SETTINGS = {
+    "GITHUB_POOL_SIZE": 16,
+    "GITHUB_TIMEOUT": 30.0,
+    "GITHUB_RETRIES": 3,
+    "OPENAI_POOL_SIZE": 16,
+    "OPENAI_TIMEOUT": 120.0,
+    "OPENAI_RETRIES": 3,
+    "RETRY_BACKOFF": 0.5,
+}
+
+# Transient server errors worth retrying; 403/429 rate limits are left to the caller
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_lock = threading.Lock()
+_github_sessions: Dict[str, requests.Session] = {}
+_github_clients: Dict[str, "Github"] = {}
+_openai_clients: Dict[Optional[str], "OpenAI"] = {}
+
+
+def setting(name: str):
+    """One of ``DEFAULT_SETTINGS``, from the environment if set there."""
+    default = DEFAULT_SETTINGS[name]
+    return type(default)(os.getenv(name, default))
+
+
+def github_retry() -> Retry:
+    """Retry policy for GitHub requests: exponential backoff on connection errors and transient 5xx.
+
+    Retry-After is not honoured here: urllib3 would otherwise retry (and
+    sleep through) a 429 inside the request, hiding it from the scheduler.
+    """
+    return Retry(
+        total=setting("GITHUB_RETRIES"),
+        backoff_factor=setting("RETRY_BACKOFF"),
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+
+
+def create_github_session(token: str, pool_size: Optional[int] = None) -> requests.Session:
+    """Create a keep-alive session authenticated against the GitHub REST API.
+
+    Idempotent requests are retried as ``github_retry`` describes.
+    """
+    pool_size = pool_size or setting("GITHUB_POOL_SIZE")
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=github_retry())
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    })
+    if token:
+        session.headers["Authorization"] = f"Bearer {token}"
+    return session
+
+
+def get_github_session(token: Optional[str] = None) -> requests.Session:
+    """Return the shared GitHub HTTP session for a token (default: GITHUB_TOKEN)."""
+    token = token if token is not None else os.getenv("GITHUB_TOKEN", "")
+    with _lock:
+        if token not in _github_sessions:
+            _github_sessions[token] = create_github_session(token)
+        return _github_sessions[token]
+
+
+def get_github_client(token: Optional[str] = None) -> "Github":
+    """Return the shared PyGithub client for a token (default: GITHUB_TOKEN)."""
+    from github import Auth, Github
+
+    token = token if token is not None else os.getenv("GITHUB_TOKEN", "")
+    with _lock:
+        if token not in _github_clients:
+            _github_clients[token] = Github(
+                auth=Auth.Token(token) if token else None,
+                base_url=os.getenv("GITHUB_API_URL", "https://api.github.com"),
+                timeout=int(setting("GITHUB_TIMEOUT")),
+                # Not GithubRetry, which sleeps through 403/429 rate limits inside the request
+                retry=github_retry(),
+                pool_size=setting("GITHUB_POOL_SIZE"),
+            )
+        return _github_clients[token]
+
+
+def get_openai_client(api_key: Optional[str] = None) -> "OpenAI":
+    """Return the shared OpenAI client for an API key (default: OPENAI_API_KEY).
+
+    The client keeps a pool of keep-alive connections and applies the
+    configured timeout and retry/backoff to every call.
+    """
+    import httpx
+    from openai import OpenAI
+
+    api_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY")
+    with _lock:
+        if api_key not in _openai_clients:
+            pool_size, timeout = setting("OPENAI_POOL_SIZE"), setting("OPENAI_TIMEOUT")
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                timeout=timeout,
+            )
+            _openai_clients[api_key] = OpenAI(
+                api_key=api_key,
+                base_url=os.getenv("OPENAI_BASE_URL") or None,
+                timeout=timeout,
+                max_retries=setting("OPENAI_RETRIES"),
+                http_client=http_client,
+            )
+        return _openai_clients[api_key]
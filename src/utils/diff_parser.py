@@ -0,0 +1,229 @@
+import codecs
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+ADDED = "+"
+REMOVED = "-"
+CONTEXT = " "
+
+# Where a pr_data["files"] entry keeps its parsed hunks (see file_hunks); never serialized
+HUNKS_KEY = "_hunks"
+
+HUNK_HEADER_PATTERN = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+GIT_HEADER_PREFIX = "diff --git "
+# Git quotes paths with special characters C-style, non-ASCII bytes as octal escapes
+QUOTED_PATH = r'"(?:[^"\\]|\\.)*"'
+QUOTED_NEW_PATH_PATTERN = re.compile(rf"^(?:{QUOTED_PATH}|.+?) ({QUOTED_PATH})$")
+QUOTED_OLD_PATH_PATTERN = re.compile(rf"^{QUOTED_PATH} b/(.+)$")
+
+
+class DiffLine:
+    """One line of a hunk.
+
+    ``old_no``/``new_no`` are the line numbers on each side (None on the side
+    the line doesn't exist), and ``position`` is GitHub's diff position: the
+    line's offset within the file's patch, counting from 1 just below the
+    first hunk header.
+    """
+
+    __slots__ = ("kind", "old_no", "new_no", "position", "text")
+
+    def __init__(self, kind: str, old_no: Optional[int], new_no: Optional[int], position: int, text: str):
+        self.kind = kind
+        self.old_no = old_no
+        self.new_no = new_no
+        self.position = position
+        self.text = text
+
+    def __repr__(self) -> str:
+        return f"DiffLine({self.kind!r}, {self.old_no}, {self.new_no}, {self.text!r})"
+
+
+class Hunk:
+    """A parsed ``@@`` hunk of one file."""
+
+    __slots__ = ("file", "header", "old_start", "old_count", "new_start", "new_count", "lines")
+
+    def __init__(self, file: str, header: str, old_start: int, old_count: int, new_start: int, new_count: int):
+        self.file = file
+        self.header = header
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        self.lines: List[DiffLine] = []
+
+    def text(self) -> str:
+        """Reassemble the hunk as unified diff text."""
+        return "\n".join([self.header] + [line.kind + line.text for line in self.lines])
+
+    def __repr__(self) -> str:
+        return f"Hunk({self.file!r}, {self.header!r}, {len(self.lines)} lines)"
+
+
+def unquote_path(path: str) -> str:
+    """Undo git's C-style quoting of a path, e.g. ``"b/caf\\303\\251.py"`` to ``b/café.py``."""
+    if len(path) < 2 or not (path.startswith('"') and path.endswith('"')):
+        return path
+    # The octal escapes are the path's UTF-8 bytes
+    return codecs.escape_decode(path[1:-1].encode("utf-8"))[0].decode("utf-8", "replace")
+
+
+def git_header_path(line: str) -> Optional[str]:
+    """The new path named by a ``diff --git a/<old> b/<new>`` line (None for other lines).
+
+    Unquoted paths containing " b/" can only be told apart when old and new
+    are the same; for renames the ``rename to`` and ``+++`` lines that
+    follow name the path (see ``header_path``).
+    """
+    if not line.startswith(GIT_HEADER_PREFIX):
+        return None
+    rest = line[len(GIT_HEADER_PREFIX):]
+    quoted = QUOTED_NEW_PATH_PATTERN.match(rest)
+    if quoted:
+        return unquote_path(quoted.group(1))[2:]
+    quoted = QUOTED_OLD_PATH_PATTERN.match(rest)
+    if quoted:
+        return quoted.group(1)
+    # "a/<path> b/<path>" for an unchanged path, whatever the path contains
+    length = (len(rest) - 5) // 2
+    if rest[:length + 2] == f"a/{rest[length + 5:]}" and rest[length + 2:length + 5] == " b/":
+        return rest[length + 5:]
+    return rest.rsplit(" b/", 1)[1] if " b/" in rest else None
+
+
+def header_path(line: str) -> Optional[str]:
+    """The new path on a ``+++ b/<path>`` or ``rename to <path>`` line of a file's diff header."""
+    if line.startswith("+++ "):
+        # Git ends the line with a tab when the path has a space
+        path = unquote_path(line[4:].removesuffix("\t"))
+        if path == "/dev/null":
+            return None
+        return path[2:] if path.startswith("b/") else path
+    if line.startswith("rename to "):
+        return unquote_path(line[len("rename to "):])
+    return None
+
+
+def iter_lines(text: str) -> Iterator[str]:
+    """Yield the lines of a string without building a list of them."""
+    start = 0
+    while True:
+        end = text.find("\n", start)
+        if end == -1:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+def _parse(lines: Iterable[str], file: str = "") -> Iterator[Hunk]:
+    """Turn diff lines into hunks in one pass, holding at most one hunk at a time.
+
+    Understands the ``File: <path>`` / ``Changes: <patch>`` blocks that
+    ``get_pr_data`` builds as well as ``diff --git`` headers.
+    """
+    hunk = None
+    position = 0
+    old_no = new_no = 0
+
+    for line in lines:
+        if line.startswith("File: "):
+            if hunk:
+                yield hunk
+            hunk, file, position = None, line[len("File: "):], 0
+            continue
+        if line.startswith("Changes: "):
+            line = line[len("Changes: "):]
+        git_path = git_header_path(line)
+        if git_path is not None:
+            if hunk:
+                yield hunk
+            hunk, file, position = None, git_path, 0
+            continue
+
+        header = line.startswith("@@") and HUNK_HEADER_PATTERN.match(line)
+        if header:
+            if hunk:
+                yield hunk
+                # Hunk headers after the first count towards the diff position
+                position += 1
+            old_no, new_no = int(header.group(1)), int(header.group(3))
+            hunk = Hunk(
+                file, line, old_no, int(header.group(2) or 1), new_no, int(header.group(4) or 1),
+            )
+            continue
+        if hunk is None:
+            # File metadata (index, ---/+++ lines, "None" for binary files); +++ has the exact path
+            file = header_path(line) or file
+            continue
+
+        kind = line[:1]
+        if kind == "\\":
+            # "\ No newline at end of file" still occupies a diff position
+            position += 1
+            continue
+        position += 1
+        if kind == ADDED:
+            hunk.lines.append(DiffLine(ADDED, None, new_no, position, line[1:]))
+            new_no += 1
+        elif kind == REMOVED:
+            hunk.lines.append(DiffLine(REMOVED, old_no, None, position, line[1:]))
+            old_no += 1
+        else:
+            hunk.lines.append(DiffLine(CONTEXT, old_no, new_no, position, line[1:]))
+            old_no += 1
+            new_no += 1
+
+    if hunk:
+        yield hunk
+
+
+def parse_diff(changes: str) -> Iterator[Hunk]:
+    """Parse the combined ``changes`` text of ``pr_data`` (or any unified diff) into hunks."""
+    return _parse(iter_lines(changes))
+
+
+def parse_patch(patch: Optional[str], file: str) -> Iterator[Hunk]:
+    """Parse a single file's patch, as returned per file by the GitHub API."""
+    if not patch:
+        return iter(())
+    return _parse(iter_lines(patch), file)
+
+
+def parse_files(files: List[Dict[str, Any]]) -> Iterator[Hunk]:
+    """Parse the per-file patches in ``pr_data["files"]`` into hunks, file by file."""
+    for file in files:
+        yield from file_hunks(file)
+
+
+def file_hunks(file: Dict[str, Any]) -> List[Hunk]:
+    """The hunks of a ``pr_data["files"]`` entry, parsed on first use and kept on the entry.
+
+    Pruning, deduplication, prompt budgeting, practice retrieval and comment
+    positioning all read the same hunks this way, so one analysis parses each
+    patch once. Copies of the entry (``{**file, ...}``) share the parsed hunks
+    while their patch and filename are unchanged; callers must not modify them.
+    """
+    patch, filename = file.get("patch"), file["filename"]
+    cached = file.get(HUNKS_KEY)
+    if cached is not None and cached[0] is patch and cached[1] == filename:
+        return cached[2]
+    hunks = list(parse_patch(patch, filename))
+    file[HUNKS_KEY] = (patch, filename, hunks)
+    return hunks
+
+
+def without_hunks(pr_data: Dict[str, Any], copy: bool = False) -> Dict[str, Any]:
+    """A shallow copy of ``pr_data`` whose files don't carry parsed hunks, for serializing.
+
+    Unless ``copy`` is set, ``pr_data`` itself is returned when no file has
+    hunks yet; a copy is safe to serialize on another thread while the
+    caller's files go on gaining them.
+    """
+    if not copy and not any(HUNKS_KEY in file for file in pr_data.get("files") or ()):
+        return pr_data
+    if pr_data.get("files") is None:
+        return dict(pr_data)
+    files = [{key: value for key, value in file.items() if key != HUNKS_KEY} for file in pr_data["files"]]
+    return {**pr_data, "files": files}
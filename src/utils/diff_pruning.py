@@ -0,0 +1,160 @@
+import os
+import re
+from fnmatch import translate
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.chunking import estimate_tokens
+from utils.diff_parser import file_hunks
+
+# Files whose diffs are noise to a reviewer: lockfiles, bundles, snapshots, vendored and generated code
+DEFAULT_EXCLUDE_GLOBS = (
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "*.lock", "go.sum",
+    "*.min.js", "*.min.css", "*.bundle.js", "*.map",
+    "*.snap", "__snapshots__/*", "*/__snapshots__/*",
+    "vendor/*", "*/vendor/*", "node_modules/*", "*/node_modules/*", "third_party/*", "*/third_party/*",
+    "dist/*", "*/dist/*",
+    "*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.generated.*", "*.g.dart",
+)
+
+# Markers generators put at the top of files they write
+GENERATED_MARKERS = ("@generated", "do not edit", "code generated by", "auto-generated", "autogenerated")
+GENERATED_SCAN_LINES = 10
+# Added lines this long only come from minifiers and bundlers
+MINIFIED_LINE_LENGTH = 1000
+
+# Files with larger diffs are dropped outright (bytes)
+DEFAULT_DROP_FILE_BYTES = 500_000
+# Larger diffs are cut to their leading hunks; ~one map_reduce chunk (bytes)
+DEFAULT_MAX_FILE_BYTES = 48_000
+
+
+def _env_globs(name: str) -> Tuple[str, ...]:
+    return tuple(glob.strip() for glob in os.getenv(name, "").split(",") if glob.strip())
+
+
+@lru_cache(maxsize=32)
+def _glob_pattern(globs: Tuple[str, ...]) -> re.Pattern:
+    """One regex matching any of the globs, so each path is tested once."""
+    return re.compile("|".join(translate(glob) for glob in globs) or "(?!)")
+
+
+def _matches(path: str, globs: Tuple[str, ...]) -> bool:
+    pattern = _glob_pattern(globs)
+    return bool(pattern.match(path) or pattern.match(path.rsplit("/", 1)[-1]))
+
+
+class DiffPruner:
+    """Drops diff content that costs prompt tokens without helping the review.
+
+    Files matching the exclude globs, files without a textual diff (binary),
+    generated or minified files and files over ``drop_file_bytes`` are
+    removed from the prompt and listed as one-line summaries instead. Files
+    over ``max_file_bytes`` keep only their leading hunks. Files matching
+    ``include_globs`` are only dropped when they have no textual diff.
+    """
+
+    def __init__(self, exclude_globs: Optional[Tuple[str, ...]] = None,
+                 include_globs: Optional[Tuple[str, ...]] = None,
+                 drop_file_bytes: Optional[int] = None, max_file_bytes: Optional[int] = None):
+        """
+        Defaults come from PR_PRUNE_EXCLUDE / PR_PRUNE_INCLUDE (comma-separated
+        globs added to the built-in ones), PR_PRUNE_DROP_BYTES and
+        PR_PRUNE_MAX_FILE_BYTES; a byte limit of 0 disables it.
+        """
+        self.exclude_globs = DEFAULT_EXCLUDE_GLOBS + (exclude_globs if exclude_globs is not None else _env_globs("PR_PRUNE_EXCLUDE"))
+        self.include_globs = include_globs if include_globs is not None else _env_globs("PR_PRUNE_INCLUDE")
+        self.drop_file_bytes = drop_file_bytes if drop_file_bytes is not None else int(
+            os.getenv("PR_PRUNE_DROP_BYTES", DEFAULT_DROP_FILE_BYTES))
+        self.max_file_bytes = max_file_bytes if max_file_bytes is not None else int(
+            os.getenv("PR_PRUNE_MAX_FILE_BYTES", DEFAULT_MAX_FILE_BYTES))
+
+    def drop_reason(self, file: Dict[str, Any]) -> Optional[str]:
+        """Return why a file should be left out of the prompt, or None to keep it."""
+        path = file["filename"]
+        patch = file.get("patch")
+        # Checked before the include globs: there is nothing to prompt with either way
+        if not patch:
+            return "binary or no textual diff"
+        if _matches(path, self.include_globs):
+            return None
+        if _matches(path, self.exclude_globs):
+            return "lockfile, vendored, bundled or generated path"
+        if self.drop_file_bytes and len(patch.encode("utf-8")) > self.drop_file_bytes:
+            return f"diff larger than {self.drop_file_bytes // 1000} KB"
+
+        head = patch[:4000].lower().split("\n", GENERATED_SCAN_LINES)[:GENERATED_SCAN_LINES]
+        if any(marker in line for line in head for marker in GENERATED_MARKERS):
+            return "generated file"
+        if any(len(line) > MINIFIED_LINE_LENGTH for line in patch.split("\n") if line.startswith("+")):
+            return "minified content"
+        return None
+
+    def _truncate(self, file: Dict[str, Any]) -> Dict[str, Any]:
+        """Keep the leading hunks of a file's patch that fit ``max_file_bytes``."""
+        kept: List[str] = []
+        used = 0
+        hunks = file_hunks(file)
+        for hunk in hunks:
+            text = hunk.text()
+            size = len(text.encode("utf-8")) + 1
+            if kept and used + size > self.max_file_bytes:
+                break
+            kept.append(text)
+            used += size
+        return {**file, "patch": "\n".join(kept), "truncated": {"hunks": len(kept), "of": len(hunks)}}
+
+    def prune(self, pr_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Return a copy of ``pr_data`` trimmed for prompting.
+
+        The copy's "files" and "changes" hold only the kept (possibly
+        truncated) diffs, "pruned" lists the dropped files with their reason,
+        and "pruning" reports how many files were dropped or truncated and
+        roughly how many prompt tokens that saved. ``pr_data`` is unchanged.
+        """
+        if "files" not in pr_data:
+            return pr_data
+
+        kept, pruned = [], []
+        truncated = 0
+        for file in pr_data["files"]:
+            reason = self.drop_reason(file)
+            if reason:
+                pruned.append({
+                    "filename": file["filename"],
+                    "status": file.get("status"),
+                    "additions": file.get("additions", 0),
+                    "deletions": file.get("deletions", 0),
+                    "reason": reason,
+                })
+            elif self.max_file_bytes and len((file.get("patch") or "").encode("utf-8")) > self.max_file_bytes:
+                kept.append(self._truncate(file))
+                truncated += 1
+            else:
+                kept.append(file)
+
+        changes = []
+        for file in kept:
+            note = f" (first {file['truncated']['hunks']} of {file['truncated']['of']} hunks)" if "truncated" in file else ""
+            changes.append(f"File: {file['filename']}{note}")
+            changes.append(f"Changes: {file['patch']}")
+        changes = "\n".join(changes)
+        summary = format_pruned(pruned)
+
+        tokens_saved = estimate_tokens(pr_data.get("changes", "")) - estimate_tokens(changes) - estimate_tokens(summary)
+        return {
+            **pr_data,
+            "files": kept,
+            "changes": changes,
+            "pruned": pruned,
+            "pruning": {"files_dropped": len(pruned), "files_truncated": truncated, "tokens_saved": max(tokens_saved, 0)},
+        }
+
+
+def format_pruned(pruned: List[Dict[str, Any]]) -> str:
+    """One line per file left out of the prompt."""
+    return "\n".join(
+        f"- {file['filename']} ({file['status']}, +{file['additions']}/-{file['deletions']}): "
+        f"diff omitted, {file['reason']}"
+        for file in pruned
+    )
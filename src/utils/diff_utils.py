@@ -1,81 +1,75 @@
+import html
+from itertools import zip_longest
+from typing import Iterable, List, Optional
 import streamlit as st
+from utils.diff_parser import ADDED, REMOVED, DiffLine, Hunk
 
-def parse_git_diff(changes: str) -> tuple:
-    """Parse git diff output into left and right sides."""
-    lines = changes.split('\n')
-    left_lines = []
-    right_lines = []
-    current_left = []
-    current_right = []
-    
-    for line in lines:
-        if line.startswith('@@'):
-            # Flush current buffers if they exist
-            if current_left or current_right:
-                left_lines.append(current_left)
-                right_lines.append(current_right)
-                current_left = []
-                current_right = []
-            # Add the diff header to both sides
-            left_lines.append([line])
-            right_lines.append([line])
-        elif line.startswith('-'):
-            current_left.append(line)
-        elif line.startswith('+'):
-            current_right.append(line)
+def _pair_lines(hunk: Hunk):
+    """Pair a hunk's lines into (left, right) rows for a side-by-side view.
+
+    Runs of removed and added lines are lined up against each other, with the
+    shorter run padded by None; context lines appear on both sides.
+    """
+    removed: List[DiffLine] = []
+    added: List[DiffLine] = []
+    for line in hunk.lines:
+        if line.kind == REMOVED:
+            removed.append(line)
+        elif line.kind == ADDED:
+            added.append(line)
         else:
-            # Context line, add to both sides
-            if current_left or current_right:
-                # Pad the shorter side with empty lines
-                while len(current_left) < len(current_right):
-                    current_left.append('')
-                while len(current_right) < len(current_left):
-                    current_right.append('')
-                left_lines.append(current_left)
-                right_lines.append(current_right)
-                current_left = []
-                current_right = []
-            left_lines.append([line])
-            right_lines.append([line])
-    
-    # Flush any remaining buffers
-    if current_left or current_right:
-        while len(current_left) < len(current_right):
-            current_left.append('')
-        while len(current_right) < len(current_left):
-            current_right.append('')
-        left_lines.append(current_left)
-        right_lines.append(current_right)
-    
-    return left_lines, right_lines
+            if removed or added:
+                yield from zip_longest(removed, added)
+                removed, added = [], []
+            yield line, line
+    if removed or added:
+        yield from zip_longest(removed, added)
+
+def _cell(line: Optional[DiffLine], number: Optional[int], changed_class: str) -> str:
+    if line is None:
+        return '<td class="diff-line diff-empty"></td>'
+    css_class = changed_class if line.kind != " " else "diff-context"
+    number_html = f'<span class="diff-line-no">{number}</span>' if number is not None else ''
+    return f'<td class="diff-line {css_class}">{number_html}{html.escape(line.text)}</td>'
 
-def format_side_by_side_diff(left_lines: list, right_lines: list) -> str:
-    """Format the diff lines into a side-by-side HTML table."""
-    html = ['<div class="diff-container">']
-    html.append('<table class="diff-table">')
+def format_side_by_side_diff(hunks: Iterable[Hunk]) -> str:
+    """Format parsed diff hunks into a side-by-side HTML table."""
+    html_parts = ['<div class="diff-container">']
+    html_parts.append('<table class="diff-table">')
     
-    for left_chunk, right_chunk in zip(left_lines, right_lines):
-        max_lines = max(len(left_chunk), len(right_chunk))
-        for i in range(max_lines):
-            left_line = left_chunk[i] if i < len(left_chunk) else ''
-            right_line = right_chunk[i] if i < len(right_chunk) else ''
-            
-            # Determine line colors and background
-            left_class = 'diff-del' if left_line.startswith('-') else 'diff-context'
-            right_class = 'diff-ins' if right_line.startswith('+') else 'diff-context'
-            
-            # Remove the +/- prefix for display
-            left_display = left_line[1:] if left_line.startswith('-') else left_line
-            right_display = right_line[1:] if right_line.startswith('+') else right_line
-            
-            html.append('<tr>')
-            html.append(f'<td class="diff-line {left_class}">{left_display}</td>')
-            html.append(f'<td class="diff-line {right_class}">{right_display}</td>')
-            html.append('</tr>')
+    current_file = None
+    for hunk in hunks:
+        if hunk.file != current_file:
+            current_file = hunk.file
+            html_parts.append(f'<tr><td class="diff-file" colspan="2">{html.escape(hunk.file)}</td></tr>')
+        html_parts.append(f'<tr><td class="diff-hunk" colspan="2">{html.escape(hunk.header)}</td></tr>')
+        
+        for left, right in _pair_lines(hunk):
+            html_parts.append('<tr>')
+            html_parts.append(_cell(left, left.old_no if left else None, 'diff-del'))
+            html_parts.append(_cell(right, right.new_no if right else None, 'diff-ins'))
+            html_parts.append('</tr>')
     
-    html.append('</table>')
-    html.append('</div>')
-    return '\n'.join(html)
+    html_parts.append('</table>')
+    html_parts.append('</div>')
+    return '\n'.join(html_parts)
+
+def paginate_hunks(hunks: Iterable[Hunk], page_lines: int) -> List[List[Hunk]]:
+    """Group hunks into pages of roughly ``page_lines`` diff lines each.
+
+    Pages break between hunks, so a single hunk longer than a page gets a
+    page of its own.
+    """
+    pages: List[List[Hunk]] = [[]]
+    used = 0
+    for hunk in hunks:
+        size = len(hunk.lines) + 1
+        if pages[-1] and used + size > page_lines:
+            pages.append([])
+            used = 0
+        pages[-1].append(hunk)
+        used += size
+    return pages if pages[0] else []
 
 def apply_diff_styles(st_instance=None):
     """Apply custom CSS for the diff table."""
@@ -120,5 +114,20 @@ def apply_diff_styles(st_instance=None):
         .diff-context {
             color: #2d3748;
         }
+        .diff-file {
+            background-color: #edf2f7;
+            font-weight: 600;
+            padding: 4px 8px;
+        }
+        .diff-hunk {
+            color: #718096;
+            background-color: #f7fafc;
+        }
+        .diff-line-no {
+            display: inline-block;
+            min-width: 3em;
+            color: #a0aec0;
+            user-select: none;
+        }
         </style>
     """, unsafe_allow_html=True) 
\ No newline at end of file
@@ -0,0 +1,210 @@
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+SEVERITIES = ("critical", "major", "minor", "info")
+SEVERITY_RANK = {severity: rank for rank, severity in enumerate(SEVERITIES)}
+DEFAULT_SEVERITY = "minor"
+# Field order of a packed finding (see pack_findings); the file is the dict key
+PACKED_FIELDS = ("start_line", "end_line", "severity", "rule", "message", "suggestion")
+
+OUTPUT_INSTRUCTIONS = """Respond with only a JSON object, no markdown around it, in this shape:
+{"summary": "<overall assessment in a few sentences>",
+ "findings": [{"file": "<path of a changed file>", "start_line": <first line, in the new version of the file>,
+   "end_line": <last line>, "severity": "critical" | "major" | "minor" | "info",
+   "rule": "<the best practice it violates>", "message": "<the issue>",
+   "suggestion": "<how to fix it, with a short code example if useful>"}]}
+Use null line numbers for findings about a whole file and an empty "findings" list if there are no issues."""
+
+REPAIR_PROMPT = """Your previous response could not be used: {error}.
+
+Previous response:
+{response}
+
+Return the same review as only a JSON object in this shape, with nothing else:
+{{"summary": "...", "findings": [{{"file": "...", "start_line": 1, "end_line": 1, "severity": "minor", "rule": "...", "message": "...", "suggestion": "..."}}]}}"""
+
+# Longest previous response quoted back in a repair prompt
+MAX_REPAIR_CHARS = 12000
+
+FENCE_PATTERN = re.compile(r"^```(?:json)?\s*|\s*```$")
+TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+
+
+class FindingsError(ValueError):
+    """A structured response that doesn't match the findings schema."""
+
+
+def _json_text(text: str) -> str:
+    """The JSON object in a response, without code fences or text around it."""
+    text = FENCE_PATTERN.sub("", text.strip())
+    start, end = text.find("{"), text.rfind("}")
+    return text[start:end + 1] if start != -1 and end > start else text
+
+
+def _line(value: Any) -> Optional[int]:
+    try:
+        line = int(value)
+    except (TypeError, ValueError):
+        return None
+    return line if line > 0 else None
+
+
+def _finding(item: Any, index: int) -> Dict[str, Any]:
+    """Validate one finding, coercing what can be coerced (severity case, numeric strings)."""
+    if not isinstance(item, dict):
+        raise FindingsError(f"finding {index} is not an object")
+    file, message = item.get("file"), item.get("message")
+    if not isinstance(file, str) or not file.strip() or not message:
+        raise FindingsError(f'finding {index} needs a "file" and a "message"')
+    start, end = _line(item.get("start_line")), _line(item.get("end_line"))
+    start, end = start or end, end or start
+    if start and end < start:
+        start, end = end, start
+    severity = str(item.get("severity") or "").strip().lower()
+    return {
+        "file": file.strip().strip("`"),
+        "start_line": start,
+        "end_line": end,
+        "severity": severity if severity in SEVERITY_RANK else DEFAULT_SEVERITY,
+        "rule": str(item.get("rule") or "").strip(),
+        "message": str(message).strip(),
+        "suggestion": str(item.get("suggestion") or "").strip(),
+    }
+
+
+def parse_findings(text: str) -> Dict[str, Any]:
+    """Validate a structured response into ``{"summary", "findings"}``.
+
+    Code fences, text around the object and trailing commas are tolerated;
+    anything else that doesn't fit the schema raises ``FindingsError``.
+    """
+    candidate = _json_text(text or "")
+    try:
+        data = json.loads(candidate)
+    except ValueError:
+        try:
+            data = json.loads(TRAILING_COMMA_PATTERN.sub(r"\1", candidate))
+        except ValueError as e:
+            raise FindingsError(f"it is not valid JSON ({e})") from None
+    if not isinstance(data, dict) or not isinstance(data.get("findings"), list):
+        raise FindingsError('expected an object with a "findings" list')
+    return {
+        "summary": str(data.get("summary") or "").strip(),
+        "findings": [_finding(item, index) for index, item in enumerate(data["findings"])],
+    }
+
+
+def repair_prompt(response: str, error: FindingsError) -> str:
+    """A short prompt asking the model to fix its own malformed response (the PR isn't resent)."""
+    return REPAIR_PROMPT.format(error=error, response=(response or "")[:MAX_REPAIR_CHARS])
+
+
+def index_by_basename(filenames: Iterable[str]) -> Dict[str, List[str]]:
+    by_basename: Dict[str, List[str]] = {}
+    for filename in filenames:
+        by_basename.setdefault(filename.rsplit("/", 1)[-1], []).append(filename)
+    return by_basename
+
+
+def resolve_path(path: str, by_basename: Dict[str, List[str]]) -> Optional[str]:
+    """The PR file ``path`` refers to: an exact name, or a unique path suffix."""
+    path = path.strip().removeprefix("./")
+    candidates = by_basename.get(path.rsplit("/", 1)[-1], [])
+    if path in candidates:
+        return path
+    candidates = [name for name in candidates if name.endswith("/" + path)]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def resolve_paths(findings: List[Dict[str, Any]], filenames: Iterable[str]) -> List[Dict[str, Any]]:
+    """Map paths the model shortened (e.g. to a base name) back to the PR's file names."""
+    by_basename = index_by_basename(filenames)
+    return [{**finding, "file": resolve_path(finding["file"], by_basename) or finding["file"]} for finding in findings]
+
+
+def sort_key(finding: Dict[str, Any]) -> tuple:
+    return (SEVERITY_RANK[finding["severity"]], finding["file"], finding["start_line"] or 0)
+
+
+def merge_findings(groups: Iterable[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Combine findings from several chunks, dropping repeats, most severe first."""
+    merged = {}
+    for findings in groups:
+        for finding in findings:
+            key = (finding["file"], finding["start_line"], finding["end_line"], finding["message"].lower())
+            merged.setdefault(key, finding)
+    return sorted(merged.values(), key=sort_key)
+
+
+def filter_findings(findings: List[Dict[str, Any]], min_severity: Optional[str] = None,
+                    files: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """Findings at least as severe as ``min_severity``, optionally only on ``files``."""
+    limit = SEVERITY_RANK[min_severity] if min_severity else len(SEVERITIES)
+    names = set(files) if files is not None else None
+    return [finding for finding in findings
+            if SEVERITY_RANK[finding["severity"]] <= limit and (names is None or finding["file"] in names)]
+
+
+def apply_min_severity(results: Dict[str, Any], min_severity: Optional[str]) -> Dict[str, Any]:
+    """Keep only an analysis result's findings at least as severe as ``min_severity``, re-rendering the review."""
+    if not min_severity or results.get("findings") is None:
+        return results
+    findings = filter_findings(results["findings"], min_severity)
+    return {**results, "findings": findings, "analysis": render_markdown(results["summary"], findings)}
+
+
+def group_by_file(findings: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for finding in findings:
+        grouped.setdefault(finding["file"], []).append(finding)
+    return grouped
+
+
+def pack_findings(findings: List[Dict[str, Any]]) -> Dict[str, List[list]]:
+    """Compact per-file form for caches and state: ``{file: [[start, end, severity, rule, message, suggestion]]}``."""
+    return {file: [[finding[field] for field in PACKED_FIELDS] for finding in items]
+            for file, items in group_by_file(findings).items()}
+
+
+def unpack_findings(packed: Dict[str, List[list]]) -> List[Dict[str, Any]]:
+    return [{"file": file, **dict(zip(PACKED_FIELDS, values))} for file, items in packed.items() for values in items]
+
+
+def location(finding: Dict[str, Any]) -> str:
+    """``path:line`` or ``path:start-end`` (just the path for whole-file findings)."""
+    if not finding["start_line"]:
+        return finding["file"]
+    if finding["end_line"] and finding["end_line"] != finding["start_line"]:
+        return f"{finding['file']}:{finding['start_line']}-{finding['end_line']}"
+    return f"{finding['file']}:{finding['start_line']}"
+
+
+def format_finding(finding: Dict[str, Any]) -> str:
+    """One finding as markdown, e.g. for an inline review comment."""
+    lines = [f"**{finding['severity'].capitalize()}**: {finding['message']}"]
+    if finding["rule"]:
+        lines.append(f"*Best practice:* {finding['rule']}")
+    if finding["suggestion"]:
+        lines.append(f"*Suggestion:* {finding['suggestion']}")
+    return "\n\n".join(lines)
+
+
+def summarize_counts(findings: List[Dict[str, Any]]) -> str:
+    """E.g. "5 findings (1 critical, 4 minor)"."""
+    counts = [(severity, sum(finding["severity"] == severity for finding in findings)) for severity in SEVERITIES]
+    detail = ", ".join(f"{count} {severity}" for severity, count in counts if count)
+    return f"{len(findings)} findings" + (f" ({detail})" if detail else "")
+
+
+def render_markdown(summary: str, findings: List[Dict[str, Any]]) -> str:
+    """The markdown review for a summary and its findings, grouped by file."""
+    sections = ["### Overall assessment", summary or summarize_counts(findings), "", "### Specific issues found"]
+    if not findings:
+        sections.append("No issues found.")
+    for file, items in group_by_file(sorted(findings, key=lambda finding: finding["file"])).items():
+        sections.append(f"\n#### File: `{file}`")
+        for number, finding in enumerate(sorted(items, key=sort_key), 1):
+            body = format_finding(finding).replace("\n", "\n   ")
+            sections.append(f"{number}. `{location(finding)}` {body}")
+    return "\n".join(sections)
@@ -1,7 +1,11 @@
+import logging
 import os
 import re
-from github import Github
-import streamlit as st
+from utils.clients import get_github_client
+from utils.review_comments import build_review_comments, format_comments_as_text
+from utils.rate_limit import INTERACTIVE, get_scheduler
+
+logger = logging.getLogger("pr_analyzer.github")
 
 def validate_github_url(url: str) -> tuple:
     """Validate and parse GitHub PR URL."""
@@ -18,8 +22,20 @@ def validate_github_url(url: str) -> tuple:
     
     return True, owner, repo, pr_number
 
-def submit_review_to_github(pr_url: str, review_comment: str, review_type: str) -> dict:
-    """Submit a review to the GitHub PR using PyGithub library."""
+def submit_review_to_github(pr_url: str, review_comment: str, review_type: str,
+                            priority: int = INTERACTIVE, comments: list = None) -> dict:
+    """Submit a review to the GitHub PR using PyGithub library.
+
+    ``comments`` are inline comments (``path``, ``position``, ``body``, as
+    built by ``build_review_comments``) posted with the review in the same
+    API call. If GitHub rejects their positions (the PR changed since it was
+    analyzed), the review is posted with them appended to its body instead.
+
+    The call runs on a token chosen by the rate-limit scheduler and is
+    retried on another token if GitHub rate limits it.
+    """
+    from github import GithubException
+
     try:
         # Get GitHub token
         github_token = os.environ.get("GITHUB_TOKEN")
@@ -31,30 +47,46 @@ def submit_review_to_github(pr_url: str, review_comment: str, review_type: str)
         if not is_valid:
             return {"success": False, "message": "Invalid GitHub PR URL format."}
         
-        # Initialize GitHub client
-        g = Github(github_token)
+        scheduler = get_scheduler(github_token)
         
-        try:
+        def create_review(token: str):
+            # Shared, pooled GitHub client for the token the scheduler picked
+            g = get_github_client(token)
+            
             # Get the repository and PR
             repository = g.get_repo(f"{owner}/{repo}")
             pull_request = repository.get_pull(int(pr_number))
             
-            # Create the review
-            if review_type == "APPROVE":
-                pull_request.create_review(body=review_comment, event="APPROVE")
-            elif review_type == "REQUEST_CHANGES":
-                pull_request.create_review(body=review_comment, event="REQUEST_CHANGES")
-            else:  # Default to comment
-                pull_request.create_review(body=review_comment, event="COMMENT")
+            # Create the review, with all inline comments in the same call; default to comment
+            event = review_type if review_type in ("APPROVE", "REQUEST_CHANGES") else "COMMENT"
+            try:
+                pull_request.create_review(body=review_comment, event=event, comments=comments or [])
+            except GithubException as e:
+                if e.status != 422 or not comments:
+                    raise
+                pull_request.create_review(body=f"{review_comment}\n\n{format_comments_as_text(comments)}", event=event)
             
+            # Let the scheduler know how much budget this token has left; read from the
+            # requester since Github.rate_limiting calls the API when nothing is known yet
+            scheduler.record_rate_limit(token, g.requester.rate_limiting[0], g.requester.rate_limiting_resettime)
+        
+        try:
+            scheduler.call(create_review, priority)
             return {"success": True, "message": "Review successfully submitted!"}
         
         except Exception as e:
-            # Log the specific GitHub error
-            st.error(f"GitHub API Error: {str(e)}")
+            # Log the specific GitHub error; callers show the returned message
+            logger.error("GitHub API Error: %s", e)
             return {"success": False, "message": f"Failed to submit review: {str(e)}"}
     
     except Exception as e:
         # Log the general error
-        st.error(f"General Error: {str(e)}")
-        return {"success": False, "message": f"Error submitting review: {str(e)}"} 
\ No newline at end of file
+        logger.error("General Error: %s", e)
+        return {"success": False, "message": f"Error submitting review: {str(e)}"} 
+
+def submit_analysis_review(pr_url: str, pr_data: dict, analysis_results: dict, review_type: str = "COMMENT",
+                           priority: int = INTERACTIVE) -> dict:
+    """Post an analysis as a review, with the findings that cite lines of the diff as inline comments."""
+    comments, _ = build_review_comments(analysis_results["analysis"], pr_data.get("files") or [],
+                                        findings=analysis_results.get("findings"))
+    return submit_review_to_github(pr_url, analysis_results["analysis"], review_type, priority, comments)
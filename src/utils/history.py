@@ -0,0 +1,231 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+from utils.diff_parser import without_hunks
+from utils.metrics import metrics
+
+logger = logging.getLogger("pr_analyzer.history")
+
+DEFAULT_HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pr-analyzer", "history.sqlite3")
+# Writes queued beyond this are dropped rather than blocking an analysis
+DEFAULT_QUEUE_SIZE = 1000
+# Rows written per transaction
+DEFAULT_BATCH_SIZE = 100
+# Seconds atexit waits for queued writes
+CLOSE_TIMEOUT = 10.0
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS snapshots ("
+    "repo TEXT NOT NULL, pr_number INTEGER NOT NULL, head_sha TEXT NOT NULL, "
+    "title TEXT, fetched_at REAL NOT NULL, data BLOB NOT NULL, "
+    "PRIMARY KEY (repo, pr_number, head_sha))",
+    "CREATE TABLE IF NOT EXISTS runs ("
+    "id INTEGER PRIMARY KEY, repo TEXT NOT NULL, pr_number INTEGER NOT NULL, head_sha TEXT NOT NULL, "
+    "created_at REAL NOT NULL, mode TEXT, model TEXT, cached INTEGER NOT NULL, "
+    "prompt BLOB, response TEXT, prompt_tokens INTEGER, completion_tokens INTEGER, "
+    "fetch_seconds REAL, analysis_seconds REAL, meta TEXT)",
+    "CREATE INDEX IF NOT EXISTS runs_pr ON runs (repo, pr_number, created_at)",
+    "CREATE INDEX IF NOT EXISTS runs_head_sha ON runs (head_sha)",
+    "CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at)",
+)
+
+# Columns returned by the listing queries; prompts are only read by get_run
+RUN_COLUMNS = ("id", "repo", "pr_number", "head_sha", "created_at", "mode", "model", "cached", "response",
+               "prompt_tokens", "completion_tokens", "fetch_seconds", "analysis_seconds", "meta")
+
+
+def _compress(value: Any) -> bytes:
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return zlib.compress(text.encode("utf-8"))
+
+
+def _run_row(row: tuple) -> Dict[str, Any]:
+    run = dict(zip(RUN_COLUMNS, row))
+    run["cached"] = bool(run["cached"])
+    run["meta"] = json.loads(run["meta"]) if run["meta"] else {}
+    return run
+
+
+class AnalysisHistoryStore:
+    """Every analysis run, and the PR snapshot it ran on, kept in SQLite.
+
+    Runs hold the prompt (compressed), response, token counts and timings;
+    snapshots are stored once per (repo, PR, head SHA). The database is in
+    WAL mode and indexed by PR, head SHA and date, so lookups of earlier
+    runs are index seeks and don't wait on writes.
+
+    ``record_run`` only queues the row: a background thread writes queued
+    rows in batches, one transaction each. If the queue is full the row is
+    dropped (and counted) rather than slowing the analysis down.
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush, CLOSE_TIMEOUT)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets readers run alongside the writer."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record_run(self, pr_data: Dict[str, Any], prompt: str, response: str, cached: bool, mode: str = None,
+                   model: str = None, prompt_tokens: int = None, completion_tokens: int = None,
+                   analysis_seconds: float = None, meta: Optional[Dict[str, Any]] = None) -> None:
+        """Queue one analysis run, and its PR snapshot, to be written in the background."""
+        run = {
+            # Copied now: the caller's file entries keep gaining parsed hunks while the writer serializes
+            "pr_data": without_hunks(pr_data, copy=True), "prompt": prompt, "response": response, "cached": cached, "mode": mode,
+            "model": model, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "analysis_seconds": analysis_seconds, "meta": meta or {}, "created_at": time.time(),
+        }
+        try:
+            self._queue.put_nowait(run)
+        except queue.Full:
+            metrics.increment("history_writes", status="dropped")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued run is written; False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with metrics.span("history_write", rows=len(batch)):
+                    self._write(batch)
+                metrics.increment("history_writes", len(batch), status="written")
+            except Exception:
+                logger.exception("Failed to write %d analysis runs to %s", len(batch), self.path)
+                metrics.increment("history_writes", len(batch), status="error")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        conn = self._connection()
+        snapshots, runs = {}, []
+        for run in batch:
+            pr_data = run["pr_data"]
+            key = (pr_data.get("repo"), pr_data.get("number"), pr_data.get("head_sha"))
+            snapshots.setdefault(key, pr_data)
+            runs.append(key + (
+                run["created_at"], run["mode"], run["model"], int(run["cached"]), _compress(run["prompt"]),
+                run["response"], run["prompt_tokens"], run["completion_tokens"],
+                (pr_data.get("fetch_timings") or {}).get("total_seconds"), run["analysis_seconds"],
+                json.dumps(run["meta"], ensure_ascii=False, default=str),
+            ))
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO snapshots (repo, pr_number, head_sha, title, fetched_at, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [key + (pr_data.get("title"), time.time(), _compress(pr_data)) for key, pr_data in snapshots.items()],
+            )
+            conn.executemany(
+                "INSERT INTO runs (repo, pr_number, head_sha, created_at, mode, model, cached, prompt, response, "
+                "prompt_tokens, completion_tokens, fetch_seconds, analysis_seconds, meta) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                runs,
+            )
+
+    def runs_for_pr(self, repo: str, pr_number: int, limit: int = 20) -> List[Dict[str, Any]]:
+        """The PR's most recent runs, newest first."""
+        rows = self._connection().execute(
+            f"SELECT {', '.join(RUN_COLUMNS)} FROM runs WHERE repo = ? AND pr_number = ? "
+            "ORDER BY created_at DESC LIMIT ?",
+            (repo, pr_number, limit),
+        ).fetchall()
+        return [_run_row(row) for row in rows]
+
+    def latest_run(self, repo: str, pr_number: int, head_sha: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The PR's newest run, optionally at a given head SHA."""
+        if head_sha is None:
+            runs = self.runs_for_pr(repo, pr_number, limit=1)
+            return runs[0] if runs else None
+        row = self._connection().execute(
+            f"SELECT {', '.join(RUN_COLUMNS)} FROM runs WHERE head_sha = ? AND repo = ? AND pr_number = ? "
+            "ORDER BY created_at DESC LIMIT 1",
+            (head_sha, repo, pr_number),
+        ).fetchone()
+        return _run_row(row) if row else None
+
+    def recent_runs(self, since: Optional[float] = None, repo: Optional[str] = None,
+                    limit: int = 100) -> List[Dict[str, Any]]:
+        """Runs newer than ``since`` (a Unix time), newest first, optionally for one repo."""
+        where, params = ["created_at >= ?"], [since or 0]
+        if repo is not None:
+            where.append("repo = ?")
+            params.append(repo)
+        rows = self._connection().execute(
+            f"SELECT {', '.join(RUN_COLUMNS)} FROM runs WHERE {' AND '.join(where)} "
+            "ORDER BY created_at DESC LIMIT ?",
+            params + [limit],
+        ).fetchall()
+        return [_run_row(row) for row in rows]
+
+    def get_run(self, run_id: int) -> Optional[Dict[str, Any]]:
+        """One run including its prompt."""
+        row = self._connection().execute(
+            f"SELECT {', '.join(RUN_COLUMNS)}, prompt FROM runs WHERE id = ?", (run_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        run = _run_row(row[:-1])
+        run["prompt"] = zlib.decompress(row[-1]).decode("utf-8") if row[-1] else None
+        return run
+
+    def get_snapshot(self, repo: str, pr_number: int, head_sha: str) -> Optional[Dict[str, Any]]:
+        """The PR data a run was made on."""
+        row = self._connection().execute(
+            "SELECT data FROM snapshots WHERE repo = ? AND pr_number = ? AND head_sha = ?",
+            (repo, pr_number, head_sha),
+        ).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_history_store() -> AnalysisHistoryStore:
+    """Return the process-wide history store at PR_HISTORY_PATH."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = AnalysisHistoryStore(path=os.getenv("PR_HISTORY_PATH", DEFAULT_HISTORY_PATH))
+        return _default_store
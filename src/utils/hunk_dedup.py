@@ -0,0 +1,148 @@
+import hashlib
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from utils.chunking import estimate_tokens
+from utils.diff_parser import ADDED, CONTEXT, REMOVED, Hunk, file_hunks
+
+# Hunks must repeat at least this often to be sent once for all files
+DEFAULT_MIN_REPEATS = 2
+# Affected files named in the prompt; the full list stays local for fan-out
+MAX_LISTED_FILES = 20
+SHARED_CHANGE_PREFIX = "shared-change-"
+
+FILE_PLACEHOLDER = "\0file\0"
+WHITESPACE_PATTERN = re.compile(r"\s+")
+WORD_SPLIT_PATTERN = re.compile(r"[^A-Za-z0-9]+")
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+
+@lru_cache(maxsize=4096)
+def _file_names(filename: str) -> frozenset:
+    """Spellings of a file's own name that may appear in its code (user_service, UserService, userService)."""
+    stem = filename.rsplit("/", 1)[-1].split(".", 1)[0]
+    words = [word for word in WORD_SPLIT_PATTERN.split(stem) if word]
+    if not words or len(stem) < 3:
+        # Too short to replace without hitting unrelated identifiers
+        return frozenset()
+    camel = "".join(word[:1].upper() + word[1:] for word in words)
+    return frozenset({stem, camel, camel[:1].lower() + camel[1:], "_".join(words).lower(), "-".join(words).lower()})
+
+
+def fingerprint(hunk: Hunk, filename: str) -> str:
+    """Hash a hunk's changed lines, ignoring whitespace, line numbers, context and its file's own name."""
+    names = _file_names(filename)
+    replace = lambda match: FILE_PLACEHOLDER if match.group(0) in names else match.group(0)
+    digest = hashlib.sha1()
+    for line in hunk.lines:
+        if line.kind == CONTEXT:
+            continue
+        text = WHITESPACE_PATTERN.sub(" ", line.text).strip()
+        if names:
+            text = IDENTIFIER_PATTERN.sub(replace, text)
+        digest.update(f"{line.kind}{text}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def format_affected_files(files: List[str]) -> str:
+    """Name the files a shared change applies to, capped for the prompt."""
+    listed = ", ".join(files[:MAX_LISTED_FILES])
+    if len(files) > MAX_LISTED_FILES:
+        listed += f" and {len(files) - MAX_LISTED_FILES} more"
+    return listed
+
+
+def shared_note(file: Dict[str, Any]) -> str:
+    """Prompt note naming the files a shared change entry stands for ("" for ordinary files)."""
+    if "shared_by" not in file:
+        return ""
+    return (f" (identical change in {len(file['shared_by'])} files, up to each file's own name: "
+            f"{format_affected_files(file['shared_by'])})")
+
+
+def dedupe_hunks(files: List[Dict[str, Any]], min_repeats: int = DEFAULT_MIN_REPEATS) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Send hunks that repeat across files (mass renames, codemods) to the model once.
+
+    Hunks are grouped by ``fingerprint``. Each group found in at least
+    ``min_repeats`` files becomes one synthetic file entry named
+    ``shared-change-<n>`` holding the first copy, with ``shared_by`` listing
+    every affected file. Those hunks are removed from the files they came
+    from; files left with no hunks are dropped.
+
+    Returns the new file list and a report with the group count, hunks
+    removed and the estimated tokens saved.
+    """
+    parsed = []
+    groups: Dict[str, List[Tuple[str, Hunk]]] = {}
+    for file in files:
+        hunks = file_hunks(file)
+        keys = []
+        for hunk in hunks:
+            key = fingerprint(hunk, file["filename"]) if any(line.kind != CONTEXT for line in hunk.lines) else None
+            keys.append(key)
+            if key is not None:
+                groups.setdefault(key, []).append((file["filename"], hunk))
+        parsed.append((file, hunks, keys))
+
+    repeated = {
+        key: members for key, members in groups.items()
+        if len({filename for filename, _ in members}) >= min_repeats
+    }
+    report = {"groups": len(repeated), "hunks_removed": 0, "tokens_saved": 0}
+    if not repeated:
+        return files, report
+
+    result = []
+    for file, hunks, keys in parsed:
+        kept = [hunk.text() for hunk, key in zip(hunks, keys) if key not in repeated]
+        if len(kept) == len(hunks):
+            result.append(file)
+        elif kept:
+            result.append({**file, "patch": "\n".join(kept)})
+
+    for index, members in enumerate(repeated.values()):
+        shared_by = list(dict.fromkeys(filename for filename, _ in members))
+        text = members[0][1].text()
+        result.append({
+            "filename": f"{SHARED_CHANGE_PREFIX}{index + 1}",
+            "status": "modified",
+            "additions": sum(line.kind == ADDED for line in members[0][1].lines),
+            "deletions": sum(line.kind == REMOVED for line in members[0][1].lines),
+            "patch": text,
+            "shared_by": shared_by,
+        })
+        report["hunks_removed"] += len(members) - 1
+        report["tokens_saved"] += sum(estimate_tokens(hunk.text()) for _, hunk in members[1:])
+    report["tokens_saved"] = max(report["tokens_saved"] - sum(
+        estimate_tokens(format_affected_files(file["shared_by"])) for file in result if "shared_by" in file
+    ), 0)
+    return result, report
+
+
+def fan_out(findings: Dict[str, str], files: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Copy each shared change's findings onto every file it applies to."""
+    result = {name: text for name, text in findings.items() if not name.startswith(SHARED_CHANGE_PREFIX)}
+    for file in files:
+        text = findings.get(file["filename"], "").strip()
+        if "shared_by" not in file or not text:
+            continue
+        for name in file["shared_by"]:
+            result[name] = f"{result.get(name, '')}\n{text}".strip()
+    return result
+
+
+def fan_out_findings(findings: List[Dict[str, Any]], files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Copy structured findings on a shared change onto every file it applies to.
+
+    Line numbers refer to the shared copy only, so the copies are file-level.
+    """
+    shared_by = {file["filename"]: file["shared_by"] for file in files if "shared_by" in file}
+    result = []
+    for finding in findings:
+        if finding["file"] not in shared_by:
+            result.append(finding)
+            continue
+        result.extend({**finding, "file": name, "start_line": None, "end_line": None}
+                      for name in shared_by[finding["file"]])
+    return result
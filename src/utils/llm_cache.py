@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from utils.metrics import metrics
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pr-analyzer", "llm_responses.sqlite3")
+DEFAULT_MEMORY_ENTRIES = 128
+DEFAULT_DISK_ENTRIES = 5000
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+def response_cache_key(model: str, temperature: float, max_tokens: int, system_message: str, prompt: str) -> str:
+    """Hash everything that determines a completion into a content address."""
+    payload = json.dumps([model, temperature, max_tokens, system_message, prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryResponseCache:
+    """Thread-safe in-memory LRU of completion texts, each kept at most ``ttl_seconds``."""
+
+    def __init__(self, max_entries: int = DEFAULT_MEMORY_ENTRIES, ttl_seconds: int = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (expiry epoch, response)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() >= entry[0]:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, response: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteResponseCache:
+    """Completion texts persisted in SQLite with a TTL and a maximum entry count."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_DISK_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            # Drop the least recently used rows once over the size bound
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+
+class TieredResponseCache:
+    """Memory LRU in front of a disk cache; disk hits are promoted into memory.
+
+    Any object with ``get(key)`` and ``put(key, response)`` can be used as a
+    tier, or passed to ``PRAnalyzerAgent`` directly in place of this class.
+    The default memory tier expires entries after the disk tier's TTL.
+    """
+
+    def __init__(self, memory: Optional[MemoryResponseCache] = None, disk: Optional[SQLiteResponseCache] = None):
+        self.memory = memory or MemoryResponseCache(
+            ttl_seconds=disk.ttl_seconds if disk is not None else DEFAULT_TTL_SECONDS)
+        self.disk = disk
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        response = self.memory.get(key)
+        if response is None and self.disk is not None:
+            response = self.disk.get(key)
+            if response is not None:
+                self.memory.put(key, response)
+        hit = response is not None
+        with self._lock:
+            self.stats["hits" if hit else "misses"] += 1
+        metrics.increment("llm_cache", result="hit" if hit else "miss")
+        return response
+
+    def put(self, key: str, response: str) -> None:
+        self.memory.put(key, response)
+        if self.disk is not None:
+            self.disk.put(key, response)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> TieredResponseCache:
+    """Return the process-wide response cache configured from the environment."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            disk = SQLiteResponseCache(
+                path=os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH),
+                ttl_seconds=int(os.getenv("LLM_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", DEFAULT_DISK_ENTRIES)),
+            )
+            _default_cache = TieredResponseCache(disk=disk)
+        return _default_cache
@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("pr_analyzer.metrics")
+
+METRIC_PREFIX = "pr_analyzer"
+# Upper bounds (seconds) of the span duration histogram buckets
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BUCKET_LABELS = tuple(f'le="{bound}"' for bound in SPAN_BUCKETS)
+INF_BUCKET_LABEL = 'le="+Inf"'
+# Finished spans kept for the debug panel
+RECENT_SPANS = 200
+# /metrics is only reachable from this machine unless PR_METRICS_HOST says otherwise
+DEFAULT_METRICS_HOST = "127.0.0.1"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """In-process counters and span timings for the analysis pipeline.
+
+    ``span`` times a stage into a histogram, keeps it for the debug panel
+    and logs it as one JSON line on the ``pr_analyzer.metrics`` logger;
+    ``increment`` counts requests, tokens and cache hits. Everything can be
+    rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        # stage labels -> [bucket counts..., sum, count]
+        self._spans: Dict[LabelKey, List[float]] = {}
+        self.recent: deque = deque(maxlen=RECENT_SPANS)
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        """Add ``value`` to a counter."""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, stage: str, seconds: float, **labels) -> None:
+        """Record a finished span's duration."""
+        key = _label_key({"stage": stage, **labels})
+        with self._lock:
+            histogram = self._spans.setdefault(key, [0] * (len(SPAN_BUCKETS) + 2))
+            for index, bound in enumerate(SPAN_BUCKETS):
+                if seconds <= bound:
+                    histogram[index] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+            self.recent.append({"stage": stage, **labels, "seconds": round(seconds, 4), "at": time.time()})
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"event": "span", "stage": stage, **labels, "seconds": round(seconds, 4)}))
+
+    @contextmanager
+    def span(self, stage: str, **labels) -> Iterator[Dict[str, Any]]:
+        """Time the enclosed block as one run of ``stage``.
+
+        Yields a dict; keys added to it (e.g. ``status``) become labels of
+        the recorded span.
+        """
+        extra: Dict[str, Any] = {}
+        start = time.perf_counter()
+        try:
+            yield extra
+        except Exception:
+            extra.setdefault("status", "error")
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels, **extra)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and per-stage totals as plain data (for the debug panel)."""
+        with self._lock:
+            counters = {
+                name + _format_labels(key): value
+                for name, series in self._counters.items() for key, value in series.items()
+            }
+            stages = {}
+            for key, histogram in self._spans.items():
+                stage = dict(key)["stage"]
+                total = stages.setdefault(stage, {"count": 0, "seconds": 0.0})
+                total["count"] += histogram[-1]
+                total["seconds"] += histogram[-2]
+            return {"counters": counters, "stages": stages, "recent": list(self.recent)}
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                metric = f"{METRIC_PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.extend(f"{metric}{_format_labels(key)} {value:g}" for key, value in sorted(series.items()))
+
+            metric = f"{METRIC_PREFIX}_span_seconds"
+            if self._spans:
+                lines.append(f"# TYPE {metric} histogram")
+            for key, histogram in sorted(self._spans.items()):
+                for bound, count in zip(BUCKET_LABELS, histogram):
+                    lines.append(f"{metric}_bucket{_format_labels(key, bound)} {count:g}")
+                lines.append(f"{metric}_bucket{_format_labels(key, INF_BUCKET_LABEL)} {histogram[-1]:g}")
+                lines.append(f"{metric}_sum{_format_labels(key)} {histogram[-2]:.6f}")
+                lines.append(f"{metric}_count{_format_labels(key)} {histogram[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Write the Prometheus text to a file (e.g. for node_exporter's textfile collector)."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+
+metrics = Metrics()
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve_metrics(port: Optional[int] = None, host: Optional[str] = None) -> Optional[ThreadingHTTPServer]:
+    """Serve ``/metrics`` on ``host:port`` from a daemon thread, once per process.
+
+    ``port`` defaults to PR_METRICS_PORT (off when unset) and ``host`` to
+    PR_METRICS_HOST, then 127.0.0.1.
+    """
+    global _server
+    port = port if port is not None else int(os.getenv("PR_METRICS_PORT", "0"))
+    if not port:
+        return None
+    host = host or os.getenv("PR_METRICS_HOST", DEFAULT_METRICS_HOST)
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
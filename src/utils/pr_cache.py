@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from utils.diff_parser import without_hunks
+from utils.metrics import metrics
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pr-analyzer", "snapshots")
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+def snapshot_key(repo: str, pr_number: int, head_sha: str) -> str:
+    """Build the cache key for a PR snapshot, e.g. ``owner/repo#12@abc123``."""
+    return f"{repo}#{pr_number}@{head_sha}"
+
+
+class PRSnapshotCache:
+    """On-disk, size-bounded LRU cache of ``get_pr_data`` results.
+
+    Snapshots are keyed by ``owner/repo#number@head_sha``. Alongside them the
+    cache remembers the last ETag and head SHA seen for each PR, so callers can
+    revalidate with ``If-None-Match`` and skip the fetch entirely on a 304.
+    Recency is tracked with file mtimes, which keeps the cache usable from
+    several processes without a separate index.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or os.getenv("PR_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes or int(os.getenv("PR_CACHE_MAX_MB", "0")) * 1024 * 1024 or DEFAULT_MAX_BYTES
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, kind: str, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{kind}-{digest}.json")
+
+    def _read(self, path: str) -> Optional[dict]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path: str, data: dict) -> None:
+        # Write to a temp file first so a concurrent reader never sees half a snapshot
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def get_head(self, repo: str, pr_number: int) -> Optional[dict]:
+        """Return the last seen ``{"etag", "head_sha"}`` for a PR, if any."""
+        return self._read(self._path("head", f"{repo}#{pr_number}"))
+
+    def set_head(self, repo: str, pr_number: int, head_sha: str, etag: Optional[str]) -> None:
+        """Remember the head SHA and ETag from the latest PR metadata response."""
+        self._write(self._path("head", f"{repo}#{pr_number}"), {"head_sha": head_sha, "etag": etag})
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached snapshot and mark it as recently used."""
+        path = self._path("snapshot", key)
+        snapshot = self._read(path)
+        with self._lock:
+            if snapshot is None:
+                self.stats["misses"] += 1
+                metrics.increment("pr_snapshot_cache", result="miss")
+                return None
+            self.stats["hits"] += 1
+            metrics.increment("pr_snapshot_cache", result="hit")
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return snapshot
+
+    def put(self, key: str, pr_data: Dict[str, Any]) -> None:
+        """Store a snapshot and evict the least recently used ones over the size bound."""
+        self._write(self._path("snapshot", key), without_hunks(pr_data))
+        self._evict()
+
+    def record_not_modified(self) -> None:
+        """Count a revalidation that GitHub answered with 304 Not Modified."""
+        with self._lock:
+            self.stats["not_modified"] += 1
+        metrics.increment("pr_snapshot_cache", result="not_modified")
+
+    def _evict(self) -> None:
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not (name.startswith("snapshot-") and name.endswith(".json")):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.stats["evictions"] += 1
+            if total <= self.max_bytes:
+                break
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_snapshot_cache() -> PRSnapshotCache:
+    """Return the process-wide snapshot cache, creating it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PRSnapshotCache()
+        return _default_cache
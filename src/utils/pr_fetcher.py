@@ -0,0 +1,407 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from utils.clients import setting
+from utils.diff_parser import git_header_path, header_path
+from utils.metrics import metrics
+from utils.pr_cache import PRSnapshotCache, snapshot_key
+from utils.rate_limit import INTERACTIVE, GitHubScheduler, get_scheduler
+
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+GITHUB_GRAPHQL_URL = os.getenv("GITHUB_GRAPHQL_URL")
+PER_PAGE = 100
+DEFAULT_WORKERS = 8
+# The compare endpoint lists at most this many files; a full page may be truncated
+COMPARE_FILE_LIMIT = 300
+
+FETCH_MODES = ("rest", "graphql")
+
+# Files and commits are paged through together; a connection is dropped from
+# the query (via @include) once it has no more pages.
+PR_GRAPHQL_QUERY = """
+query($owner: String!, $repo: String!, $number: Int!,
+      $filesCursor: String, $commitsCursor: String,
+      $withFiles: Boolean!, $withCommits: Boolean!) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $number) {
+      title
+      body
+      headRefOid
+      baseRefOid
+      files(first: 100, after: $filesCursor) @include(if: $withFiles) {
+        pageInfo { hasNextPage endCursor }
+        nodes { path additions deletions changeType }
+      }
+      commits(first: 100, after: $commitsCursor) @include(if: $withCommits) {
+        pageInfo { hasNextPage endCursor }
+        nodes { commit { message } }
+      }
+    }
+  }
+}
+"""
+
+# GraphQL reports a file's change type in upper case; REST uses these names
+CHANGE_TYPE_STATUS = {
+    "ADDED": "added",
+    "DELETED": "removed",
+    "MODIFIED": "modified",
+    "RENAMED": "renamed",
+    "COPIED": "copied",
+    "CHANGED": "changed",
+}
+
+def split_diff_by_file(diff_text: str) -> Dict[str, Optional[str]]:
+    """Split a full PR ``.diff`` into REST-style per-file patches.
+
+    Each patch starts at the first hunk header, matching what the REST
+    ``/files`` endpoint returns. Files without hunks (binary or mode-only
+    changes) map to ``None``.
+    """
+    patches: Dict[str, Optional[str]] = {}
+    filename = None
+    hunk_lines: List[str] = []
+
+    def flush():
+        if filename is not None:
+            patches[filename] = "\n".join(hunk_lines) if hunk_lines else None
+
+    for line in diff_text.splitlines():
+        path = git_header_path(line)
+        if path is not None:
+            flush()
+            filename = path
+            hunk_lines = []
+        elif hunk_lines or line.startswith("@@"):
+            hunk_lines.append(line)
+        elif filename is not None:
+            # Quoted or renamed paths are named exactly by the +++ and rename lines
+            filename = header_path(line) or filename
+
+    flush()
+    return patches
+
+
+def _last_page(response: requests.Response) -> int:
+    """Read the last page number from a paginated response's Link header."""
+    last_url = response.links.get("last", {}).get("url")
+    if not last_url:
+        return 1
+    return int(parse_qs(urlparse(last_url).query).get("page", ["1"])[0])
+
+
+class PRFetcher:
+    """Fetch a PR's metadata, files and commits concurrently over pooled sessions.
+
+    Files are paged once (the old code walked ``pr.get_files()`` twice) and
+    every page after the first is requested in parallel once the Link header
+    tells us how many there are. Each HTTP call is timed in ``self.timings``.
+    """
+
+    def __init__(self, token: str, api_url: Optional[str] = None,
+                 max_workers: int = DEFAULT_WORKERS, session: Optional[requests.Session] = None,
+                 graphql_url: Optional[str] = None, scheduler: Optional[GitHubScheduler] = None,
+                 priority: int = INTERACTIVE):
+        """
+        Requests go through the rate-limit scheduler for the configured token
+        pool (GITHUB_TOKENS, else ``token``) at the given ``priority``. Passing
+        an explicit ``session`` sends them straight through that session instead.
+        """
+        self.api_url = (api_url or GITHUB_API_URL).rstrip("/")
+        self.graphql_url = graphql_url or GITHUB_GRAPHQL_URL or f"{self.api_url}/graphql"
+        self.max_workers = max_workers
+        self.session = session
+        self.scheduler = None if session is not None else (scheduler or get_scheduler(token))
+        self.priority = priority
+        self.timeout = setting("GITHUB_TIMEOUT")
+        self.timings: List[Dict[str, Any]] = []
+
+    def _request(self, method: str, url: str, label: str, **kwargs) -> requests.Response:
+        """Issue a request and record how long it took."""
+        start = time.perf_counter()
+        if self.scheduler is not None:
+            response = self.scheduler.request(method, url, self.priority, timeout=self.timeout, **kwargs)
+        else:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        seconds = time.perf_counter() - start
+        self.timings.append({
+            "call": label,
+            "status": response.status_code,
+            "seconds": round(seconds, 4),
+        })
+        metrics.increment("github_requests", status=response.status_code)
+        metrics.observe("github_request", seconds)
+        response.raise_for_status()
+        return response
+
+    def _get(self, path: str, params: Optional[dict] = None, label: Optional[str] = None) -> requests.Response:
+        """Issue a GET against the REST API."""
+        return self._request("GET", f"{self.api_url}{path}", label or path, params=params)
+
+    def fetch(self, owner: str, repo: str, pr_number: int, mode: str = "rest") -> Dict[str, Any]:
+        """Fetch everything the analyzer needs for a PR and return it as ``pr_data``.
+
+        ``mode`` is either ``"rest"`` (paginated REST listings) or
+        ``"graphql"`` (one batched GraphQL query plus the PR's ``.diff``).
+        """
+        if mode not in FETCH_MODES:
+            raise ValueError(f"Unknown fetch mode '{mode}', expected one of {', '.join(FETCH_MODES)}")
+        if mode == "graphql":
+            return self.fetch_graphql(owner, repo, pr_number)
+
+        self.timings = []
+        pull_path = f"/repos/{owner}/{repo}/pulls/{pr_number}"
+        paged = {"files": f"{pull_path}/files", "commits": f"{pull_path}/commits"}
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pull_future = executor.submit(self._get, pull_path, None, "pull")
+            first_pages = {
+                name: executor.submit(self._get, path, {"per_page": PER_PAGE, "page": 1}, f"{name}[1]")
+                for name, path in paged.items()
+            }
+
+            # Once the first page of each listing is back we know the page count,
+            # so the remaining pages can all go out at the same time.
+            remaining_pages = {}
+            for name, future in first_pages.items():
+                last = _last_page(future.result())
+                remaining_pages[name] = [
+                    executor.submit(self._get, paged[name], {"per_page": PER_PAGE, "page": page}, f"{name}[{page}]")
+                    for page in range(2, last + 1)
+                ]
+
+            pull = pull_future.result().json()
+            listings = {}
+            for name, future in first_pages.items():
+                items = list(future.result().json())
+                for page_future in remaining_pages[name]:
+                    items.extend(page_future.result().json())
+                listings[name] = items
+
+        files = [
+            {
+                "filename": file["filename"],
+                "status": file.get("status"),
+                "additions": file.get("additions", 0),
+                "deletions": file.get("deletions", 0),
+                "patch": file.get("patch"),
+            }
+            for file in listings["files"]
+        ]
+        pr_data = self._build_pr_data(
+            pull["title"], pull["body"], pull["head"]["sha"], pull["base"]["sha"],
+            files, [commit["commit"]["message"] for commit in listings["commits"]],
+        )
+        return self._finish(pr_data, owner, repo, pr_number, start)
+
+    def fetch_cached(self, owner: str, repo: str, pr_number: int, cache: PRSnapshotCache,
+                     mode: str = "rest") -> Dict[str, Any]:
+        """Return the cached snapshot when the PR's head has not moved, otherwise fetch it.
+
+        The PR metadata is revalidated with ``If-None-Match``; a 304 costs
+        nothing against the rate limit and means the cached snapshot is current.
+        """
+        repo_name = f"{owner}/{repo}"
+        self.timings = []
+        start = time.perf_counter()
+
+        head = cache.get_head(repo_name, pr_number) or {}
+        headers = {"If-None-Match": head["etag"]} if head.get("etag") else {}
+        response = self._request(
+            "GET", f"{self.api_url}/repos/{owner}/{repo}/pulls/{pr_number}", "pull (revalidate)", headers=headers,
+        )
+
+        pull = None
+        if response.status_code == 304:
+            cache.record_not_modified()
+            head_sha = head["head_sha"]
+        else:
+            pull = response.json()
+            head_sha = pull["head"]["sha"]
+            cache.set_head(repo_name, pr_number, head_sha, response.headers.get("ETag"))
+
+        key = snapshot_key(repo_name, pr_number, head_sha)
+        snapshot = cache.get(key)
+        if snapshot is not None:
+            # Title and description can be edited without a new push
+            if pull is not None and (snapshot["title"], snapshot["description"]) != (pull["title"], pull["body"]):
+                snapshot["title"] = pull["title"]
+                snapshot["description"] = pull["body"]
+                cache.put(key, snapshot)
+            snapshot["from_cache"] = True
+            snapshot["fetch_timings"] = {
+                "total_seconds": round(time.perf_counter() - start, 4),
+                "calls": self.timings,
+            }
+            return snapshot
+
+        revalidation_calls = self.timings
+        pr_data = self.fetch(owner, repo, pr_number, mode=mode)
+        pr_data["fetch_timings"]["calls"] = revalidation_calls + pr_data["fetch_timings"]["calls"]
+        pr_data["fetch_timings"]["total_seconds"] = round(time.perf_counter() - start, 4)
+        cache.put(snapshot_key(repo_name, pr_number, pr_data["head_sha"]), pr_data)
+        pr_data["from_cache"] = False
+        return pr_data
+
+    def list_pull_request_urls(self, owner: str, repo: str, state: str = "open") -> List[str]:
+        """List the web URLs of a repository's pull requests in the given state."""
+        path = f"/repos/{owner}/{repo}/pulls"
+        params = {"state": state, "per_page": PER_PAGE, "page": 1}
+        first = self._get(path, params, "pulls[1]")
+        pulls = list(first.json())
+
+        pages = range(2, _last_page(first) + 1)
+        if pages:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                responses = executor.map(
+                    lambda page: self._get(path, dict(params, page=page), f"pulls[{page}]"), pages
+                )
+                for response in responses:
+                    pulls.extend(response.json())
+        return [pull["html_url"] for pull in pulls]
+
+    def fetch_changed_files(self, owner: str, repo: str, base_sha: str, head_sha: str) -> Optional[List[str]]:
+        """List the files changed between two commits of a PR branch.
+
+        Returns None when the answer can't be trusted: the old commit is gone
+        or no longer an ancestor (force push, rebase) or the list is truncated.
+        """
+        try:
+            response = self._get(f"/repos/{owner}/{repo}/compare/{base_sha}...{head_sha}", label="compare")
+        except requests.HTTPError:
+            return None
+
+        comparison = response.json()
+        files = comparison.get("files", [])
+        if comparison.get("status") not in ("ahead", "identical") or len(files) >= COMPARE_FILE_LIMIT:
+            return None
+        return [file["filename"] for file in files]
+
+    def fetch_graphql(self, owner: str, repo: str, pr_number: int) -> Dict[str, Any]:
+        """Fetch a PR with one batched GraphQL query and a single ``.diff`` download.
+
+        GraphQL does not expose patches, so they come from the PR's diff,
+        which is downloaded while the query pages through files and commits.
+        GitHub refuses the diff (406) for PRs over 300 files or its size
+        limit; the patches are then paged from the REST ``/files`` listing.
+        """
+        self.timings = []
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            diff_future = executor.submit(
+                self._request, "GET", f"{self.api_url}/repos/{owner}/{repo}/pulls/{pr_number}", "diff",
+                headers={"Accept": "application/vnd.github.v3.diff"},
+            )
+            pull, file_nodes, commit_nodes = self._query_pull_request(owner, repo, pr_number)
+            try:
+                patches = split_diff_by_file(diff_future.result().text)
+            except requests.HTTPError:
+                metrics.increment("graphql_diff_fallbacks")
+                patches = self._fetch_patches(owner, repo, pr_number)
+
+        files = [
+            {
+                "filename": node["path"],
+                "status": CHANGE_TYPE_STATUS.get(node.get("changeType"), "modified"),
+                "additions": node.get("additions", 0),
+                "deletions": node.get("deletions", 0),
+                "patch": patches.get(node["path"]),
+            }
+            for node in file_nodes
+        ]
+        pr_data = self._build_pr_data(
+            pull["title"], pull["body"], pull["headRefOid"], pull["baseRefOid"],
+            files, [node["commit"]["message"] for node in commit_nodes],
+        )
+        return self._finish(pr_data, owner, repo, pr_number, start)
+
+    def _fetch_patches(self, owner: str, repo: str, pr_number: int) -> Dict[str, Optional[str]]:
+        """Page the REST ``/files`` listing for each file's patch, all pages after the first in parallel."""
+        path = f"/repos/{owner}/{repo}/pulls/{pr_number}/files"
+        first = self._get(path, {"per_page": PER_PAGE, "page": 1}, "files[1]")
+        files = list(first.json())
+        pages = range(2, _last_page(first) + 1)
+        if pages:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                responses = executor.map(
+                    lambda page: self._get(path, {"per_page": PER_PAGE, "page": page}, f"files[{page}]"), pages
+                )
+                for response in responses:
+                    files.extend(response.json())
+        return {file["filename"]: file.get("patch") for file in files}
+
+    def _query_pull_request(self, owner: str, repo: str, pr_number: int) -> tuple:
+        """Page through the PR's files and commits with cursor-based GraphQL queries."""
+        variables = {
+            "owner": owner, "repo": repo, "number": int(pr_number),
+            "filesCursor": None, "commitsCursor": None,
+            "withFiles": True, "withCommits": True,
+        }
+        pull = None
+        file_nodes: List[dict] = []
+        commit_nodes: List[dict] = []
+        page = 0
+
+        while variables["withFiles"] or variables["withCommits"]:
+            page += 1
+            response = self._request(
+                "POST", self.graphql_url, f"graphql[{page}]",
+                json={"query": PR_GRAPHQL_QUERY, "variables": variables},
+            )
+            payload = response.json()
+            if payload.get("errors"):
+                messages = "; ".join(error.get("message", "") for error in payload["errors"])
+                raise ValueError(f"GitHub GraphQL error: {messages}")
+
+            pull = payload["data"]["repository"]["pullRequest"]
+            if pull is None:
+                raise ValueError(f"Pull request {owner}/{repo}#{pr_number} not found")
+
+            for key, nodes, flag, cursor in (
+                ("files", file_nodes, "withFiles", "filesCursor"),
+                ("commits", commit_nodes, "withCommits", "commitsCursor"),
+            ):
+                if not variables[flag]:
+                    continue
+                connection = pull.get(key) or {"nodes": [], "pageInfo": {"hasNextPage": False}}
+                nodes.extend(connection["nodes"])
+                variables[flag] = connection["pageInfo"]["hasNextPage"]
+                variables[cursor] = connection["pageInfo"].get("endCursor")
+
+        return pull, file_nodes, commit_nodes
+
+    def _finish(self, pr_data: Dict[str, Any], owner: str, repo: str, pr_number: int, start: float) -> Dict[str, Any]:
+        """Attach the PR identity and fetch timings to ``pr_data``."""
+        pr_data["repo"] = f"{owner}/{repo}"
+        pr_data["number"] = int(pr_number)
+        pr_data["fetch_timings"] = {
+            "total_seconds": round(time.perf_counter() - start, 4),
+            "calls": self.timings,
+        }
+        return pr_data
+
+    def _build_pr_data(self, title: str, body: str, head_sha: str, base_sha: str,
+                       files: List[dict], commit_messages: List[str]) -> Dict[str, Any]:
+        """Shape normalized PR details into the dict the rest of the app expects."""
+        changes = []
+        for file in files:
+            changes.append(f"File: {file['filename']}")
+            changes.append(f"Changes: {file['patch']}")
+
+        return {
+            "title": title,
+            "description": body,
+            "files_changed": [file["filename"] for file in files],
+            "changes": "\n".join(changes),
+            "commits": commit_messages,
+            "files": files,
+            "head_sha": head_sha,
+            "base_sha": base_sha,
+        }
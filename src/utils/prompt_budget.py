@@ -0,0 +1,270 @@
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.chunking import estimate_tokens
+from utils.diff_parser import ADDED, CONTEXT, REMOVED, DiffLine, Hunk, file_hunks
+from utils.hunk_dedup import shared_note
+
+# Context window of the models we prompt
+MODEL_CONTEXT_TOKENS = {"gpt-4o": 128000}
+DEFAULT_CONTEXT_TOKENS = 128000
+# Headroom for message framing and tokenizer differences
+SAFETY_MARGIN_TOKENS = 1000
+# Context lines kept around each change once a diff no longer fits as is
+DEFAULT_CONTEXT_LINES = 1
+
+# Paths that deserve the reviewer's attention first
+RISKY_PATH_TERMS = (
+    "auth", "security", "crypto", "password", "secret", "token", "permission",
+    "payment", "billing", "sql", "migration", "session", "config", "settings",
+)
+LOW_RISK_PATTERN = re.compile(r"(^|/)(tests?|docs?|examples?)/|(^|/)test_|_test\.|\.(md|rst|txt)$")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    # Slow to import, so not at module load; without it (or its encoding files, offline)
+    # token counts fall back to a character estimate
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        # Unknown model or encoding files unavailable offline
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Count a text's tokens with the model's tokenizer when tiktoken is installed."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def tokenizer_name(model: str = "gpt-4o") -> str:
+    """Name of the tokenizer ``count_tokens`` uses for a model."""
+    encoding = _encoding(model)
+    return encoding.name if encoding is not None else "estimate"
+
+
+def prompt_budget(model: str, max_tokens: int, system_message: str) -> int:
+    """Tokens a prompt may use: PR_PROMPT_TOKENS, else what the context window leaves."""
+    if os.getenv("PR_PROMPT_TOKENS"):
+        return int(os.getenv("PR_PROMPT_TOKENS"))
+    context = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+    return context - max_tokens - count_tokens(system_message, model) - SAFETY_MARGIN_TOKENS
+
+
+def risk_score(file: Dict[str, Any]) -> float:
+    """Rough review priority of a file: sensitive paths and large changes first, tests and docs last."""
+    path = file["filename"].lower()
+    score = min(file.get("additions", 0) + file.get("deletions", 0), 500) / 100
+    if any(term in path for term in RISKY_PATH_TERMS):
+        score += 3
+    if LOW_RISK_PATTERN.search(path):
+        score -= 2
+    if file.get("status") == "removed":
+        score -= 1
+    return score
+
+
+def _indent(text: str) -> str:
+    return text[:len(text) - len(text.lstrip())]
+
+
+def _same_but_spacing(old: str, new: str) -> bool:
+    """True if two lines differ only in whitespace within the line; a changed indent is a real change."""
+    return _indent(old) == _indent(new) and WHITESPACE_PATTERN.sub("", old) == WHITESPACE_PATTERN.sub("", new)
+
+
+def _collapse_whitespace(lines: List[DiffLine]) -> Tuple[List[DiffLine], bool]:
+    """Turn removed/added runs that differ only in spacing within lines into context lines.
+
+    Indentation changes are kept: in Python or YAML they change what the code does.
+    """
+    result: List[DiffLine] = []
+    collapsed = False
+    index = 0
+    while index < len(lines):
+        removed_end = index
+        while removed_end < len(lines) and lines[removed_end].kind == REMOVED:
+            removed_end += 1
+        added_end = removed_end
+        while added_end < len(lines) and lines[added_end].kind == ADDED:
+            added_end += 1
+        removed, added = lines[index:removed_end], lines[removed_end:added_end]
+        if removed and len(removed) == len(added) and all(
+            _same_but_spacing(old.text, new.text) for old, new in zip(removed, added)
+        ):
+            result.extend(
+                DiffLine(CONTEXT, old.old_no, new.new_no, new.position, new.text)
+                for old, new in zip(removed, added)
+            )
+            collapsed = True
+            index = added_end
+        elif removed_end > index:
+            # Lone removals (or unequal runs) stay as they are; added lines are handled next round
+            result.extend(lines[index:removed_end])
+            index = removed_end
+        else:
+            result.append(lines[index])
+            index += 1
+    return result, collapsed
+
+
+def _hunk_texts(hunk: Hunk, lines: List[DiffLine], context: Optional[int]) -> List[str]:
+    """Render a hunk's lines, keeping only ``context`` lines around changes when set."""
+    changed = [index for index, line in enumerate(lines) if line.kind != CONTEXT]
+    if not changed:
+        return []
+    if context is None:
+        groups = [list(range(len(lines)))]
+    else:
+        keep = sorted({
+            kept for index in changed
+            for kept in range(max(0, index - context), min(len(lines), index + context + 1))
+        })
+        groups = []
+        for index in keep:
+            if groups and index == groups[-1][-1] + 1:
+                groups[-1].append(index)
+            else:
+                groups.append([index])
+
+    # Line numbers just before each line, for headers of pure additions/removals
+    old_cursor, new_cursor = [], []
+    old_no, new_no = hunk.old_start, hunk.new_start
+    for line in lines:
+        old_cursor.append(old_no)
+        new_cursor.append(new_no)
+        old_no += line.kind != ADDED
+        new_no += line.kind != REMOVED
+
+    section = hunk.header.split("@@", 2)[2] if hunk.header.count("@@") >= 2 else ""
+    texts = []
+    for group in groups:
+        part = [lines[index] for index in group]
+        old_count = sum(line.kind != ADDED for line in part)
+        new_count = sum(line.kind != REMOVED for line in part)
+        old_start = old_cursor[group[0]] if old_count else old_cursor[group[0]] - 1
+        new_start = new_cursor[group[0]] if new_count else new_cursor[group[0]] - 1
+        header = f"@@ -{old_start},{old_count} +{new_start},{new_count} @@{section}"
+        texts.append("\n".join([header] + [line.kind + line.text for line in part]))
+    return texts
+
+
+class PromptBudgeter:
+    """Fits a PR's diffs into a prompt's token budget.
+
+    Changes only to spacing within lines are collapsed into context and
+    hunks repeated verbatim are sent once. If the diff still doesn't fit,
+    context around each change is trimmed to ``context_lines``. Files go in by risk, most
+    important first, and whatever doesn't fit is cut at a hunk boundary or
+    left out and named in the prompt.
+    """
+
+    def __init__(self, budget: int, model: str = "gpt-4o", context_lines: Optional[int] = None):
+        self.budget = budget
+        self.model = model
+        self.context_lines = context_lines if context_lines is not None else int(
+            os.getenv("PR_CONTEXT_LINES", DEFAULT_CONTEXT_LINES))
+
+    def _compact_files(self, files: List[Dict[str, Any]], report: Dict[str, Any]) -> List[Tuple[Dict[str, Any], List[Any]]]:
+        """Parse each file once, collapsing spacing-only changes and marking repeated hunks.
+
+        Each file's entries are either ``(hunk, lines)`` to render or the
+        one-line text standing in for a repeated hunk.
+        """
+        seen: Dict[Tuple, str] = {}
+        compacted = []
+        for file in files:
+            entries = []
+            for hunk in file_hunks(file):
+                lines, collapsed = _collapse_whitespace(hunk.lines)
+                report["whitespace_hunks_collapsed"] += collapsed
+                signature = tuple((line.kind, line.text) for line in lines if line.kind != CONTEXT)
+                if signature and signature in seen:
+                    report["duplicate_hunks"] += 1
+                    entries.append(f"{hunk.header.split(' @@')[0]} @@ (same change as in {seen[signature]})")
+                    continue
+                if signature:
+                    seen[signature] = file["filename"]
+                entries.append((hunk, lines))
+            compacted.append((file, entries))
+        return compacted
+
+    def _render(self, compacted: List[Tuple[Dict[str, Any], List[Any]]],
+                context: Optional[int]) -> List[Tuple[Dict[str, Any], List[str]]]:
+        """Each file with its hunks rendered as text, keeping ``context`` lines around changes when set."""
+        rendered = []
+        for file, entries in compacted:
+            hunks = []
+            for entry in entries:
+                if isinstance(entry, str):
+                    hunks.append(entry)
+                else:
+                    hunks.extend(_hunk_texts(entry[0], entry[1], context))
+            rendered.append((file, hunks))
+        return rendered
+
+    def fit(self, files: List[Dict[str, Any]], available: int) -> Tuple[str, Dict[str, Any]]:
+        """Return the "Changes" text for ``files`` within ``available`` tokens and a report of what was cut."""
+        files = sorted(files, key=risk_score, reverse=True)
+        report = {"whitespace_hunks_collapsed": 0, "duplicate_hunks": 0, "context_lines": None}
+        parsed = self._compact_files(files, report)
+        compacted = self._render(parsed, None)
+        if sum(count_tokens(self._file_block(file, hunks), self.model) for file, hunks in compacted) > available:
+            report["context_lines"] = self.context_lines
+            compacted = self._render(parsed, self.context_lines)
+
+        included, truncated, omitted = [], [], []
+        used = 0
+        for file, hunks in compacted:
+            block = self._file_block(file, hunks)
+            size = count_tokens(block, self.model) + 1
+            if used + size <= available:
+                included.append(block)
+                used += size
+                continue
+            # Take the leading hunks that still fit, if any do
+            kept = []
+            kept_size = count_tokens(self._file_block(file, [], len(hunks)), self.model) + 1
+            for hunk in hunks:
+                hunk_size = count_tokens(hunk, self.model) + 1
+                if used + kept_size + hunk_size > available:
+                    break
+                kept.append(hunk)
+                kept_size += hunk_size
+            if kept:
+                block = self._file_block(file, kept, len(hunks))
+                included.append(block)
+                used += count_tokens(block, self.model) + 1
+                truncated.append(file["filename"])
+            else:
+                omitted.append(file["filename"])
+
+        if omitted:
+            included.append("Not shown (over the prompt budget): " + ", ".join(omitted))
+        report.update({"files_truncated": truncated, "files_omitted": omitted})
+        return "\n".join(included), report
+
+    def _file_block(self, file: Dict[str, Any], hunks: List[str], total: Optional[int] = None) -> str:
+        """One file's entry in the prompt's "Changes" section."""
+        if total is not None and len(hunks) < total:
+            note = f" (first {len(hunks)} of {total} hunks)"
+        elif "truncated" in file:
+            note = f" (first {file['truncated']['hunks']} of {file['truncated']['of']} hunks)"
+        else:
+            note = ""
+        note += shared_note(file)
+        if hunks:
+            changes = "\n".join(hunks)
+        else:
+            changes = "whitespace-only changes" if file.get("patch") else "no textual diff"
+        return f"File: {file['filename']}{note}\nChanges: {changes}"
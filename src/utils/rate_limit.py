@@ -0,0 +1,236 @@
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from utils.clients import get_github_session
+from utils.metrics import metrics
+
+# Request priorities; lower values are served first
+INTERACTIVE = 0
+BATCH = 1
+
+# Batch work leaves this much of each token's hourly budget for interactive use
+# (GITHUB_BATCH_RESERVE)
+DEFAULT_BATCH_RESERVE = 500
+# How long an interactive request waits for budget before giving up, in seconds
+# (GITHUB_INTERACTIVE_MAX_WAIT)
+DEFAULT_INTERACTIVE_MAX_WAIT = 120.0
+MAX_ATTEMPTS = 5
+# GitHub asks for at least a minute between retries after a secondary rate limit
+SECONDARY_BACKOFF = 60.0
+MAX_SECONDARY_BACKOFF = 15 * 60.0
+# A 403 secondary limit may come without Retry-After; only its message tells it from a permission error
+SECONDARY_LIMIT_PATTERN = re.compile(r"secondary rate limit|abuse detection", re.IGNORECASE)
+
+
+class GitHubRateLimitError(Exception):
+    """Raised when no token has budget left within the request's wait limit."""
+
+
+def resource_for_url(url: str) -> str:
+    """Name the GitHub rate-limit bucket a request is charged to."""
+    if url.rstrip("/").endswith("/graphql"):
+        return "graphql"
+    if "/search/" in url:
+        return "search"
+    return "core"
+
+
+class _TokenState:
+    """What the scheduler knows about one token's rate-limit buckets."""
+
+    def __init__(self, token: str):
+        self.token = token
+        # resource -> [remaining, reset epoch]; unknown until the first response
+        self.buckets: Dict[str, List[float]] = {}
+        self.blocked_until = 0.0
+        self.secondary_strikes = 0
+
+    def remaining(self, resource: str, now: float) -> float:
+        bucket = self.buckets.get(resource)
+        if bucket is None or now >= bucket[1]:
+            return float("inf")
+        return bucket[0]
+
+    def available_at(self, resource: str, reserve: int, now: float) -> float:
+        """Earliest time this token can take a request with the given reserve."""
+        ready = self.blocked_until
+        if self.remaining(resource, now) <= reserve:
+            ready = max(ready, self.buckets[resource][1])
+        return ready
+
+
+class GitHubScheduler:
+    """Spreads GitHub requests over a pool of tokens without tripping rate limits.
+
+    Each response's ``X-RateLimit-Remaining``/``X-RateLimit-Reset`` headers
+    update the token it was sent with, and every request goes to the token
+    with the most budget left. Secondary rate limits (a 429, or a 403 with
+    ``Retry-After`` or a secondary rate limit message) park the token with
+    backoff and the request is retried on another one. Waiting requests are
+    served in priority order, and batch requests never spend a token's last
+    ``batch_reserve`` requests (default: GITHUB_BATCH_RESERVE, then 500),
+    keeping them for interactive use. Interactive requests wait at most
+    ``interactive_max_wait`` seconds for budget (default:
+    GITHUB_INTERACTIVE_MAX_WAIT, then 120).
+    """
+
+    def __init__(self, tokens: List[str], session_for_token: Callable[[str], requests.Session] = get_github_session,
+                 batch_reserve: Optional[int] = None, interactive_max_wait: Optional[float] = None):
+        if not tokens:
+            raise ValueError("GitHub token not found in environment variables")
+        self.batch_reserve = batch_reserve if batch_reserve is not None else int(
+            os.getenv("GITHUB_BATCH_RESERVE", DEFAULT_BATCH_RESERVE))
+        self.interactive_max_wait = interactive_max_wait if interactive_max_wait is not None else float(
+            os.getenv("GITHUB_INTERACTIVE_MAX_WAIT", DEFAULT_INTERACTIVE_MAX_WAIT))
+        self._tokens = [_TokenState(token) for token in tokens]
+        self._session_for_token = session_for_token
+        self._condition = threading.Condition()
+        self._waiting: List[tuple] = []
+        self._sequence = itertools.count()
+
+    def _pick(self, resource: str, reserve: int, now: float) -> Optional[_TokenState]:
+        ready = [
+            state for state in self._tokens
+            if state.blocked_until <= now and state.remaining(resource, now) > reserve
+        ]
+        return max(ready, key=lambda state: state.remaining(resource, now)) if ready else None
+
+    def acquire(self, priority: int = INTERACTIVE, resource: str = "core",
+                max_wait: Optional[float] = None) -> str:
+        """Wait for a token with budget for one request and return it."""
+        reserve = self.batch_reserve if priority >= BATCH else 0
+        ticket = (priority, next(self._sequence))
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.time()
+                    if self._waiting[0] == ticket:
+                        state = self._pick(resource, reserve, now)
+                        if state is not None:
+                            bucket = state.buckets.get(resource)
+                            if bucket is not None and now < bucket[1]:
+                                # Count the request up front so concurrent callers spread out
+                                bucket[0] -= 1
+                            return state.token
+                        ready_at = min(state.available_at(resource, reserve, now) for state in self._tokens)
+                        timeout = max(ready_at - now, 0.05)
+                    else:
+                        timeout = None
+                    if deadline is not None:
+                        left = deadline - time.monotonic()
+                        if left <= 0:
+                            raise GitHubRateLimitError("GitHub rate limit reached on every available token")
+                        timeout = left if timeout is None else min(timeout, left)
+                    self._condition.wait(timeout)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+
+    def update(self, token: str, status: int, headers, message: str = "") -> bool:
+        """Record a response's rate-limit headers; return True if it was rate limited.
+
+        ``message`` is the response body, needed to recognise a 403 secondary
+        limit sent without ``Retry-After``.
+        """
+        now = time.time()
+        with self._condition:
+            state = next(state for state in self._tokens if state.token == token)
+            resource = headers.get("X-RateLimit-Resource", "core")
+            remaining = headers.get("X-RateLimit-Remaining")
+            reset = headers.get("X-RateLimit-Reset")
+            if remaining is not None and reset is not None:
+                state.buckets[resource] = [float(remaining), float(reset)]
+
+            limited = status == 429 or status == 403 and (
+                remaining == "0" or "Retry-After" in headers or bool(SECONDARY_LIMIT_PATTERN.search(message)))
+            if limited:
+                metrics.increment("github_rate_limited")
+            if not limited:
+                state.secondary_strikes = 0
+            elif remaining == "0" and reset is not None:
+                state.blocked_until = float(reset)
+            else:
+                # Secondary rate limit: honour Retry-After, otherwise back off exponentially
+                retry_after = headers.get("Retry-After")
+                if retry_after is not None:
+                    delay = float(retry_after)
+                else:
+                    delay = min(SECONDARY_BACKOFF * 2 ** state.secondary_strikes, MAX_SECONDARY_BACKOFF)
+                state.secondary_strikes += 1
+                state.blocked_until = now + delay
+            self._condition.notify_all()
+            return limited
+
+    def request(self, method: str, url: str, priority: int = INTERACTIVE, **kwargs) -> requests.Response:
+        """Send a request on the best available token, retrying rate-limited attempts."""
+        resource = resource_for_url(url)
+        max_wait = self.interactive_max_wait if priority == INTERACTIVE else None
+        for attempt in range(MAX_ATTEMPTS):
+            token = self.acquire(priority, resource, max_wait)
+            response = self._session_for_token(token).request(method, url, **kwargs)
+            message = response.text if response.status_code == 403 else ""
+            if not self.update(token, response.status_code, response.headers, message) or attempt == MAX_ATTEMPTS - 1:
+                return response
+        return response
+
+    def call(self, fn: Callable[[str], object], priority: int = INTERACTIVE, resource: str = "core"):
+        """Run ``fn(token)`` (e.g. a PyGithub call) on the best available token.
+
+        ``fn`` should raise an exception carrying ``status``, ``headers`` and
+        the response body as ``data`` (as PyGithub's ``GithubException``
+        does) when GitHub rate limits it; rate-limited calls are retried on
+        another token.
+        """
+        max_wait = self.interactive_max_wait if priority == INTERACTIVE else None
+        for attempt in range(MAX_ATTEMPTS):
+            token = self.acquire(priority, resource, max_wait)
+            try:
+                return fn(token)
+            except Exception as e:
+                status = getattr(e, "status", None)
+                headers = getattr(e, "headers", None) or {}
+                message = str(getattr(e, "data", None) or "")
+                if status is None or not self.update(token, status, headers, message) or attempt == MAX_ATTEMPTS - 1:
+                    raise
+
+    def record_rate_limit(self, token: str, remaining: int, reset: float, resource: str = "core") -> None:
+        """Record budget learned outside ``request`` (e.g. from a PyGithub client)."""
+        if remaining < 0:
+            return
+        with self._condition:
+            state = next(state for state in self._tokens if state.token == token)
+            state.buckets[resource] = [float(remaining), float(reset)]
+            self._condition.notify_all()
+
+
+def configured_tokens(default_token: Optional[str] = None) -> List[str]:
+    """Tokens from GITHUB_TOKENS (comma-separated), falling back to one token."""
+    pooled = [token.strip() for token in os.getenv("GITHUB_TOKENS", "").split(",") if token.strip()]
+    if pooled:
+        return pooled
+    token = default_token or os.getenv("GITHUB_TOKEN")
+    return [token] if token else []
+
+
+_schedulers: Dict[tuple, GitHubScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(default_token: Optional[str] = None) -> GitHubScheduler:
+    """Return the process-wide scheduler for the configured token pool."""
+    tokens = tuple(configured_tokens(default_token))
+    with _schedulers_lock:
+        if tokens not in _schedulers:
+            _schedulers[tokens] = GitHubScheduler(list(tokens))
+        return _schedulers[tokens]
@@ -0,0 +1,173 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.diff_parser import file_hunks
+from utils.findings import format_finding, index_by_basename, resolve_path
+
+# Inline comments per review; further findings go into the review body
+MAX_INLINE_COMMENTS = 100
+
+# "path/to/file.py:42", "path/to/file.py:42-48" or "Makefile:12", optionally in backticks;
+# only paths that resolve to one of the PR's files count
+LOCATION_PATTERN = re.compile(r"`?(?P<path>[\w.@+/-]+)`?:(?P<start>\d+)(?:\s*[-–]\s*(?P<end>\d+))?")
+# "line 42" / "lines 42-48" under a "File: <path>" heading
+LINE_PATTERN = re.compile(r"\blines?\s+(?P<start>\d+)(?:\s*(?:[-–]|to)\s*(?P<end>\d+))?", re.IGNORECASE)
+FILE_HEADING_PATTERN = re.compile(r"^#{1,6}\s*File:\s*`?([^`\n]+?)`?\s*$")
+HEADING_PATTERN = re.compile(r"^#{1,6}\s")
+LIST_ITEM_PATTERN = re.compile(r"^\s{0,3}(?:[-*+]|\d+[.)])\s+")
+
+
+class DiffPositionIndex:
+    """Maps new-side line numbers of a PR's files to GitHub diff positions.
+
+    Each file's hunks (parsed once per file, see ``file_hunks``) become a
+    ``{line: position}`` map the first time the file is looked up, so anchors
+    on large diffs are dict lookups.
+    """
+
+    def __init__(self, files: List[Dict[str, Any]]):
+        self._files = {file["filename"]: file for file in files if file.get("patch")}
+        self._by_basename = index_by_basename(self._files)
+        self._line_maps: Dict[str, Dict[int, int]] = {}
+
+    def resolve(self, path: str) -> Optional[str]:
+        """The PR file with a diff that ``path`` refers to."""
+        return resolve_path(path, self._by_basename)
+
+    def line_map(self, filename: str) -> Dict[int, int]:
+        """``{new-side line number: diff position}`` for one file's added and context lines."""
+        line_map = self._line_maps.get(filename)
+        if line_map is None:
+            file = self._files.get(filename)
+            line_map = {
+                line.new_no: line.position
+                for hunk in (file_hunks(file) if file else ())
+                for line in hunk.lines if line.new_no is not None
+            }
+            self._line_maps[filename] = line_map
+        return line_map
+
+    def position(self, filename: str, start: int, end: Optional[int] = None) -> Optional[int]:
+        """Diff position to anchor a comment on lines ``start``-``end``, or None if none of them are in the diff.
+
+        GitHub shows a comment below the line it is anchored to, so the last
+        line of the range that is in the diff is used.
+        """
+        line_map = self.line_map(filename)
+        end = max(end or start, start)
+        for line in range(end, max(start, end - 500) - 1, -1):
+            if line in line_map:
+                return line_map[line]
+        return None
+
+
+def _blocks(analysis: str) -> List[Tuple[Optional[str], str]]:
+    """Split a markdown review into findings: list items or paragraphs, each with its "File:" section.
+
+    Fenced code blocks stay with the finding they follow.
+    """
+    blocks: List[Tuple[Optional[str], str]] = []
+    current: List[str] = []
+    section = None
+    in_fence = False
+
+    def close():
+        text = "\n".join(current).strip()
+        if text:
+            blocks.append((section, text))
+        current.clear()
+
+    for line in analysis.splitlines():
+        if line.strip().startswith("```"):
+            in_fence = not in_fence
+            current.append(line)
+            continue
+        if in_fence:
+            current.append(line)
+            continue
+        heading = FILE_HEADING_PATTERN.match(line)
+        if heading or HEADING_PATTERN.match(line):
+            close()
+            section = heading.group(1).strip() if heading else None
+            continue
+        if not line.strip() or LIST_ITEM_PATTERN.match(line):
+            close()
+        current.append(line)
+    close()
+    return blocks
+
+
+def extract_findings(analysis: str, index: DiffPositionIndex) -> List[Dict[str, Any]]:
+    """Findings in a markdown review that cite a location in one of the PR's files.
+
+    A finding cites ``path:line`` (or ``path:start-end``), or mentions
+    "line N" under a "### File: <path>" heading. Each returned finding has
+    ``path``, ``line``, ``end_line`` (or None) and its markdown ``body``.
+    """
+    findings = []
+    for section, text in _blocks(analysis):
+        location = None
+        for match in LOCATION_PATTERN.finditer(text):
+            path = index.resolve(match.group("path"))
+            if path:
+                location = (path, match.group("start"), match.group("end"))
+                break
+        if location is None and section:
+            path = index.resolve(section)
+            match = LINE_PATTERN.search(text)
+            if path and match:
+                location = (path, match.group("start"), match.group("end"))
+        if location is None:
+            continue
+        path, start, end = location
+        findings.append({
+            "path": path,
+            "line": int(start),
+            "end_line": int(end) if end else None,
+            "body": text,
+        })
+    return findings
+
+
+def _structured_findings(findings: List[Dict[str, Any]], index: DiffPositionIndex) -> List[Dict[str, Any]]:
+    """Structured findings (see utils.findings) that have a line, in the shape ``extract_findings`` returns."""
+    return [
+        {"path": index.resolve(finding["file"]) or finding["file"], "line": finding["start_line"],
+         "end_line": finding["end_line"], "body": format_finding(finding)}
+        for finding in findings if finding["start_line"]
+    ]
+
+
+def build_review_comments(analysis: str, files: List[Dict[str, Any]], max_comments: int = MAX_INLINE_COMMENTS,
+                          findings: Optional[List[Dict[str, Any]]] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Turn the findings of a review into inline comments for one ``create_review`` call.
+
+    Structured ``findings`` are used when given; otherwise findings are
+    extracted from the markdown ``analysis``.
+
+    Every anchor is checked against the PR's diffs first, since GitHub
+    rejects the whole review if one comment points outside the diff.
+    Findings on the same diff position are merged into one comment.
+
+    Returns the comments (``path``, ``position``, ``body``) and the findings
+    that cite a location no comment could be anchored to.
+    """
+    index = DiffPositionIndex(files)
+    comments: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    unanchored = []
+    located = _structured_findings(findings, index) if findings is not None else extract_findings(analysis, index)
+    for finding in located:
+        position = index.position(finding["path"], finding["line"], finding["end_line"])
+        key = (finding["path"], position)
+        if position is None or (key not in comments and len(comments) >= max_comments):
+            unanchored.append(finding)
+        elif key in comments:
+            comments[key]["body"] += "\n\n" + finding["body"]
+        else:
+            comments[key] = {"path": finding["path"], "position": position, "body": finding["body"]}
+    return list(comments.values()), unanchored
+
+
+def format_comments_as_text(comments: List[Dict[str, Any]]) -> str:
+    """Inline comments as a markdown section, for when they can't be posted inline."""
+    return "\n\n".join(f"**{comment['path']}**\n\n{comment['body']}" for comment in comments)
@@ -0,0 +1,327 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.findings import apply_min_severity
+from utils.metrics import metrics
+
+logger = logging.getLogger("pr_analyzer.webhook")
+
+DEFAULT_WEBHOOK_PORT = 8080
+DEFAULT_WEBHOOK_WORKERS = 2
+# A PR is reviewed once no new push has arrived for this many seconds
+DEFAULT_DEBOUNCE_SECONDS = float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", "5"))
+DEFAULT_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))
+# GitHub caps webhook payloads at 25 MB
+MAX_BODY_BYTES = 25 * 1024 * 1024
+REVIEW_ACTIONS = ("opened", "synchronize", "reopened")
+# Reviewed (PR, head SHA) keys remembered so redeliveries aren't reviewed twice
+RECENT_KEYS = 10_000
+
+PRKey = Tuple[str, int]
+
+
+def verify_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """Check a payload against its ``X-Hub-Signature-256`` header."""
+    if not signature or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature[len("sha256="):], expected)
+
+
+def sign(secret: str, body: bytes) -> str:
+    """The ``X-Hub-Signature-256`` header GitHub would send with ``body``."""
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+class Job:
+    """A request to review one PR at one head SHA."""
+
+    __slots__ = ("url", "repo", "number", "head_sha", "received_at", "ready_at", "coalesced")
+
+    def __init__(self, url: str, repo: str, number: int, head_sha: str, ready_at: float = 0.0):
+        self.url = url
+        self.repo = repo
+        self.number = number
+        self.head_sha = head_sha
+        self.received_at = time.monotonic()
+        self.ready_at = ready_at
+        self.coalesced = 0
+
+    @property
+    def pr(self) -> PRKey:
+        return (self.repo, self.number)
+
+    def __repr__(self) -> str:
+        return f"Job({self.repo}#{self.number}@{self.head_sha[:7]})"
+
+
+def job_from_payload(payload: Any) -> Optional[Job]:
+    """The review job a ``pull_request`` payload asks for, or None if the payload is malformed."""
+    if not isinstance(payload, dict):
+        return None
+    pr, repository = payload.get("pull_request"), payload.get("repository")
+    if not isinstance(pr, dict) or not isinstance(repository, dict) or not isinstance(pr.get("head"), dict):
+        return None
+    url, repo, number, head_sha = pr.get("html_url"), repository.get("full_name"), pr.get("number"), pr["head"].get("sha")
+    if not all(isinstance(value, str) and value for value in (url, repo, head_sha)):
+        return None
+    if not isinstance(number, int) or isinstance(number, bool) or number <= 0:
+        return None
+    return Job(url, repo, number, head_sha)
+
+
+class JobQueue:
+    """Pending reviews keyed by PR, where a newer push replaces one still waiting.
+
+    A job becomes ready ``debounce`` seconds after its last push, so a burst
+    of pushes is reviewed once at its final head SHA. Only one job per PR
+    runs at a time; a push landing while its PR is being reviewed waits for
+    that review to finish. Events for a (PR, head SHA) seen before, such as
+    redeliveries or a late copy of an already superseded push, are dropped as
+    duplicates unless its review failed.
+    """
+
+    def __init__(self, debounce: float = DEFAULT_DEBOUNCE_SECONDS, max_pending: int = DEFAULT_MAX_PENDING):
+        self.debounce = debounce
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._pending: Dict[PRKey, Job] = {}
+        self._running: Dict[PRKey, Job] = {}
+        # Latest head SHA pushed to each PR, and every (repo, number, sha) accepted recently
+        self._latest: "OrderedDict[PRKey, str]" = OrderedDict()
+        self._seen: "OrderedDict[Tuple[str, int, str], None]" = OrderedDict()
+        self._closed = False
+        self.stats = {"queued": 0, "coalesced": 0, "duplicate": 0, "rejected": 0,
+                      "completed": 0, "failed": 0, "superseded": 0}
+
+    def _remember(self, key: Tuple[str, int, str]) -> None:
+        self._seen[key] = None
+        self._seen.move_to_end(key)
+        while len(self._seen) > RECENT_KEYS:
+            self._seen.popitem(last=False)
+
+    def put(self, job: Job) -> str:
+        """Queue a job; returns "queued", "coalesced", "duplicate" or "rejected"."""
+        with self._cond:
+            if (job.repo, job.number, job.head_sha) in self._seen:
+                status = "duplicate"
+            elif self._closed or (job.pr not in self._pending and len(self._pending) >= self.max_pending):
+                status = "rejected"
+            else:
+                superseded = self._pending.get(job.pr)
+                status = "coalesced" if superseded else "queued"
+                if superseded:
+                    job.coalesced = superseded.coalesced + 1
+                job.ready_at = time.monotonic() + self.debounce
+                self._pending[job.pr] = job
+                self._remember((job.repo, job.number, job.head_sha))
+                self._latest[job.pr] = job.head_sha
+                self._latest.move_to_end(job.pr)
+                if len(self._latest) > RECENT_KEYS:
+                    self._latest.popitem(last=False)
+                self._cond.notify_all()
+            self.stats[status] += 1
+            return status
+
+    def get(self) -> Optional[Job]:
+        """Block until a job is ready to run; None once the queue is closed."""
+        with self._cond:
+            while not self._closed:
+                now = time.monotonic()
+                wait = None
+                for pr, job in self._pending.items():
+                    if pr in self._running:
+                        continue
+                    if job.ready_at <= now:
+                        del self._pending[pr]
+                        self._running[pr] = job
+                        return job
+                    wait = job.ready_at - now if wait is None else min(wait, job.ready_at - now)
+                self._cond.wait(wait)
+            return None
+
+    def is_superseded(self, job: Job) -> bool:
+        """Whether a newer push has arrived for the job's PR."""
+        with self._cond:
+            return self._latest.get(job.pr, job.head_sha) != job.head_sha
+
+    def done(self, job: Job, status: str, reviewed_sha: Optional[str] = None) -> None:
+        """Mark a running job finished ("completed", "failed" or "superseded").
+
+        A failed job's SHA is forgotten so a redelivery can retry it.
+        ``reviewed_sha`` is the head SHA actually fetched, which can be newer
+        than the job's when a push landed in between; it is remembered too so
+        that push's event isn't reviewed again.
+        """
+        with self._cond:
+            self._running.pop(job.pr, None)
+            if status == "failed":
+                self._seen.pop((job.repo, job.number, job.head_sha), None)
+            elif reviewed_sha and reviewed_sha != job.head_sha:
+                self._remember((job.repo, job.number, reviewed_sha))
+            self.stats[status] += 1
+            self._cond.notify_all()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until nothing is pending or running; False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self) -> None:
+        """Stop handing out jobs; pending ones are abandoned."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {**self.stats, "pending": len(self._pending), "running": len(self._running)}
+
+
+class WebhookService:
+    """Turns ``pull_request`` webhooks into reviews posted back to the PR.
+
+    Events are verified against ``secret``, queued on a ``JobQueue`` and
+    run by ``workers`` threads: ``fetch_pr(url)``, then ``agent.analyze_pr``,
+    then ``submit_review(url, pr_data, results)``. A review whose PR received a newer
+    push in the meantime is not posted, and findings less severe than
+    ``min_severity`` are left out of the posted review.
+    """
+
+    def __init__(self, secret: str, fetch_pr: Callable[[str], Dict[str, Any]], agent,
+                 submit_review: Callable[[str, Dict[str, Any], Dict[str, Any]], Dict[str, Any]], workers: int = DEFAULT_WEBHOOK_WORKERS,
+                 queue: Optional[JobQueue] = None, min_severity: Optional[str] = None):
+        if not secret:
+            raise ValueError("A webhook secret is required to verify payload signatures")
+        self.secret = secret
+        self.fetch_pr = fetch_pr
+        self.agent = agent
+        self.submit_review = submit_review
+        self.min_severity = min_severity
+        self.queue = queue or JobQueue()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"webhook-worker-{index}", daemon=True)
+            for index in range(workers)
+        ]
+
+    def start(self) -> "WebhookService":
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.queue.close()
+
+    def handle_event(self, event: str, body: bytes, signature: Optional[str]) -> Tuple[int, Dict[str, Any]]:
+        """Verify and queue one webhook delivery; returns the HTTP status and JSON reply."""
+        if not verify_signature(self.secret, body, signature):
+            metrics.increment("webhook_events", status="bad_signature")
+            return 401, {"error": "invalid signature"}
+        if event == "ping":
+            return 200, {"status": "pong"}
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return 400, {"error": "invalid JSON"}
+        if event != "pull_request" or (isinstance(payload, dict) and payload.get("action") not in REVIEW_ACTIONS):
+            metrics.increment("webhook_events", status="ignored")
+            return 202, {"status": "ignored"}
+
+        job = job_from_payload(payload)
+        if job is None:
+            metrics.increment("webhook_events", status="malformed")
+            return 400, {"error": "malformed pull_request payload"}
+        status = self.queue.put(job)
+        metrics.increment("webhook_events", status=status)
+        logger.info(json.dumps({"event": "webhook", "job": repr(job), "status": status}))
+        return (503 if status == "rejected" else 202), {"status": status}
+
+    def _work(self) -> None:
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            try:
+                self._run(job)
+            except Exception:
+                logger.exception("Webhook job %r crashed", job)
+                self.queue.done(job, "failed")
+
+    def _run(self, job: Job) -> None:
+        record = {"url": job.url, "head_sha": job.head_sha}
+        status = "failed"
+        with metrics.span("webhook_job") as span:
+            try:
+                pr_data = self.fetch_pr(job.url)
+                record["head_sha"] = pr_data.get("head_sha")
+                results = apply_min_severity(self.agent.analyze_pr(pr_data), self.min_severity)
+                if self.queue.is_superseded(job):
+                    status = "superseded"
+                else:
+                    review = self.submit_review(job.url, pr_data, results)
+                    status = "completed" if review.get("success") else "failed"
+                    record["review"] = review.get("message")
+            except Exception as e:
+                record["error"] = str(e)
+            span["status"] = status
+        record.update({"status": status, "coalesced": job.coalesced,
+                       "latency_seconds": round(time.monotonic() - job.received_at, 3)})
+        logger.info(json.dumps({"event": "webhook_job", **record}))
+        self.queue.done(job, status, record["head_sha"])
+
+
+def serve_webhooks(service: WebhookService, port: int = DEFAULT_WEBHOOK_PORT, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Build an HTTP server that feeds POSTed webhooks to ``service`` and reports its queue on GET /healthz."""
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, payload: Dict[str, Any]) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/healthz":
+                self.send_error(404)
+                return
+            self._reply(200, service.queue.snapshot())
+
+        def do_POST(self):
+            header = self.headers.get("Content-Length")
+            if header is None:
+                self._reply(411, {"error": "Content-Length required"})
+                return
+            try:
+                length = int(header)
+            except ValueError:
+                length = -1
+            if length < 0:
+                self._reply(400, {"error": "invalid Content-Length"})
+                return
+            if length > MAX_BODY_BYTES:
+                self._reply(413, {"error": "payload too large"})
+                return
+            body = self.rfile.read(length)
+            self._reply(*service.handle_event(self.headers.get("X-GitHub-Event", ""), body,
+                                              self.headers.get("X-Hub-Signature-256")))
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), WebhookHandler)
@@ -0,0 +1,56 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The app imports its modules from src/; the fake servers live with the benchmarks
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "benchmarks")]
+
+from types import SimpleNamespace
+
+import pytest
+
+
+class StubCompletions:
+    """Stands in for ``client.chat.completions``, answering each prompt with ``respond``.
+
+    ``respond`` is a fixed reply, a list of replies given in turn, or a
+    function of the prompt. Prompts are kept in ``prompts``; ``usage`` is
+    reported with each completion, and as the last chunk of a stream.
+    """
+
+    def __init__(self, respond="", usage=None):
+        self.respond = respond
+        self.usage = usage
+        self.prompts = []
+
+    def create(self, messages, stream=False, **kwargs):
+        prompt = messages[-1]["content"]
+        self.prompts.append(prompt)
+        if callable(self.respond):
+            content = self.respond(prompt)
+        elif isinstance(self.respond, list):
+            content = self.respond.pop(0)
+        else:
+            content = self.respond
+        if stream:
+            delta = SimpleNamespace(delta=SimpleNamespace(content=content))
+            return iter([SimpleNamespace(choices=[delta], usage=None), SimpleNamespace(choices=[], usage=self.usage)])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=self.usage)
+
+
+@pytest.fixture
+def stub_agent():
+    """Builds ``PRAnalyzerAgent``s answered by a ``StubCompletions``.
+
+    ``stub_agent(respond, usage=None, **agent_kwargs)``; the agent skips the
+    response cache and history unless ``agent_kwargs`` say otherwise, and
+    its stub is ``agent.client.chat.completions``.
+    """
+    from agent import PRAnalyzerAgent
+
+    def make(respond="", usage=None, **kwargs):
+        agent = PRAnalyzerAgent(**{"use_cache": False, "record_history": False, **kwargs})
+        agent._client = SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions(respond, usage)))
+        return agent
+
+    return make
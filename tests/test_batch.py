@@ -0,0 +1,72 @@
+import json
+
+from batch import load_completed_urls, read_pr_urls, run_batch
+
+FINDINGS = json.dumps({"summary": "Two issues", "findings": [
+    {"file": "src/app.py", "start_line": 1, "end_line": 1, "severity": "major", "message": "SQL built from input"},
+    {"file": "src/app.py", "start_line": 2, "end_line": 2, "severity": "minor", "message": "Unclear name"},
+]})
+
+
+def fetch_pr(url):
+    number = int(url.rsplit("/", 1)[-1])
+    return {"title": f"PR {number}", "description": "", "files_changed": ["src/app.py"], "commits": [],
+            "repo": "octo/repo", "number": number, "head_sha": f"sha{number}",
+            "files": [{"filename": "src/app.py", "status": "modified", "additions": 2, "deletions": 0,
+                       "patch": "@@ -0,0 +1,2 @@\n+query(input)\n+x = 1"}]}
+
+
+def _records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_records_leave_out_findings_below_min_severity(stub_agent, tmp_path):
+    output = str(tmp_path / "results.jsonl")
+
+    run_batch(["https://github.com/octo/repo/pull/1"], fetch_pr, stub_agent(FINDINGS, structured=True, prune=False),
+              output, workers=1, min_severity="major")
+
+    record, = _records(output)
+    assert [finding["severity"] for finding in record["findings"]] == ["major"]
+    assert "Unclear name" not in record["analysis"]
+
+
+def test_resume_skips_completed_prs_and_retries_failed_ones(stub_agent, tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    urls = [f"https://github.com/octo/repo/pull/{number}" for number in (1, 2, 3)]
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"url": urls[0], "status": "completed"}) + "\n")
+        f.write(json.dumps({"url": urls[1], "status": "error", "error": "timeout"}) + "\n")
+        # A crash mid-write leaves a partial last line
+        f.write('{"url": "' + urls[2])
+    fetched = []
+
+    summary = run_batch(urls + [urls[1]], lambda url: fetched.append(url) or fetch_pr(url),
+                        stub_agent("Looks fine", prune=False), output, workers=2, resume=True)
+
+    assert sorted(fetched) == urls[1:]
+    assert (summary["total"], summary["completed"], summary["skipped"]) == (2, 2, 2)
+    assert load_completed_urls(output) == set(urls)
+
+
+def test_failures_are_recorded_without_stopping_the_batch(stub_agent, tmp_path):
+    output = str(tmp_path / "results.jsonl")
+
+    def fetch(url):
+        if url.endswith("/2"):
+            raise ValueError("PR not found")
+        return fetch_pr(url)
+
+    summary = run_batch([f"https://github.com/octo/repo/pull/{number}" for number in (1, 2)], fetch,
+                        stub_agent("Looks fine", prune=False), output, workers=1)
+
+    assert (summary["completed"], summary["failed"]) == (1, 1)
+    assert {record["status"] for record in _records(output)} == {"completed", "error"}
+
+
+def test_read_pr_urls_skips_blank_lines_and_comments(tmp_path):
+    path = tmp_path / "prs.txt"
+    path.write_text("# sweep\nhttps://github.com/octo/repo/pull/1\n\n  https://github.com/octo/repo/pull/2  \n")
+
+    assert read_pr_urls(str(path)) == ["https://github.com/octo/repo/pull/1", "https://github.com/octo/repo/pull/2"]
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+from docx import Document
+
+from best_practices import BestPracticesProcessor
+
+
+def write_doc(path, heading, *rules):
+    doc = Document()
+    doc.add_heading(heading, level=1)
+    for rule in rules:
+        doc.add_paragraph(rule)
+    doc.save(path)
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Paths of the documents parsed, in order."""
+    parsed = []
+    process = BestPracticesProcessor._process_docx
+
+    def counting(self, path):
+        parsed.append(os.path.basename(path))
+        return process(self, path)
+
+    monkeypatch.setattr(BestPracticesProcessor, "_process_docx", counting)
+    return parsed
+
+
+def test_stored_corpus_is_reused_while_documents_are_unchanged(tmp_path, parses):
+    write_doc(tmp_path / "python.docx", "Naming", "Use snake_case for functions")
+    first = BestPracticesProcessor(str(tmp_path))
+    index = first.get_index()
+
+    second = BestPracticesProcessor(str(tmp_path))
+
+    assert parses == ["python.docx"]
+    assert second.get_sections() == first.get_sections()
+    assert not first.refresh()
+    assert first.get_index() is index
+
+
+def test_changed_added_and_removed_documents_are_detected(tmp_path, parses):
+    write_doc(tmp_path / "python.docx", "Naming", "Use snake_case for functions")
+    write_doc(tmp_path / "sql.docx", "Queries", "Use bound parameters")
+    processor = BestPracticesProcessor(str(tmp_path))
+    index = processor.get_index()
+
+    write_doc(tmp_path / "python.docx", "Naming", "Use snake_case for functions", "Name constants in CAPS")
+    # Make the change visible even where mtimes are coarse
+    os.utime(tmp_path / "python.docx", (1, 1))
+    assert processor.refresh()
+    assert parses == ["python.docx", "sql.docx", "python.docx"]
+    assert "Name constants in CAPS" in processor.get_best_practices()
+    assert processor.get_index() is not index
+
+    os.remove(tmp_path / "sql.docx")
+    assert processor.refresh()
+    assert [section["heading"] for section in processor.get_sections()] == ["Naming"]
+    assert len(parses) == 3
@@ -0,0 +1,42 @@
+from utils.chunking import chunk_files, estimate_tokens
+
+
+def _hunk(start, lines=10):
+    return f"@@ -{start},0 +{start},{lines} @@\n" + "\n".join(f"+line_{start}_{index} = {index}" for index in range(lines))
+
+
+def _file(name, *hunks):
+    return {"filename": name, "status": "modified", "patch": "\n".join(hunks)}
+
+
+def test_small_files_share_a_chunk_until_the_budget_is_used():
+    files = [_file(f"src/file_{index}.py", _hunk(1)) for index in range(5)]
+    size = estimate_tokens(files[0]["patch"]) + estimate_tokens(files[0]["filename"])
+
+    chunks = chunk_files(files, size * 2)
+
+    assert [[file["filename"] for file in chunk] for chunk in chunks] == [
+        ["src/file_0.py", "src/file_1.py"], ["src/file_2.py", "src/file_3.py"], ["src/file_4.py"],
+    ]
+
+
+def test_oversized_file_is_split_along_hunks_into_numbered_parts():
+    hunks = [_hunk(start) for start in (1, 20, 40)]
+    budget = estimate_tokens(hunks[0]) + 5
+
+    chunks = chunk_files([_file("src/big.py", *hunks), _file("src/small.py", "@@ -1 +1 @@\n-a\n+b")], budget)
+
+    parts = [file for chunk in chunks for file in chunk if file["filename"] == "src/big.py"]
+    assert [(part["part"], part["parts"]) for part in parts] == [(1, 3), (2, 3), (3, 3)]
+    assert [part["patch"] for part in parts] == hunks
+    # Every file is in exactly one chunk, in order
+    assert [file["filename"] for chunk in chunks for file in chunk] == ["src/big.py"] * 3 + ["src/small.py"]
+
+
+def test_a_hunk_larger_than_the_budget_is_kept_whole():
+    hunk = _hunk(1, lines=50)
+
+    chunks = chunk_files([_file("src/big.py", hunk)], 10)
+
+    assert len(chunks) == 1
+    assert chunks[0][0]["patch"] == hunk
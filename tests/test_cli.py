@@ -0,0 +1,58 @@
+import json
+from argparse import Namespace
+from types import SimpleNamespace
+
+import pytest
+
+import pr_analyzer
+
+RESPONSE = json.dumps({"summary": "Two issues", "findings": [
+    {"file": "src/file_0.py", "start_line": 2, "severity": "critical", "message": "Critical problem"},
+    {"file": "src/file_0.py", "start_line": 2, "severity": "info", "message": "Style nit"},
+]})
+
+
+def _pr():
+    files = [{"filename": "src/file_0.py", "status": "modified", "additions": 1, "deletions": 0,
+              "patch": "@@ -1 +1,2 @@\n x\n+value = 0"}]
+    return {"title": "t", "description": "", "files_changed": ["src/file_0.py"], "files": files, "changes": "",
+            "commits": [], "repo": "test/repo", "number": 1, "head_sha": "abc"}
+
+
+@pytest.fixture
+def cli(monkeypatch, tmp_path, stub_agent):
+    """Runs analyze_single against a stub model; returns its output."""
+    monkeypatch.setenv("GITHUB_TOKEN", "test-token")
+    monkeypatch.setenv("PR_STATE_DIR", str(tmp_path))
+    fetched = []
+    monkeypatch.setattr(pr_analyzer, "get_pr_data", lambda *args, **kwargs: fetched.append(1) or _pr())
+    monkeypatch.setattr(pr_analyzer, "get_shared_processor", lambda: SimpleNamespace(get_index=lambda: None))
+
+    monkeypatch.setattr(pr_analyzer, "PRAnalyzerAgent",
+                        lambda **kwargs: stub_agent(RESPONSE, **{**kwargs, "use_cache": False, "record_history": False}))
+
+    def run(capsys, **options):
+        args = {"pr_url": "https://github.com/test/repo/pull/1", "fetch_mode": None, "no_cache": True,
+                "show_timings": False, "analysis_mode": None, "max_workers": None, "no_prune": False,
+                "no_history": True, "structured": True, "min_severity": "major", "incremental": False,
+                "stream": False, **options}
+        pr_analyzer.analyze_single(Namespace(**args))
+        return capsys.readouterr().out
+
+    run.fetched = fetched
+    return run
+
+
+@pytest.mark.parametrize("options", [{}, {"stream": True}, {"incremental": True}])
+def test_min_severity_applies_on_every_path(cli, capsys, options):
+    output = cli(capsys, **options)
+
+    assert "Critical problem" in output
+    assert "Style nit" not in output
+
+
+def test_min_severity_without_structured_findings_is_refused(cli, capsys):
+    output = cli(capsys, structured=False, stream=True)
+
+    assert "--min-severity needs structured findings" in output
+    assert cli.fetched == []
@@ -0,0 +1,79 @@
+
+import utils.diff_parser as diff_parser
+from utils.diff_parser import ADDED, CONTEXT, REMOVED, file_hunks, parse_diff, parse_patch, without_hunks
+from utils.review_comments import build_review_comments
+
+PATCH = """@@ -1,3 +1,3 @@ def first():
+ context
+-old
++new
+\\ No newline at end of file
+@@ -10,2 +10,3 @@ def second():
+ kept
++added
+ tail"""
+
+
+def test_line_numbers_and_positions():
+    first, second = parse_patch(PATCH, "a.py")
+
+    assert [(line.kind, line.old_no, line.new_no, line.position) for line in first.lines] == [
+        (CONTEXT, 1, 1, 1), (REMOVED, 2, None, 2), (ADDED, None, 2, 3),
+    ]
+    # The "no newline" marker and the second hunk header both take a position
+    assert [(line.kind, line.old_no, line.new_no, line.position) for line in second.lines] == [
+        (CONTEXT, 10, 10, 6), (ADDED, None, 11, 7), (CONTEXT, 11, 12, 8),
+    ]
+    assert (second.old_start, second.old_count, second.new_start, second.new_count) == (10, 2, 10, 3)
+
+
+def test_hunk_text_round_trips():
+    assert "\n".join(hunk.text() for hunk in parse_patch(PATCH.replace("\\ No newline at end of file\n", ""), "a.py")) \
+        == PATCH.replace("\\ No newline at end of file\n", "")
+
+
+def test_parse_diff_reads_changes_and_git_headers():
+    changes = f"File: a.py\nChanges: {PATCH}\nFile: b.py\nChanges: None"
+    git_diff = f"diff --git a/c.py b/c.py\nindex 1..2 100644\n--- a/c.py\n+++ b/c.py\n{PATCH}"
+
+    assert [hunk.file for hunk in parse_diff(changes)] == ["a.py", "a.py"]
+    assert [hunk.file for hunk in parse_diff(git_diff)] == ["c.py", "c.py"]
+
+
+def test_file_hunks_are_shared_by_copies_until_the_patch_changes():
+    file = {"filename": "a.py", "patch": PATCH}
+    hunks = file_hunks(file)
+
+    assert file_hunks(file) is hunks
+    assert file_hunks({**file, "status": "modified"}) is hunks
+    assert file_hunks({**file, "patch": PATCH.split("\n@@ -10")[0]}) is not hunks
+    assert "_hunks" not in without_hunks({"files": [file]})["files"][0]
+    assert "_hunks" in file
+
+
+def test_one_analysis_parses_each_patch_once(monkeypatch, stub_agent):
+    parsed = []
+    parse = diff_parser._parse
+    monkeypatch.setattr(diff_parser, "_parse", lambda lines, file="": parsed.append(file) or parse(lines, file))
+    files = [{"filename": f"src/file_{index}.py", "status": "modified", "additions": 2, "deletions": 1,
+              "patch": PATCH.replace("new", f"new_{index}").replace("added", f"added_{index}")}
+             for index in range(3)]
+    pr_data = {"title": "t", "description": "", "files_changed": [f["filename"] for f in files], "files": files,
+               "commits": [], "repo": "test/repo", "number": 1, "head_sha": "a"}
+    review = "### File: src/file_0.py\n- `src/file_0.py:11` needs a docstring"
+    agent = stub_agent(review)
+
+    result = agent.analyze_pr(pr_data)
+    comments, _ = build_review_comments(result["analysis"], pr_data["files"])
+
+    assert sorted(parsed) == sorted(file["filename"] for file in files)
+    assert [(comment["path"], comment["position"]) for comment in comments] == [("src/file_0.py", 7)]
+
+
+def test_full_diff_hunks_carry_quoted_and_renamed_paths():
+    diff = ('diff --git "a/caf\\303\\251.py" "b/caf\\303\\251.py"\n--- "a/caf\\303\\251.py"\n+++ "b/caf\\303\\251.py"\n'
+            "@@ -1 +1 @@\n-x\n+y\n"
+            "diff --git a/old b/x.py b/new b/x.py\nrename from old b/x.py\nrename to new b/x.py\n"
+            "@@ -1 +1 @@\n-a\n+b\n")
+
+    assert [hunk.file for hunk in parse_diff(diff)] == ["café.py", "new b/x.py"]
@@ -0,0 +1,23 @@
+from utils.diff_pruning import DiffPruner
+
+
+def _file(filename, patch):
+    return {"filename": filename, "status": "modified", "additions": 1, "deletions": 0, "patch": patch}
+
+
+def test_included_file_without_patch_is_dropped_not_crashed():
+    pruner = DiffPruner(include_globs=("*.png",), drop_file_bytes=0, max_file_bytes=10)
+    pr_data = {"files": [_file("logo.png", None), _file("app.py", "@@ -1 +1 @@\n-a\n+b")], "changes": ""}
+
+    pruned = pruner.prune(pr_data)
+
+    assert [file["filename"] for file in pruned["files"]] == ["app.py"]
+    assert pruned["pruned"][0]["filename"] == "logo.png"
+    assert pruned["pruned"][0]["reason"] == "binary or no textual diff"
+
+
+def test_include_globs_override_exclude_globs():
+    pruner = DiffPruner(include_globs=("yarn.lock",), drop_file_bytes=0, max_file_bytes=0)
+    pr_data = {"files": [_file("yarn.lock", "@@ -1 +1 @@\n-a\n+b")], "changes": ""}
+
+    assert [file["filename"] for file in pruner.prune(pr_data)["files"]] == ["yarn.lock"]
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from utils.findings import FindingsError, parse_findings, repair_prompt
+from utils.llm_cache import MemoryResponseCache
+
+VALID = {"summary": "Looks fine", "findings": [
+    {"file": "src/app.py", "start_line": 12, "end_line": 10, "severity": "Major", "rule": "Naming",
+     "message": "Unclear name", "suggestion": "Rename it"},
+]}
+
+
+def test_parse_tolerates_fences_surrounding_text_and_trailing_commas():
+    text = "Here is the review:\n```json\n" + json.dumps(VALID)[:-2] + ",]}\n```"
+
+    report = parse_findings(text)
+
+    assert report["summary"] == "Looks fine"
+    assert report["findings"] == [{
+        "file": "src/app.py", "start_line": 10, "end_line": 12, "severity": "major",
+        "rule": "Naming", "message": "Unclear name", "suggestion": "Rename it",
+    }]
+
+
+def test_parse_coerces_lines_and_unknown_severities():
+    finding = parse_findings(json.dumps({"findings": [
+        {"file": " `a.py` ", "start_line": "7", "end_line": None, "severity": "blocker", "message": "m"},
+    ]}))["findings"][0]
+
+    assert (finding["file"], finding["start_line"], finding["end_line"], finding["severity"]) == ("a.py", 7, 7, "minor")
+
+
+@pytest.mark.parametrize("text", [
+    "not json at all",
+    json.dumps({"summary": "no findings list"}),
+    json.dumps({"findings": [{"file": "a.py"}]}),
+    json.dumps({"findings": ["a.py:1 is wrong"]}),
+])
+def test_parse_rejects_responses_outside_the_schema(text):
+    with pytest.raises(FindingsError):
+        parse_findings(text)
+
+
+def test_repair_prompt_quotes_the_error_and_a_bounded_response():
+    error = FindingsError("it is not valid JSON")
+
+    prompt = repair_prompt("x" * 50_000, error)
+
+    assert "it is not valid JSON" in prompt
+    assert len(prompt) < 15_000
+
+
+def test_malformed_response_is_repaired_once(stub_agent):
+    agent = stub_agent(["Sorry, here you go: {summary: oops}", json.dumps(VALID)], structured=True)
+
+    report, _ = agent._structured_complete("review this")
+
+    prompts = agent.client.chat.completions.prompts
+    assert len(prompts) == 2
+    assert "{summary: oops}" in prompts[1] and "review this" not in prompts[1]
+    assert report["findings"][0]["file"] == "src/app.py"
+
+
+def test_response_still_malformed_after_repair_is_kept_as_summary(stub_agent):
+    agent = stub_agent(["first try", "second try"], structured=True)
+
+    report, _ = agent._structured_complete("review this")
+
+    assert report["summary"] == "first try"
+    assert report["findings"] == []
+    assert "error" in report
+
+
+def test_only_parsed_json_is_cached(stub_agent):
+    agent = stub_agent(["{summary: oops}", "still not json", "{summary: oops}", json.dumps(VALID)], structured=True,
+                       use_cache=True, response_cache=MemoryResponseCache())
+
+    # Nothing usable came back, so nothing is cached
+    report, _ = agent._structured_complete("review this")
+    assert "error" in report
+    # The repaired JSON is cached under the original prompt and replayed without a repair
+    agent._structured_complete("review this")
+    report, cached = agent._structured_complete("review this")
+
+    assert len(agent.client.chat.completions.prompts) == 4
+    assert cached
+    assert report["findings"][0]["file"] == "src/app.py"
@@ -0,0 +1,89 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from utils.diff_parser import file_hunks, without_hunks
+from utils.history import AnalysisHistoryStore
+
+
+class RecordingHistory:
+    def __init__(self):
+        self.runs = []
+
+    def record_run(self, pr_data, prompt, response, cached, **kwargs):
+        self.runs.append({"cached": cached, **kwargs})
+
+
+@pytest.fixture
+def make(stub_agent):
+    def make(usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20), **kwargs):
+        history = RecordingHistory()
+        agent = stub_agent("### File: src/file_0.py\nLooks fine", usage=usage, history=history, record_history=True,
+                           prune=False, dedupe=False, **kwargs)
+        return agent, history
+
+    return make
+
+
+def _pr(files=1):
+    files = [{"filename": f"src/file_{index}.py", "status": "modified", "additions": 1, "deletions": 0,
+              "patch": f"@@ -1 +1,2 @@\n x\n+value_{index} = {'x' * 400}"} for index in range(files)]
+    return {"title": "t", "description": "", "files_changed": [f["filename"] for f in files], "files": files,
+            "changes": "", "commits": [], "repo": "test/repo", "number": 1, "head_sha": "abc"}
+
+
+def test_history_records_the_reported_usage(make):
+    agent, history = make()
+
+    agent.analyze_pr(_pr())
+
+    assert (history.runs[0]["prompt_tokens"], history.runs[0]["completion_tokens"]) == (100, 20)
+
+
+def test_usage_of_every_completion_in_a_run_is_summed(make):
+    agent, history = make(mode="map_reduce", chunk_tokens=50, max_workers=3)
+
+    result = agent.analyze_pr(_pr(files=3))
+
+    # Three chunk reviews and the reduce call
+    assert result["chunks"] == 3
+    assert (history.runs[0]["prompt_tokens"], history.runs[0]["completion_tokens"]) == (400, 80)
+    # Runs don't share counts
+    agent.analyze_pr(_pr(files=3))
+    assert history.runs[1]["prompt_tokens"] == 400
+
+
+def test_streamed_runs_record_the_final_usage_chunk(make):
+    agent, history = make()
+
+    stream = agent.stream_analysis(_pr())
+    assert "".join(stream)
+
+    assert (history.runs[0]["prompt_tokens"], history.runs[0]["completion_tokens"]) == (100, 20)
+
+
+def test_unreported_usage_is_recorded_as_unknown(make):
+    agent, history = make(usage=None)
+
+    agent.analyze_pr(_pr())
+
+    assert (history.runs[0]["prompt_tokens"], history.runs[0]["completion_tokens"]) == (None, None)
+
+
+def test_snapshot_is_taken_when_the_run_is_recorded(tmp_path):
+    store = AnalysisHistoryStore(str(tmp_path / "history.db"))
+    release, batches = threading.Event(), []
+    write = store._write
+    store._write = lambda batch: (batches.append(batch), release.wait(5), write(batch))
+    pr_data = _pr()
+
+    store.record_run(pr_data, "prompt", "review", False)
+    # The caller goes on using its PR data while the write is queued
+    file_hunks(pr_data["files"][0])
+    release.set()
+
+    assert store.flush(5)
+    # The writer serialized its own copy of the files, not the entries the caller was adding hunks to
+    assert batches[0][0]["pr_data"]["files"][0] is not pr_data["files"][0]
+    assert store.get_snapshot("test/repo", 1, "abc") == without_hunks(pr_data)
@@ -0,0 +1,52 @@
+import json
+import re
+from collections import Counter
+
+import pytest
+
+from agent import FILE_SECTION_PATTERN
+from utils.findings import OUTPUT_INSTRUCTIONS
+
+FILE_PATTERN = re.compile(r"^File: (\S+)", re.MULTILINE)
+RENAMED = [f"src/module_{index}.py" for index in range(3)]
+
+
+def review_each_file(prompt: str) -> str:
+    """One finding per file named in an analysis or chunk prompt; a reduce prompt gets its reviews back."""
+    if "Partial Reviews:\n" in prompt:
+        return prompt.split("Partial Reviews:\n", 1)[1]
+    names = FILE_PATTERN.findall(prompt)
+    if OUTPUT_INSTRUCTIONS in prompt:
+        return json.dumps({"summary": "Renamed call", "findings": [
+            {"file": name, "start_line": 2, "end_line": 2, "severity": "minor", "message": "Magic number"}
+            for name in names
+        ]})
+    return "\n".join(f"### File: {name}\n- `{name}:2` Magic number" for name in names)
+
+
+def pr() -> dict:
+    files = [{"filename": name, "status": "modified", "additions": 1, "deletions": 1,
+              "patch": "@@ -1,2 +1,2 @@\n import os\n-old_call(42)\n+new_call(42)"} for name in RENAMED]
+    # Large enough to need a chunk of its own
+    files.append({"filename": "src/service.py", "status": "modified", "additions": 6, "deletions": 0,
+                  "patch": "@@ -1 +1,7 @@\n import os\n" + "".join(f"+setting_{index} = os.getenv('S{index}')\n"
+                                                                for index in range(6))})
+    return {"title": "Rename old_call", "description": "", "files_changed": [file["filename"] for file in files],
+            "files": files, "commits": []}
+
+
+@pytest.mark.parametrize("structured", [False, True])
+@pytest.mark.parametrize("mode", ["single", "map_reduce"])
+def test_a_repeated_hunk_yields_one_finding_per_file(stub_agent, mode, structured):
+    agent = stub_agent(review_each_file, mode=mode, structured=structured, chunk_tokens=40, prune=False)
+
+    result = agent.analyze_pr(pr())
+
+    if structured:
+        found = Counter(finding["file"] for finding in result["findings"])
+    else:
+        found = Counter(FILE_SECTION_PATTERN.findall(result["analysis"]))
+    assert found == Counter(RENAMED + ["src/service.py"])
+    if mode == "map_reduce":
+        assert result["chunks"] == 2
+        assert result["dedup"]["hunks_removed"] == 2
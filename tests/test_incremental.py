@@ -0,0 +1,53 @@
+import re
+
+import pytest
+
+from utils.analysis_state import AnalysisStateStore
+
+FILE_PATTERN = re.compile(r"^File: (\S+)", re.MULTILINE)
+
+
+def review_each_file(prompt: str) -> str:
+    """One finding per file in a chunk prompt, plus one on a file outside the PR."""
+    review = "\n".join(f"### File: {name}\nIssue in {name}" for name in FILE_PATTERN.findall(prompt))
+    return review + "\n### File: src/caller.py\nCallers still pass the old argument"
+
+
+@pytest.fixture
+def agent(stub_agent):
+    return stub_agent(review_each_file, prune=False, dedupe=False)
+
+
+def pr(head_sha: str) -> dict:
+    files = [{"filename": f"src/file_{index}.py", "status": "modified", "additions": 1, "deletions": 0,
+              "patch": f"@@ -1 +1,2 @@\n x\n+value_{index} = {index}"} for index in range(3)]
+    return {"title": "t", "description": "", "files_changed": [f["filename"] for f in files], "files": files,
+            "commits": [], "repo": "test/repo", "number": 1, "head_sha": head_sha}
+
+
+def test_unchanged_head_reuses_findings_without_a_compare(agent, tmp_path):
+    store = AnalysisStateStore(str(tmp_path))
+    agent.analyze_pr_incremental(pr("a"), store, lambda sha: None)
+    prompts = len(agent.client.chat.completions.prompts)
+
+    def compare(sha):
+        raise AssertionError("compare called for an unchanged head")
+
+    result = agent.analyze_pr_incremental(pr("a"), store, compare)
+
+    assert result["incremental"]["reviewed_files"] == []
+    assert result["cached"]
+    assert len(agent.client.chat.completions.prompts) == prompts
+
+
+def test_findings_outside_the_pr_are_kept(agent, tmp_path):
+    store = AnalysisStateStore(str(tmp_path))
+    agent.analyze_pr_incremental(pr("a"), store, lambda sha: None)
+    assert "src/caller.py" in store.get("test/repo#1")["other_findings"]
+
+    agent.analyze_pr_incremental(pr("b"), store, lambda sha: ["src/file_1.py"])
+
+    state = store.get("test/repo#1")
+    assert state["other_findings"] == {"src/caller.py": "Callers still pass the old argument"}
+    reduce_prompt = agent.client.chat.completions.prompts[-1]
+    assert "Callers still pass the old argument" in reduce_prompt
@@ -0,0 +1,60 @@
+import time
+
+from utils.llm_cache import MemoryResponseCache, SQLiteResponseCache, TieredResponseCache
+
+
+def test_memory_entries_expire_after_the_ttl(monkeypatch):
+    cache = MemoryResponseCache(ttl_seconds=60)
+    cache.put("key", "review")
+    now = time.time()
+
+    monkeypatch.setattr(time, "time", lambda: now + 59)
+    assert cache.get("key") == "review"
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("key") is None
+
+
+def test_memory_tier_expires_with_the_disk_ttl(tmp_path, monkeypatch):
+    cache = TieredResponseCache(disk=SQLiteResponseCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60))
+    cache.put("key", "review")
+    now = time.time()
+
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("key") is None
+
+
+def test_memory_lru_evicts_the_least_recently_used():
+    cache = MemoryResponseCache(max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+
+    cache.put("c", "3")
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("1", None, "3")
+
+
+def test_disk_cache_evicts_expired_and_least_recently_used_rows(tmp_path, monkeypatch):
+    cache = SQLiteResponseCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60, max_entries=2)
+    now = time.time()
+    for offset, key in enumerate(("a", "b")):
+        monkeypatch.setattr(time, "time", lambda: now + offset)
+        cache.put(key, key.upper())
+    monkeypatch.setattr(time, "time", lambda: now + 5)
+    cache.get("a")
+
+    cache.put("c", "C")
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("A", None, "C")
+    monkeypatch.setattr(time, "time", lambda: now + 70)
+    assert cache.get("c") is None
+
+
+def test_disk_hits_are_promoted_into_memory(tmp_path):
+    disk = SQLiteResponseCache(str(tmp_path / "cache.sqlite3"))
+    disk.put("key", "review")
+    cache = TieredResponseCache(disk=disk)
+
+    assert cache.get("key") == "review"
+    assert cache.memory.get("key") == "review"
+    assert cache.stats == {"hits": 1, "misses": 0}
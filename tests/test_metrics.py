@@ -0,0 +1,60 @@
+import socket
+import urllib.request
+
+import pytest
+
+import utils.metrics as metrics_module
+from utils.metrics import Metrics, serve_metrics
+
+
+def test_counters_and_spans_render_in_the_prometheus_format():
+    metrics = Metrics()
+    metrics.increment("llm_cache", result="hit")
+    metrics.increment("llm_cache", 2, result="hit")
+    metrics.increment("prompt_tokens", 120, model="gpt-4o")
+    metrics.observe("fetch", 0.3, mode="rest")
+
+    lines = metrics.render_prometheus().splitlines()
+
+    assert "# TYPE pr_analyzer_llm_cache_total counter" in lines
+    assert 'pr_analyzer_llm_cache_total{result="hit"} 3' in lines
+    assert 'pr_analyzer_prompt_tokens_total{model="gpt-4o"} 120' in lines
+    assert "# TYPE pr_analyzer_span_seconds histogram" in lines
+    assert 'pr_analyzer_span_seconds_bucket{mode="rest",stage="fetch",le="0.25"} 0' in lines
+    assert 'pr_analyzer_span_seconds_bucket{mode="rest",stage="fetch",le="0.5"} 1' in lines
+    assert 'pr_analyzer_span_seconds_bucket{mode="rest",stage="fetch",le="+Inf"} 1' in lines
+    assert 'pr_analyzer_span_seconds_sum{mode="rest",stage="fetch"} 0.300000' in lines
+    assert 'pr_analyzer_span_seconds_count{mode="rest",stage="fetch"} 1' in lines
+
+
+def test_failed_span_is_labelled_with_an_error_status():
+    metrics = Metrics()
+
+    with pytest.raises(ValueError):
+        with metrics.span("analyze"):
+            raise ValueError("boom")
+
+    assert 'pr_analyzer_span_seconds_count{stage="analyze",status="error"} 1' in metrics.render_prometheus()
+    assert metrics.snapshot()["stages"] == {"analyze": {"count": 1, "seconds": pytest.approx(0, abs=0.1)}}
+
+
+@pytest.fixture
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_metrics_endpoint_listens_on_localhost_by_default(monkeypatch, free_port):
+    monkeypatch.delenv("PR_METRICS_HOST", raising=False)
+    monkeypatch.setattr(metrics_module, "_server", None)
+    metrics_module.metrics.increment("webhook_events", status="queued")
+
+    server = serve_metrics(free_port)
+    try:
+        assert server.server_address[0] == "127.0.0.1"
+        with urllib.request.urlopen(f"http://127.0.0.1:{free_port}/metrics") as response:
+            assert 'pr_analyzer_webhook_events_total{status="queued"}' in response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,67 @@
+import os
+import time
+
+import pytest
+import requests
+
+from fake_servers import FakeGitHub
+from synthetic import synthetic_pr
+from utils.pr_cache import PRSnapshotCache, snapshot_key
+from utils.pr_fetcher import PRFetcher
+
+REPO = "test/repo"
+
+
+@pytest.fixture
+def github():
+    with FakeGitHub() as server:
+        server.add_pr(REPO, 1, synthetic_pr(3, seed=1))
+        yield server
+
+
+def fetch(github, cache):
+    fetcher = PRFetcher("test-token", api_url=github.url, session=requests.Session())
+    return fetcher.fetch_cached("test", "repo", 1, cache)
+
+
+def test_unchanged_pr_is_revalidated_with_one_304(github, tmp_path):
+    cache = PRSnapshotCache(str(tmp_path))
+    first = fetch(github, cache)
+    requests_made = github.requests
+
+    second = fetch(github, cache)
+
+    assert (first["from_cache"], second["from_cache"]) == (False, True)
+    assert github.requests == requests_made + 1
+    assert [call["status"] for call in second["fetch_timings"]["calls"]] == [304]
+    assert cache.stats["not_modified"] == 1
+    assert second["files"] == first["files"]
+
+
+def test_new_push_is_fetched_again(github, tmp_path):
+    cache = PRSnapshotCache(str(tmp_path))
+    fetch(github, cache)
+    github.prs[(REPO, 1)]["pull"]["head"]["sha"] = "f" * 40
+
+    pr_data = fetch(github, cache)
+
+    assert not pr_data["from_cache"]
+    assert pr_data["head_sha"] == "f" * 40
+    assert cache.get_head(REPO, 1)["etag"] == f'"{"f" * 40}"'
+
+
+def test_least_recently_used_snapshots_are_evicted_over_the_size_bound(tmp_path):
+    cache = PRSnapshotCache(str(tmp_path), max_bytes=2500)
+    snapshot = {"title": "t", "description": "x" * 1000, "files": []}
+    for age, sha in enumerate(("b", "a")):
+        cache.put(snapshot_key(REPO, 1, sha), snapshot)
+        # Recency is the file's mtime; back-date them so the read below is the newest use
+        past = time.time() - 60 - age
+        os.utime(cache._path("snapshot", snapshot_key(REPO, 1, sha)), (past, past))
+    cache.get(snapshot_key(REPO, 1, "b"))
+
+    cache.put(snapshot_key(REPO, 1, "c"), snapshot)
+
+    assert cache.stats["evictions"] == 1
+    assert cache.get(snapshot_key(REPO, 1, "a")) is None
+    assert cache.get(snapshot_key(REPO, 1, "b")) is not None
@@ -0,0 +1,80 @@
+import pytest
+import requests
+
+from fake_servers import FakeGitHub
+from synthetic import synthetic_pr
+from utils.pr_fetcher import PRFetcher, split_diff_by_file
+
+REPO = "test/repo"
+
+
+@pytest.fixture
+def github():
+    with FakeGitHub() as server:
+        yield server
+
+
+def fetch(github: FakeGitHub, number: int, mode: str) -> dict:
+    fetcher = PRFetcher("test-token", api_url=github.url, session=requests.Session())
+    pr_data = fetcher.fetch("test", "repo", number, mode=mode)
+    pr_data.pop("fetch_timings")
+    return pr_data
+
+
+@pytest.mark.parametrize("files", [1, 150])
+def test_graphql_matches_rest(github, files):
+    pr = synthetic_pr(files, seed=files)
+    pr["files"][0]["patch"] = None  # a binary file
+    github.add_pr(REPO, files, pr)
+
+    assert fetch(github, files, "graphql") == fetch(github, files, "rest")
+
+
+def test_graphql_pages_files_and_commits(github):
+    github.add_pr(REPO, 1, synthetic_pr(250, commits=120))
+
+    pr_data = fetch(github, 1, "graphql")
+
+    assert len(pr_data["files"]) == 250
+    assert len(pr_data["commits"]) == 120
+
+
+def test_graphql_falls_back_to_rest_patches_when_the_diff_is_refused(github):
+    github.diff_file_limit = 10
+    github.add_pr(REPO, 1, synthetic_pr(40))
+
+    fetcher = PRFetcher("test-token", api_url=github.url, session=requests.Session())
+    pr_data = fetcher.fetch("test", "repo", 1, mode="graphql")
+
+    assert {call["status"] for call in pr_data["fetch_timings"]["calls"] if call["call"] == "diff"} == {406}
+    pr_data.pop("fetch_timings")
+    assert pr_data == fetch(github, 1, "rest")
+
+
+def test_split_diff_by_file():
+    diff = ("diff --git a/a.py b/a.py\nindex 1..2 100644\n--- a/a.py\n+++ b/a.py\n@@ -1 +1 @@\n-x\n+y\n"
+            "diff --git a/logo.png b/logo.png\nBinary files a/logo.png and b/logo.png differ\n")
+
+    assert split_diff_by_file(diff) == {"a.py": "@@ -1 +1 @@\n-x\n+y", "logo.png": None}
+
+
+def test_split_diff_by_file_handles_quoted_and_ambiguous_paths():
+    diff = (
+        # Non-ASCII, quoted with octal escapes
+        'diff --git "a/caf\\303\\251.py" "b/caf\\303\\251.py"\nindex 1..2 100644\n'
+        '--- "a/caf\\303\\251.py"\n+++ "b/caf\\303\\251.py"\n@@ -1 +1 @@\n-x\n+y\n'
+        # A path containing " b/", binary so only the header names it
+        "diff --git a/docs/a b/c.png b/docs/a b/c.png\nBinary files a/docs/a b/c.png and b/docs/a b/c.png differ\n"
+        # A rename between paths containing " b/"
+        "diff --git a/old b/x.py b/new b/x.py\nsimilarity index 90%\nrename from old b/x.py\nrename to new b/x.py\n"
+        "--- a/old b/x.py\t\n+++ b/new b/x.py\t\n@@ -1 +1 @@\n-a\n+b\n"
+        # A deleted file
+        "diff --git a/gone.py b/gone.py\ndeleted file mode 100644\n--- a/gone.py\n+++ /dev/null\n@@ -1 +0,0 @@\n-z\n"
+    )
+
+    assert split_diff_by_file(diff) == {
+        "café.py": "@@ -1 +1 @@\n-x\n+y",
+        "docs/a b/c.png": None,
+        "new b/x.py": "@@ -1 +1 @@\n-a\n+b",
+        "gone.py": "@@ -1 +0,0 @@\n-z",
+    }
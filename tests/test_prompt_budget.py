@@ -0,0 +1,41 @@
+from utils.prompt_budget import PromptBudgeter, count_tokens
+
+
+def _file(filename, *hunks):
+    return {"filename": filename, "status": "modified", "additions": 0, "deletions": 0, "patch": "\n".join(hunks)}
+
+
+def _hunk(start, prefix, lines=20):
+    added = "\n".join(f"+{prefix}_{index} = compute_{prefix}({index})" for index in range(lines))
+    return f"@@ -{start},0 +{start},{lines} @@\n{added}"
+
+
+def test_spacing_within_lines_is_collapsed_but_indentation_is_kept():
+    patch = ("@@ -1,3 +1,3 @@\n"
+             "-x  =  1\n-if ready:\n-    run()\n"
+             "+x = 1\n+if ready:\n+        run()")
+
+    changes, report = PromptBudgeter(10_000).fit([_file("src/app.py", patch)], 10_000)
+
+    assert report["whitespace_hunks_collapsed"] == 0
+    assert "-    run()\n" in changes and "+        run()" in changes
+
+    changes, report = PromptBudgeter(10_000).fit([_file("src/app.py", "@@ -1 +1 @@\n-x  =  1\n+x = 1")], 10_000)
+
+    assert report["whitespace_hunks_collapsed"] == 1
+    assert "whitespace-only changes" in changes
+
+
+def test_files_over_the_budget_are_truncated_at_a_hunk_then_left_out():
+    first, second = _hunk(1, "auth"), _hunk(40, "token")
+    files = [_file("docs/guide.md", _hunk(1, "docs")), _file("src/auth.py", first, second)]
+    # Room for the riskiest file's first hunk only
+    available = count_tokens(f"File: src/auth.py (first 1 of 2 hunks)\nChanges: {first}") + 20
+
+    changes, report = PromptBudgeter(available, context_lines=0).fit(files, available)
+
+    assert report["files_truncated"] == ["src/auth.py"]
+    assert report["files_omitted"] == ["docs/guide.md"]
+    assert changes.startswith("File: src/auth.py (first 1 of 2 hunks)")
+    assert "token_0" not in changes
+    assert changes.endswith("Not shown (over the prompt budget): docs/guide.md")
@@ -0,0 +1,172 @@
+import threading
+import time
+
+import pytest
+
+from fake_servers import FakeGitHub
+from synthetic import synthetic_pr
+from utils.clients import create_github_session
+from utils.rate_limit import BATCH, INTERACTIVE, SECONDARY_BACKOFF, GitHubRateLimitError, GitHubScheduler
+
+
+def _scheduler(*tokens):
+    sessions = {token: create_github_session(token) for token in tokens}
+    return GitHubScheduler(list(tokens), session_for_token=sessions.__getitem__)
+
+
+@pytest.fixture
+def github():
+    with FakeGitHub() as server:
+        server.add_pr("octo/repo", 1, synthetic_pr(3, seed=1))
+        yield server
+
+
+def _pull_url(github):
+    return f"{github.url}/repos/octo/repo/pulls/1"
+
+
+def test_interactive_requests_are_served_before_waiting_batch_requests():
+    scheduler = _scheduler("a")
+    scheduler.record_rate_limit("a", 0, time.time() + 3600)
+    served = []
+
+    def acquire(priority):
+        try:
+            served.append((priority, scheduler.acquire(priority, max_wait=2)))
+        except GitHubRateLimitError:
+            served.append((priority, None))
+
+    batch = threading.Thread(target=acquire, args=(BATCH,))
+    batch.start()
+    time.sleep(0.1)
+    interactive = threading.Thread(target=acquire, args=(INTERACTIVE,))
+    interactive.start()
+    time.sleep(0.1)
+
+    # Budget for exactly one request: it must go to the interactive request that queued second
+    scheduler.record_rate_limit("a", 1, time.time() + 3600)
+    interactive.join()
+    batch.join()
+
+    assert served == [(INTERACTIVE, "a"), (BATCH, None)]
+
+
+def test_batch_requests_leave_the_reserve_for_interactive_ones():
+    scheduler = _scheduler("a")
+    scheduler.record_rate_limit("a", scheduler.batch_reserve, time.time() + 3600)
+
+    with pytest.raises(GitHubRateLimitError):
+        scheduler.acquire(BATCH, max_wait=0.2)
+    assert scheduler.acquire(INTERACTIVE, max_wait=0.2) == "a"
+
+
+def test_requests_go_to_the_token_with_most_budget(github):
+    scheduler = _scheduler("a", "b")
+    github.set_remaining("a", 10)
+    github.set_remaining("b", 100)
+
+    for _ in range(3):
+        assert scheduler.request("GET", _pull_url(github)).status_code == 200
+
+    # The first request learns the budget of the token it went to; the rest go to "b"
+    assert github.tokens == ["a", "b", "b"]
+
+
+def test_exhausted_token_switches_to_another(github):
+    scheduler = _scheduler("a", "b")
+    github.set_remaining("a", 0)
+
+    response = scheduler.request("GET", _pull_url(github))
+
+    assert response.status_code == 200
+    assert github.tokens == ["a", "b"]
+    # "a" stays parked until its window resets
+    scheduler.request("GET", _pull_url(github))
+    assert github.tokens[-1] == "b"
+
+
+def test_waits_for_the_reset_window_when_every_token_is_exhausted():
+    with FakeGitHub(rate_limit=1, rate_limit_window=1) as github:
+        github.add_pr("octo/repo", 1, synthetic_pr(3, seed=1))
+        scheduler = _scheduler("a")
+
+        first = scheduler.request("GET", _pull_url(github))
+        assert first.status_code == 200
+        assert scheduler.request("GET", _pull_url(github)).status_code == 200
+
+    # The second request waited for the window instead of being refused
+    assert time.time() >= int(first.headers["X-RateLimit-Reset"])
+    assert github.tokens == ["a", "a"]
+
+
+def test_secondary_limit_backs_off_exponentially_and_retries_elsewhere(github):
+    scheduler = _scheduler("a", "b")
+    github.add_rate_limit_errors(2, status=429, token="a")
+
+    before = time.time()
+    assert scheduler.request("GET", _pull_url(github)).status_code == 200
+    assert github.tokens == ["a", "b"]
+    assert SECONDARY_BACKOFF <= scheduler._tokens[0].blocked_until - before < SECONDARY_BACKOFF + 5
+
+    # A second strike on the same token doubles the backoff
+    scheduler._tokens[0].blocked_until = 0
+    scheduler.record_rate_limit("a", 5000, time.time() + 3600)
+    scheduler.record_rate_limit("b", 1, time.time() + 3600)
+    before = time.time()
+    assert scheduler.request("GET", _pull_url(github)).status_code == 200
+    assert github.tokens[2:] == ["a", "b"]
+    assert scheduler._tokens[0].blocked_until - before >= 2 * SECONDARY_BACKOFF
+
+
+def test_secondary_403_parks_the_token_for_retry_after(github):
+    scheduler = _scheduler("a", "b")
+    github.add_rate_limit_errors(1, status=403, retry_after=30, token="a")
+
+    before = time.time()
+    assert scheduler.request("GET", _pull_url(github)).status_code == 200
+
+    assert github.tokens == ["a", "b"]
+    assert 30 <= scheduler._tokens[0].blocked_until - before < 35
+
+
+def test_secondary_403_without_retry_after_is_recognised_by_its_message(github):
+    scheduler = _scheduler("a", "b")
+    github.add_rate_limit_errors(1, status=403, token="a")
+
+    before = time.time()
+    assert scheduler.request("GET", _pull_url(github)).status_code == 200
+
+    assert github.tokens == ["a", "b"]
+    assert scheduler._tokens[0].blocked_until - before >= SECONDARY_BACKOFF
+
+
+def test_limits_are_read_from_the_environment_when_the_scheduler_is_built(monkeypatch):
+    monkeypatch.setenv("GITHUB_BATCH_RESERVE", "10")
+    monkeypatch.setenv("GITHUB_INTERACTIVE_MAX_WAIT", "5")
+
+    scheduler = GitHubScheduler(["a"])
+
+    assert (scheduler.batch_reserve, scheduler.interactive_max_wait) == (10, 5.0)
+
+
+def test_single_token_waits_out_retry_after(github):
+    scheduler = _scheduler("a")
+    github.add_rate_limit_errors(1, status=429, retry_after=1)
+
+    start = time.time()
+    response = scheduler.request("GET", _pull_url(github))
+
+    assert response.status_code == 200
+    assert github.tokens == ["a", "a"]
+    assert time.time() - start >= 1
+
+
+def test_session_leaves_rate_limits_to_the_caller(github):
+    github.add_rate_limit_errors(1, status=429, retry_after=30)
+
+    start = time.time()
+    response = create_github_session("a").get(_pull_url(github))
+
+    assert response.status_code == 429
+    assert github.tokens == ["a"]
+    assert time.time() - start < 5
@@ -0,0 +1,32 @@
+from utils.findings import index_by_basename, resolve_path
+from utils.review_comments import DiffPositionIndex, extract_findings
+
+PATCH = "@@ -1,2 +1,3 @@\n context\n+added\n context"
+
+
+def _index(*filenames):
+    return DiffPositionIndex([{"filename": name, "patch": PATCH} for name in filenames])
+
+
+def test_resolve_path_keeps_dotfiles():
+    by_basename = index_by_basename([".github/workflows/ci.yml", ".eslintrc.js", "src/app.py"])
+
+    assert resolve_path(".github/workflows/ci.yml", by_basename) == ".github/workflows/ci.yml"
+    assert resolve_path("./.eslintrc.js", by_basename) == ".eslintrc.js"
+    assert resolve_path("./src/app.py", by_basename) == "src/app.py"
+    assert resolve_path("app.py", by_basename) == "src/app.py"
+
+
+def test_locations_anchor_on_dotfiles_and_extensionless_files():
+    analysis = "\n".join([
+        "- `.github/workflows/ci.yml:2`: pin the action version",
+        "- Makefile:2-3: the target is not phony",
+        "- Note: see docs:2 for details",
+    ])
+
+    findings = extract_findings(analysis, _index(".github/workflows/ci.yml", "Makefile"))
+
+    assert [(finding["path"], finding["line"], finding["end_line"]) for finding in findings] == [
+        (".github/workflows/ci.yml", 2, None),
+        ("Makefile", 2, 3),
+    ]
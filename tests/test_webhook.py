@@ -0,0 +1,163 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from webhook import Job, JobQueue, WebhookService, serve_webhooks, sign
+
+
+def _job(sha, number=1):
+    return Job(f"https://github.com/octo/repo/pull/{number}", "octo/repo", number, sha)
+
+
+def test_pushes_within_the_debounce_window_are_coalesced():
+    queue = JobQueue(debounce=0.1)
+
+    assert [queue.put(_job(sha)) for sha in ("a", "b", "c")] == ["queued", "coalesced", "coalesced"]
+
+    job = queue.get()
+    assert (job.head_sha, job.coalesced) == ("c", 2)
+    queue.done(job, "completed")
+    assert queue.join(timeout=1)
+    assert queue.snapshot()["queued"] == 1
+
+
+def test_redeliveries_are_duplicates_unless_the_review_failed():
+    queue = JobQueue(debounce=0)
+    queue.put(_job("a"))
+    job = queue.get()
+
+    assert queue.put(_job("a")) == "duplicate"
+    queue.done(job, "failed")
+    assert queue.put(_job("a")) == "queued"
+
+
+def test_push_during_a_review_waits_for_it_and_supersedes_it():
+    queue = JobQueue(debounce=0)
+    queue.put(_job("a"))
+    running = queue.get()
+    queue.put(_job("b"))
+    assert queue.is_superseded(running)
+
+    waiting = []
+    thread = threading.Thread(target=lambda: waiting.append(queue.get()))
+    thread.start()
+    thread.join(0.2)
+    # Only one job per PR runs at a time
+    assert waiting == []
+
+    queue.done(running, "superseded")
+    thread.join(1)
+    assert waiting[0].head_sha == "b"
+
+
+def test_full_queue_rejects_new_prs_but_coalesces_queued_ones():
+    queue = JobQueue(debounce=10, max_pending=1)
+    queue.put(_job("a", number=1))
+
+    assert queue.put(_job("b", number=2)) == "rejected"
+    assert queue.put(_job("c", number=1)) == "coalesced"
+
+
+SECRET = "s3cret"
+
+
+def _deliver(service, payload, event="pull_request"):
+    body = json.dumps(payload).encode("utf-8")
+    return service.handle_event(event, body, sign(SECRET, body))
+
+
+def _payload(**pull_request):
+    pr = {"html_url": "https://github.com/octo/repo/pull/1", "number": 1, "head": {"sha": "abc123"}, **pull_request}
+    return {"action": "synchronize", "pull_request": pr, "repository": {"full_name": "octo/repo"}}
+
+
+@pytest.fixture
+def service():
+    return WebhookService(SECRET, fetch_pr=None, agent=None, submit_review=None, workers=0,
+                          queue=JobQueue(debounce=60))
+
+
+def test_valid_event_is_queued(service):
+    assert _deliver(service, _payload()) == (202, {"status": "queued"})
+
+
+@pytest.mark.parametrize("payload", [
+    {"action": "opened"},
+    {"action": "opened", "pull_request": {}, "repository": {"full_name": "octo/repo"}},
+    {k: v for k, v in _payload().items() if k != "repository"},
+    _payload(head=None),
+    _payload(head={}),
+    _payload(number="1"),
+    _payload(html_url=None),
+    ["not", "an", "object"],
+])
+def test_malformed_payload_is_rejected_with_400(service, payload):
+    status, reply = _deliver(service, payload)
+
+    assert status == 400
+    assert "error" in reply
+    assert service.queue.snapshot()["pending"] == 0
+
+
+def test_other_events_and_actions_are_ignored(service):
+    assert _deliver(service, {"action": "closed"})[0] == 202
+    assert _deliver(service, {"zen": "..."}, event="issues")[0] == 202
+
+
+FINDINGS = json.dumps({"summary": "Two issues", "findings": [
+    {"file": "src/app.py", "start_line": 1, "end_line": 1, "severity": "major", "message": "SQL built from input"},
+    {"file": "src/app.py", "start_line": 2, "end_line": 2, "severity": "minor", "message": "Unclear name"},
+]})
+
+
+def _pr(url):
+    return {"title": "t", "description": "", "files_changed": ["src/app.py"], "commits": [], "head_sha": "abc123",
+            "files": [{"filename": "src/app.py", "status": "modified", "additions": 2, "deletions": 0,
+                       "patch": "@@ -0,0 +1,2 @@\n+query(input)\n+x = 1"}]}
+
+
+def test_posted_reviews_leave_out_findings_below_min_severity(stub_agent):
+    submitted = []
+
+    def submit_review(url, pr_data, results):
+        submitted.append(results)
+        return {"success": True, "message": "posted"}
+
+    service = WebhookService(SECRET, fetch_pr=_pr, agent=stub_agent(FINDINGS, structured=True, prune=False),
+                             submit_review=submit_review, workers=1, queue=JobQueue(debounce=0),
+                             min_severity="major").start()
+    try:
+        assert _deliver(service, _payload())[0] == 202
+        assert service.queue.join(timeout=5)
+    finally:
+        service.stop()
+
+    assert [finding["severity"] for finding in submitted[0]["findings"]] == ["major"]
+    assert "Unclear name" not in submitted[0]["analysis"]
+
+
+@pytest.fixture
+def server(service):
+    httpd = serve_webhooks(service, port=0, host="127.0.0.1")
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize("content_length, status", [(None, 411), ("abc", 400), ("-1", 400)])
+def test_bad_content_length_is_rejected(server, content_length, status):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=5)
+    connection.putrequest("POST", "/")
+    connection.putheader("X-GitHub-Event", "pull_request")
+    if content_length is not None:
+        connection.putheader("Content-Length", content_length)
+    connection.endheaders()
+
+    response = connection.getresponse()
+
+    assert response.status == status
+    assert "error" in json.loads(response.read())
+    connection.close()